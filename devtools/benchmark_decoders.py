@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""Compares the decoder backends on videos
+
+For every video and backend (see videotracker.decoders), reports how fast
+frames are decoded in order, how long a seek to a random frame takes, and
+whether the frames reached by seeking are those reached by reading in order.
+Seeks are compared to the frames of the first backend.
+
+Run from the repository root:
+
+    python devtools/benchmark_decoders.py VIDEO... [--backend NAME[:threads=N]]...
+
+Backends that cannot be used (e.g. pyav without PyAV) are reported and
+skipped.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+import cv2
+
+from videotracker import decoders
+
+BACKENDS = ('opencv:threads=1', 'opencv', 'pyav:threads=1', 'pyav')
+
+def sequential(backend: str, file_name: str, frames: int) -> tuple:
+    """Frames per second reading at most frames frames in order, and the frame count"""
+    capture = decoders.open_capture(file_name, backend)
+    if not capture.isOpened():
+        raise ValueError('not readable')
+    count = 0
+    start = time.perf_counter()
+    try:
+        while count < frames and capture.grab():
+            capture.retrieve()
+            count += 1
+    finally:
+        capture.release()
+    seconds = time.perf_counter() - start
+    return (count / seconds if seconds else 0.0), count
+
+def seeks(backend: str, file_name: str, indices: list) -> tuple:
+    """Milliseconds per seek to each of indices, and the frames found"""
+    capture = decoders.open_capture(file_name, backend)
+    found = []
+    start = time.perf_counter()
+    try:
+        for index in indices:
+            capture.set(cv2.CAP_PROP_POS_FRAMES, index)
+            found.append(capture.read()[1])
+    finally:
+        capture.release()
+    return (time.perf_counter() - start) / len(indices) * 1000, found
+
+def reference(file_name: str, indices: list) -> dict:
+    """Frames at indices, read in order with the first backend"""
+    wanted = set(indices)
+    capture = decoders.open_capture(file_name, 'opencv')
+    frames = {}
+    index = 0
+    try:
+        while wanted - set(frames) and capture.grab():
+            if index in wanted:
+                frames[index] = capture.retrieve()[1]
+            index += 1
+    finally:
+        capture.release()
+    return frames
+
+def main():
+    """Runs the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('videos', nargs='+')
+    parser.add_argument('-b', '--backend', action='append', default=None,
+                        help='Backend to compare, may be repeated (default: %s)'
+                        % ', '.join(BACKENDS))
+    parser.add_argument('-n', '--frames', type=int, default=500,
+                        help='Frames read in order (default: %(default)s)')
+    parser.add_argument('-s', '--seeks', type=int, default=20,
+                        help='Random seeks (default: %(default)s)')
+    args = parser.parse_args()
+    print(f'{"video":24} {"backend":18} {"frames/s":>9} {"ms/seek":>8}  seeks exact')
+    for file_name in args.videos:
+        count = int(decoders.open_capture(file_name, 'opencv').get(cv2.CAP_PROP_FRAME_COUNT))
+        indices = random.Random(0).sample(range(max(count - 1, 1)), min(args.seeks, count - 1))
+        expected = reference(file_name, indices)
+        for backend in args.backend or BACKENDS:
+            try:
+                rate, _ = sequential(backend, file_name, args.frames)
+                latency, found = seeks(backend, file_name, indices)
+            except ValueError as error:
+                print(f'{os.path.basename(file_name)[:24]:24} {backend:18} skipped: {error}')
+                continue
+            exact = sum(frame is not None and index in expected
+                        and np.array_equal(frame, expected[index])
+                        for index, frame in zip(indices, found))
+            print(f'{os.path.basename(file_name)[:24]:24} {backend:18} {rate:9.1f} '
+                  f'{latency:8.1f}  {exact}/{len(indices)}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""Checks the import time of the headless parts of videotracker
+
+Every module is imported in a fresh interpreter, which reports how long the
+import took and whether it loaded Qt widgets. The check fails if a headless
+module loads PyQt5.QtWidgets, or if its import takes longer than its budget
+(the best of several runs, to even out noise).
+
+Run from the repository root:
+
+    python devtools/importtime.py [--scale FACTOR]
+
+--scale multiplies all budgets, for slow machines.
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+# Budgets in milliseconds. Modules doing image work load OpenCV, which takes
+# most of their budget; the others load neither OpenCV nor Qt.
+BUDGETS = {
+    'videotracker.cli': 50,
+    'videotracker.entrypoints': 50,
+    'videotracker.checkpoint': 50,
+    'videotracker.functions.params': 50,
+    'videotracker.pipeline': 250,
+    'videotracker.runner': 250,
+    'videotracker.batch': 250,
+    'videotracker.driver': 250,
+    'videotracker.results': 250,
+    'videotracker.sweep': 250,
+    'videotracker.preview': 250,
+    'videotracker.framecache': 250,
+    'videotracker.decoders': 250,
+    'videotracker.sequences': 250,
+    'videotracker.thumbnails': 250,
+}
+FORBIDDEN = ('PyQt5.QtWidgets',)
+RUNS = 3
+
+PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import {module}
+print(json.dumps({{
+    'ms': 1000 * (time.perf_counter() - start),
+    'loaded': [name for name in {forbidden!r} if name in sys.modules],
+}}))
+'''
+
+def measure(module: str) -> dict:
+    """Import time in milliseconds and forbidden modules loaded by module"""
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE.format(module=module, forbidden=FORBIDDEN)],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output)
+
+def main() -> int:
+    """Measures all modules, prints a report and returns the exit status"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='Multiply the budgets by this factor')
+    args = parser.parse_args()
+    failures = 0
+    for module, budget in BUDGETS.items():
+        results = [measure(module) for _ in range(RUNS)]
+        best = min(result['ms'] for result in results)
+        loaded = sorted({name for result in results for name in result['loaded']})
+        problems = []
+        if best > budget * args.scale:
+            problems.append(f'over budget of {budget * args.scale:.0f} ms')
+        if loaded:
+            problems.append('loads ' + ', '.join(loaded))
+        failures += bool(problems)
+        print(f'{module:32} {best:7.1f} ms  ' + ('; '.join(problems) or 'ok'))
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -19,10 +19,15 @@ setup(
     url='https://github.com/lysogeny/videotracker',
     license=LICENSE,
     packages=find_packages(exclude=('tests', 'docs')),
+    extras_require={
+        'pyav': ['av'],
+    },
     #scripts=['bin/videotracker'],
     entry_points={
         'console_scripts': [
-            'videotracker = videotracker.entrypoints:gui'
+            'videotracker = videotracker.entrypoints:gui',
+            'videotracker-batch = videotracker.entrypoints:batch',
+            'videotracker-sweep = videotracker.entrypoints:sweep',
         ]
     }
 )
@@ -0,0 +1,123 @@
+"""Background models for static cameras
+
+A background model is the per-pixel median (or mode) of frames sampled evenly
+across a video. Frames are decoded in parallel, each worker reading its own
+share of the samples with its own capture. Models are cached on disk per
+video, so that they are only built once.
+"""
+
+import concurrent.futures
+import os
+import threading
+
+import numpy as np
+
+import cv2
+
+from . import decoders, helpers
+
+METHODS = ('median', 'mode')
+
+_MODELS = {}
+_LOCKS = {}
+_LOCK = threading.Lock()
+
+def sample_indices(frames: int, samples: int) -> list:
+    """Indices of samples frames spread evenly across frames frames"""
+    samples = max(1, min(samples, frames))
+    return sorted(set(np.linspace(0, frames - 1, samples).astype(int).tolist()))
+
+def read_frames(file_name: str, indices: list) -> list:
+    """Reads the frames at indices from file_name as 8 bit grayscale images"""
+    # Imported here, as the operations use background models.
+    from .functions.ops import to_8bit
+    capture = decoders.open_capture(file_name)
+    frames = []
+    try:
+        for index in indices:
+            capture.set(cv2.CAP_PROP_POS_FRAMES, index)
+            exists, frame = capture.read()
+            if exists:
+                if frame.ndim == 3:
+                    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                # Models are 8 bit, as the images they are compared to.
+                frames.append(to_8bit(frame))
+    finally:
+        capture.release()
+    return frames
+
+def mode(stack: np.ndarray) -> np.ndarray:
+    """Per-pixel mode along the first axis of stack
+
+    Ties are resolved towards the smaller value.
+    """
+    stack = np.sort(stack, axis=0)
+    best = stack[0].copy()
+    best_count = np.ones(best.shape, np.int32)
+    run = np.ones(best.shape, np.int32)
+    for previous, current in zip(stack[:-1], stack[1:]):
+        run = np.where(current == previous, run + 1, 1)
+        better = run > best_count
+        best[better] = current[better]
+        best_count[better] = run[better]
+    return best
+
+def reduce(stack: np.ndarray, method: str) -> np.ndarray:
+    """Reduces a stack of frames to a single uint8 frame with method"""
+    if method == 'median':
+        return np.median(stack, axis=0).astype(np.uint8)
+    if method == 'mode':
+        return mode(stack)
+    raise ValueError('Unknown background method: `%s`' % method)
+
+def build_model(file_name: str, samples: int = 25, method: str = 'median',
+                workers: int = None) -> np.ndarray:
+    """Builds a grayscale background model of a video
+
+    samples frames spread evenly across the video are decoded by workers
+    threads. The reduction to the model runs in parallel over bands of rows.
+    """
+    workers = workers or min(8, os.cpu_count() or 1)
+    indices = sample_indices(helpers.video_max_frame(file_name) + 1, samples)
+    shares = [share for share in np.array_split(indices, workers) if len(share)]
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        parts = executor.map(read_frames, [file_name] * len(shares),
+                             [share.tolist() for share in shares])
+        frames = [frame for part in parts for frame in part]
+        if not frames:
+            raise ValueError('No frames could be read from `%s`' % file_name)
+        stack = np.stack(frames)
+        bands = np.array_split(np.arange(stack.shape[1]), workers)
+        reduced = executor.map(lambda band: reduce(stack[:, band[0]:band[-1]+1], method),
+                               [band for band in bands if len(band)])
+        return np.concatenate(list(reduced), axis=0)
+
+def model_file(file_name: str, samples: int, method: str) -> str:
+    """File in which the background model of a video is cached"""
+    key = helpers.file_key(file_name, samples, method)
+    return helpers.cache_path('background', key + '.npy')
+
+def get_model(file_name: str, samples: int = 25, method: str = 'median') -> np.ndarray:
+    """Background model of a video, from memory, the disk cache or built anew
+
+    Models are identified by helpers.file_key, so that a video that changed
+    gets a new model. A model that is being built by another thread is
+    waited for; other models are not.
+    """
+    key = helpers.file_key(file_name, samples, method)
+    with _LOCK:
+        lock = _LOCKS.setdefault(key, threading.Lock())
+    with lock:
+        if key not in _MODELS:
+            cached = model_file(file_name, samples, method)
+            if os.path.exists(cached):
+                model = np.load(cached)
+            else:
+                model = build_model(file_name, samples, method)
+                # Written under a temporary name first, so that an interrupted
+                # write never leaves a broken model behind.
+                with open(cached + '.part', 'wb') as handle:
+                    np.save(handle, model)
+                os.replace(cached + '.part', cached)
+            _MODELS[key] = model
+        return _MODELS[key]
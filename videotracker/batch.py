@@ -0,0 +1,254 @@
+"""Batch processing of many input files
+
+A batch runs one stack description (see pipeline) over many input files in a
+pool of worker processes. The state of every job is kept in a JobQueue on disk,
+so that an interrupted batch resumes where it stopped: finished files are not
+processed again, and files that were being processed continue from their last
+checkpoint (see checkpoint).
+
+Worker processes report their metrics (see metrics) to the batch, which
+collects them labelled by worker.
+"""
+
+import concurrent.futures
+import glob
+import json
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+from queue import Empty
+
+from . import metrics, results, runner, store
+
+STATES = ('pending', 'running', 'done', 'failed')
+
+class JobQueue:
+    """Jobs of a batch, persisted in a JSON file
+
+    A job is a dictionary with the input file, its output files, its state
+    (one of STATES) and, once finished, its statistics or error. Every change
+    is written to disk straight away. Jobs that were running when a batch was
+    interrupted are pending again when the queue is loaded.
+    """
+
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+        self.jobs = {}
+        if os.path.exists(file_name):
+            with open(file_name) as handle:
+                self.jobs = {job['input']: job for job in json.load(handle)['jobs']}
+        for job in self.jobs.values():
+            if job['state'] == 'running':
+                job['state'] = 'pending'
+
+    def save(self):
+        """Writes the queue to disk
+
+        The queue is written to a temporary file first, so that an interruption
+        never leaves a broken queue behind.
+        """
+        with open(self.file_name + '.part', 'w') as handle:
+            json.dump({'jobs': list(self.jobs.values())}, handle, indent=1)
+        os.replace(self.file_name + '.part', self.file_name)
+        for state, count in self.counts().items():
+            metrics.collector().set('jobs', count, state=state)
+
+    def add(self, in_file: str, csv_file: str, store_file: str = None,
+            checkpoint_file: str = None):
+        """Adds a pending job for in_file, unless it is already queued"""
+        in_file = os.path.abspath(in_file)
+        if in_file not in self.jobs:
+            self.jobs[in_file] = {
+                'input': in_file,
+                'csv': csv_file,
+                'contours': store_file,
+                'checkpoint': checkpoint_file,
+                'state': 'pending',
+            }
+
+    def update(self, in_file: str, **changes):
+        """Changes the job of in_file and saves the queue"""
+        self.jobs[in_file].update(changes)
+        self.save()
+
+    def retry(self):
+        """Makes failed jobs pending again"""
+        for job in self.jobs.values():
+            if job['state'] == 'failed':
+                job['state'] = 'pending'
+
+    def pending(self) -> list:
+        """Jobs that still need to be run"""
+        return [job for job in self.jobs.values() if job['state'] == 'pending']
+
+    def counts(self) -> dict:
+        """Number of jobs in every state"""
+        return {state: sum(job['state'] == state for job in self.jobs.values())
+                for state in STATES}
+
+def expand(patterns) -> list:
+    """Input files matching a list of file names or glob patterns"""
+    files = []
+    for pattern in patterns:
+        for file_name in sorted(glob.glob(pattern)) or [pattern]:
+            if file_name not in files:
+                files.append(file_name)
+    return files
+
+def output_files(in_file: str, output_dir: str = None) -> tuple:
+    """CSV file, contour store and checkpoint file for in_file
+
+    Outputs are named as in the GUI.
+    """
+    base = os.path.splitext(os.path.normpath(in_file))[0]
+    if output_dir is not None:
+        base = os.path.join(output_dir, os.path.basename(base))
+    return f'{base}_output.csv', f'{base}_contours', f'{base}_checkpoint'
+
+def size_limits(description: dict) -> tuple:
+    """Minimum and maximum area of the size filter of description
+
+    Without a size filter, all areas pass.
+    """
+    for method, operation in description['methods'].items():
+        if operation == 'SizeFilter':
+            values = description['values'].get(method, {})
+            return values.get('minimum', 0), values.get('maximum', float('inf'))
+    return 0, float('inf')
+
+def export_stores(inputs, description: dict, output_dir: str = None) -> dict:
+    """Writes the CSV files of inputs again from their contour stores
+
+    Stores are those of earlier runs (see output_files); contours are
+    filtered again with the size filter of description, without running the
+    segmentation. Returns the number of inputs exported and failed.
+    """
+    minimum, maximum = size_limits(description)
+    counts = {'exported': 0, 'failed': 0}
+    for in_file in expand(inputs):
+        csv_file, store_file, _ = output_files(in_file, output_dir)
+        try:
+            with store.ContourStore(store_file) as contours:
+                rows = contours.export_csv(csv_file, minimum, maximum)
+        except FileNotFoundError:
+            print(f'{in_file}: no contour store at {store_file}')
+            counts['failed'] += 1
+            continue
+        except OSError as error:
+            print(f'{in_file}: {error}')
+            counts['failed'] += 1
+            continue
+        print(f'{in_file}: wrote {rows} rows to {csv_file}')
+        counts['exported'] += 1
+    return counts
+
+_REPORTER = None # Reporter of the metrics of a worker process
+_STARTED = None # Queue of the inputs of the jobs workers started
+
+def init_worker(reports, interval: float, started=None):
+    """Starts reporting the metrics of a worker process to the reports queue
+
+    Workers put the input of every job they start into the started queue.
+    """
+    global _REPORTER, _STARTED # pylint: disable=global-statement
+    _STARTED = started
+    metrics.reset()
+    _REPORTER = metrics.Reporter(lambda worker, samples: reports.put((worker, samples)),
+                                 interval)
+    _REPORTER.start()
+
+def collect(reports):
+    """Merges the metrics reported by workers into the collector, until None"""
+    for report in iter(reports.get, None):
+        metrics.collector().merge(*report)
+
+def process(job: dict, description: dict, cache_size: int = None, first: int = 1,
+            last: int = None) -> dict:
+    """Runs a single job, returning the statistics of the run
+
+    With cache_size (in bytes), results are cached (see results), and only
+    frames first to last may be run.
+    """
+    start = time.monotonic()
+    if _STARTED is not None:
+        _STARTED.put(job['input'])
+    cache = results.ResultsCache(cache_size) if cache_size else None
+    try:
+        stats = runner.run(job['input'], description, job['csv'], job['contours'],
+                           job.get('checkpoint'), cache=cache, start=first, stop=last)
+    finally:
+        if _REPORTER is not None:
+            _REPORTER.report()
+    stats['seconds'] = round(time.monotonic() - start, 3)
+    return stats
+
+def mark_started(queue: JobQueue, started):
+    """Marks the jobs that workers reported as started (see init_worker) running
+
+    Reports of jobs that finished meanwhile are ignored.
+    """
+    while True:
+        try:
+            in_file = started.get_nowait()
+        except Empty:
+            return
+        if queue.jobs[in_file]['state'] == 'pending':
+            queue.update(in_file, state='running')
+
+def run_batch(inputs, description: dict, queue_file: str, workers: int = None,
+              output_dir: str = None, contours: bool = True, retry: bool = False,
+              cache_size: int = None, report_interval: float = 5.0, start: int = 1,
+              stop: int = None) -> dict:
+    """Runs description over inputs (file names or glob patterns)
+
+    At most workers files are processed at once (by default one per CPU).
+    Job states are kept in queue_file. Running the same batch again only
+    processes files that did not finish; with retry, failed files are
+    processed again as well. With cache_size (in bytes), results are cached
+    and taken from the cache, and only frames start to stop (numbered from
+    1, stop included) may be run. Workers report their metrics every
+    report_interval seconds. Returns the number of jobs in every state.
+    """
+    queue = JobQueue(queue_file)
+    for in_file in expand(inputs):
+        csv_file, store_file, checkpoint_file = output_files(in_file, output_dir)
+        queue.add(in_file, csv_file, store_file if contours else None, checkpoint_file)
+    if retry:
+        queue.retry()
+    queue.save()
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+    reports = multiprocessing.Queue()
+    started = multiprocessing.Queue()
+    collector = threading.Thread(target=collect, args=(reports,), name='MetricsCollectorThread',
+                                 daemon=True)
+    collector.start()
+    with concurrent.futures.ProcessPoolExecutor(workers, initializer=init_worker,
+                                                initargs=(reports, report_interval,
+                                                          started)) as pool:
+        futures = {}
+        for job in queue.pending():
+            futures[pool.submit(process, job, description, cache_size, start, stop)] = (
+                job['input'])
+        # Jobs stay pending until a worker starts them.
+        waiting = set(futures)
+        while waiting:
+            finished, waiting = concurrent.futures.wait(
+                waiting, timeout=1, return_when=concurrent.futures.FIRST_COMPLETED)
+            mark_started(queue, started)
+            for future in finished:
+                in_file = futures[future]
+                try:
+                    stats = future.result()
+                except Exception: # pylint: disable=broad-except
+                    # Any error fails only this job, not the batch.
+                    queue.update(in_file, state='failed', error=traceback.format_exc())
+                    print(f'Failed: {in_file}')
+                else:
+                    queue.update(in_file, state='done', stats=stats)
+                    print(f'Done: {in_file} ({stats["frames"]} frames)')
+    reports.put(None)
+    collector.join()
+    return queue.counts()
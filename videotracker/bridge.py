@@ -0,0 +1,62 @@
+"""Qt side of the asynchronous driver
+
+A DriverThread runs a driver.Driver in an asyncio event loop of its own,
+inside a QThread, and reports back to the Qt event loop with signals. The Qt
+event loop never waits for the asyncio loop, and the asyncio loop never waits
+for the GUI: results are handed over as queued signals.
+"""
+
+import asyncio
+import time
+
+from PyQt5 import QtCore
+
+from . import driver, metrics
+
+class DriverThread(QtCore.QThread):
+    """Runs a Driver in its own thread and event loop
+
+    result is emitted with a dictionary holding frame, timestamp, image and
+    data of a processed frame, at most rate times per second (frames in
+    between are dropped, so that the GUI does not fall behind) and for the
+    last frame. done is emitted with the driver's statistics after the run,
+    failed with the exception if it failed.
+    """
+    result = QtCore.pyqtSignal(dict)
+    done = QtCore.pyqtSignal(dict)
+    failed = QtCore.pyqtSignal(object)
+
+    def __init__(self, run_driver: driver.Driver, *args, rate: float = 30, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.driver = run_driver
+        self.driver.sinks.append(driver.CallbackSink(self.emit_result))
+        self.interval = 1 / rate
+        self.last = None
+        self.emitted = 0.0
+
+    def emit_result(self, frame: int, timestamp: float, image, data: list):
+        """Emits a result signal, unless one was emitted very recently"""
+        self.last = {'frame': frame, 'timestamp': timestamp, 'image': image, 'data': data}
+        if time.monotonic() - self.emitted >= self.interval:
+            self.emitted = time.monotonic()
+            self.result.emit(self.last)
+            self.last = None
+        else:
+            metrics.collector().inc('dropped_frames', reason='display')
+
+    def stop(self):
+        """Stops the run and waits for the thread"""
+        self.driver.stop()
+        self.wait()
+
+    def run(self):
+        """Runs the driver's event loop"""
+        try:
+            stats = asyncio.run(self.driver.run())
+        except Exception as error: # pylint: disable=broad-except
+            # Exceptions are handed to the GUI thread.
+            self.failed.emit(error)
+        else:
+            if self.last is not None:
+                self.result.emit(self.last)
+            self.done.emit(stats)
@@ -0,0 +1,53 @@
+"""Checkpoints of runs
+
+A checkpoint records how far a run over a video got: the last frame whose
+results are on disk, the sizes of the output files at that point and the state
+that later frames depend on (stateful operations, the motion gate). A run that
+is restarted with the same input, description and outputs continues from its
+checkpoint instead of starting over.
+"""
+
+import json
+import os
+import pickle
+
+from . import helpers
+
+def run_key(in_file: str, description: dict, *outputs) -> str:
+    """Key of a run of description over in_file writing to outputs"""
+    return helpers.file_key(in_file, json.dumps(description, sort_keys=True), *outputs)
+
+class Checkpoint:
+    """A checkpoint file, valid for one combination of input and settings
+
+    key identifies the combination (see `run_key`). `load` ignores checkpoints
+    written for another key, so a run with changed settings starts over.
+    """
+
+    def __init__(self, file_name: str, key: str):
+        self.file_name = file_name
+        self.key = key
+
+    def load(self) -> dict:
+        """The saved state, or None without a valid checkpoint"""
+        try:
+            with open(self.file_name, 'rb') as handle:
+                state = pickle.load(handle)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if state.get('key') != self.key:
+            return None
+        return state
+
+    def save(self, **state):
+        """Saves state, replacing the previous checkpoint in one step"""
+        with open(self.file_name + '.part', 'wb') as handle:
+            pickle.dump(dict(state, key=self.key), handle)
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(self.file_name + '.part', self.file_name)
+
+    def remove(self):
+        """Removes the checkpoint, once the run is complete"""
+        if os.path.exists(self.file_name):
+            os.remove(self.file_name)
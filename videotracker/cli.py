@@ -1,11 +1,14 @@
-"""CLI interface"""
+"""CLI interface
+
+Qt is imported by the functions that need it, so that the batch and sweep
+entrypoints do not load it.
+"""
 
 import argparse
+import json
 import signal
 import traceback
 
-from PyQt5 import QtCore, QtWidgets
-
 # Pylint may not like this, but this is the way I define my parser.
 # Subclassing is not a good idea.
 # pylint: disable=invalid-name
@@ -22,9 +25,154 @@ parser.add_argument('-o', '--output',
 parser.add_argument('-m', '--module',
                     nargs='?', default=None,
                     help='Loads a specific module')
+parser.add_argument('-s', '--spec',
+                    nargs='?', default=None,
+                    help='Loads a stack specification')
+parser.add_argument('--store-contours',
+                    action='store_true',
+                    help='Store the contours of runs next to the input, to export them again '
+                    'with videotracker-batch --from-store')
+parser.add_argument('--decoder',
+                    default=None, metavar='NAME[:threads=N]',
+                    help='Decoder backend: opencv or pyav, optionally with a number of '
+                    'decoding threads (default: $VIDEOTRACKER_DECODER, or opencv)')
+parser.add_argument('--frame-cache',
+                    nargs='?', default=None, const=':', metavar='START:STOP',
+                    help='Decode the video (or frames START to STOP) once into a frame cache '
+                    'and read frames from it')
+parser.add_argument('--gray-cache',
+                    action='store_true',
+                    help='Keep the frame cache in grayscale')
+parser.add_argument('--metrics-port',
+                    type=int, default=None, metavar='PORT',
+                    help='Serve live metrics for Prometheus at http://localhost:PORT/metrics')
+parser.add_argument('--metrics-file',
+                    default=None,
+                    help='Append live metrics to a JSON lines file')
+parser.add_argument('--metrics-interval',
+                    type=float, default=10.0, metavar='SECONDS',
+                    help='Seconds between lines of the metrics file (default: %(default)s)')
+
+batch_parser = argparse.ArgumentParser(
+    description='Run a module over many videos without the GUI')
+batch_parser.add_argument('inputs',
+                          nargs='+',
+                          help='Videos to process (file names or glob patterns)')
+batch_parser.add_argument('-m', '--module',
+                          default='ThresholdStack',
+                          help='Module to run (default: %(default)s)')
+batch_parser.add_argument('-c', '--config',
+                          default=None,
+                          help='JSON file with the options of the module')
+batch_parser.add_argument('-s', '--spec',
+                          default=None,
+                          help='Stack specification saved from the GUI, instead of '
+                          '--module and --config')
+batch_parser.add_argument('-q', '--queue',
+                          default='videotracker-queue.json',
+                          help='Job queue file, used to resume a batch (default: %(default)s)')
+batch_parser.add_argument('-j', '--jobs',
+                          type=int, default=None,
+                          help='Number of videos processed at once (default: one per CPU)')
+batch_parser.add_argument('-o', '--output-dir',
+                          default=None,
+                          help='Directory for outputs (default: next to the videos)')
+batch_parser.add_argument('--no-contours',
+                          action='store_true',
+                          help='Do not write contour stores')
+batch_parser.add_argument('--from-store',
+                          action='store_true',
+                          help='Export the CSV files again from the contour stores of earlier '
+                          'runs, with the size filter of the module, instead of running it')
+batch_parser.add_argument('--cache',
+                          type=int, default=None, metavar='MB',
+                          help='Cache results, keeping at most MB megabytes')
+batch_parser.add_argument('--start',
+                          type=int, default=1, metavar='FRAME',
+                          help='First frame to run, counting from 1 (needs --cache)')
+batch_parser.add_argument('--stop',
+                          type=int, default=None, metavar='FRAME',
+                          help='Last frame to run (needs --cache; default: the last frame)')
+batch_parser.add_argument('--retry',
+                          action='store_true',
+                          help='Process failed videos again')
+batch_parser.add_argument('--decoder',
+                          default=None, metavar='NAME[:threads=N]',
+                          help='Decoder backend: opencv or pyav, optionally with a number of '
+                          'decoding threads (default: $VIDEOTRACKER_DECODER, or opencv)')
+batch_parser.add_argument('--metrics-port',
+                          type=int, default=None, metavar='PORT',
+                          help='Serve live metrics for Prometheus at '
+                          'http://localhost:PORT/metrics')
+batch_parser.add_argument('--metrics-file',
+                          default=None,
+                          help='Append live metrics to a JSON lines file')
+batch_parser.add_argument('--metrics-interval',
+                          type=float, default=10.0, metavar='SECONDS',
+                          help='Seconds between lines of the metrics file, and between '
+                          'reports of workers (default: %(default)s)')
+
+sweep_parser = argparse.ArgumentParser(
+    description='Run a module with every combination of parameter values on sampled frames')
+sweep_parser.add_argument('input',
+                          help='Video to sample frames from')
+sweep_parser.add_argument('-m', '--module',
+                          default='ThresholdStack',
+                          help='Module to run (default: %(default)s)')
+sweep_parser.add_argument('-c', '--config',
+                          default=None,
+                          help='JSON file with the options of the module')
+sweep_parser.add_argument('-s', '--spec',
+                          default=None,
+                          help='Stack specification saved from the GUI, instead of '
+                          '--module and --config')
+sweep_parser.add_argument('-p', '--param',
+                          action='append', default=[], metavar='METHOD.PARAM=V1,V2,...',
+                          help='Values of a parameter to sweep, may be repeated')
+sweep_parser.add_argument('-g', '--grid',
+                          default=None,
+                          help='JSON file mapping methods to parameters to lists of values')
+sweep_parser.add_argument('-n', '--samples',
+                          type=int, default=10,
+                          help='Number of frames sampled (default: %(default)s)')
+sweep_parser.add_argument('-j', '--jobs',
+                          type=int, default=None,
+                          help='Number of frames evaluated at once')
+sweep_parser.add_argument('--decoder',
+                          default=None, metavar='NAME[:threads=N]',
+                          help='Decoder backend: opencv or pyav, optionally with a number of '
+                          'decoding threads (default: $VIDEOTRACKER_DECODER, or opencv)')
+sweep_parser.add_argument('--frame-cache',
+                          nargs='?', default=None, const=':', metavar='START:STOP',
+                          help='Decode the video (or frames START to STOP) once into a frame cache '
+                          'and read frames from it')
+sweep_parser.add_argument('--gray-cache',
+                          action='store_true',
+                          help='Keep the frame cache in grayscale')
+sweep_parser.add_argument('-o', '--csv',
+                          default=None,
+                          help='Also write the table to a CSV file')
+
+def parse_param(text: str) -> tuple:
+    """Parses METHOD.PARAM=V1,V2,... into (method, param, values)
+
+    Values are read as JSON where possible, so numbers become numbers.
+    """
+    name, _, values = text.partition('=')
+    method, _, param = name.partition('.')
+    if not (method and param and values):
+        raise argparse.ArgumentTypeError('Expected METHOD.PARAM=V1,V2,..., got `%s`' % text)
+    parsed = []
+    for value in values.split(','):
+        try:
+            parsed.append(json.loads(value))
+        except ValueError:
+            parsed.append(value)
+    return method, param, parsed
 
 def pop_exception(*args, **kwargs):
     """Exception will pop up on screen and printed to stdout"""
+    from PyQt5 import QtWidgets
     exception = traceback.format_exception(*args, **kwargs)
     errorbox = QtWidgets.QMessageBox()
     errorbox.setText("An unexpected error occured:\n{0}".format(''.join(exception)))
@@ -42,6 +190,7 @@ def _interrupt_handler(signum, frame):
     """Handle KeyboardInterrupt: quit application."""
     # pylint, I don't need the arguments but I have to have them.
     # pylint: disable=unused-argument
+    from PyQt5 import QtWidgets
     QtWidgets.qApp.quit()
 
 def safe_timer(timeout, func, *args, **kwargs):
@@ -49,6 +198,7 @@ def safe_timer(timeout, func, *args, **kwargs):
     Create a timer that is safe against garbage collection and overlapping
     calls. See: http://ralsina.me/weblog/posts/BB974.html
     """
+    from PyQt5 import QtCore
     def timer_event():
         try:
             func(*args, **kwargs)
@@ -14,8 +14,13 @@ FEATURES = [
 ]
 
 def contour_centroid(contour):
-    """Computes centroid of a contour"""
+    """Computes centroid of a contour
+
+    Contours without area (lines and points) get the mean of their points.
+    """
     moments = cv2.moments(contour)
+    if not moments['m00']:
+        return tuple(int(i) for i in contour.reshape(-1, 2).mean(axis=0))
     centre = (
         int(moments['m10']/moments['m00']),
         int(moments['m01']/moments['m00'])
@@ -0,0 +1,250 @@
+"""Decoder backends
+
+Videos are read through captures: objects with the part of the
+cv2.VideoCapture interface that videotracker uses (isOpened, read, grab,
+retrieve, get, set and release, with the CAP_PROP_* properties of OpenCV).
+A backend opens captures. There are two:
+
+- opencv: cv2.VideoCapture, with an explicit number of decoding threads,
+- pyav: FFmpeg through PyAV (optional, `pip install av`), with frame threaded
+  decoding and seeking by presentation timestamp, which lands on the exact
+  frame for every codec. Its captures can also decode the keyframes alone
+  (`keyframes`), as thumbnails do.
+
+Image sequences and multi-page TIFF stacks are read by SequenceCapture (see
+sequences) whatever the backend, using its number of threads.
+
+The backend of a session is given as NAME or NAME:OPTION=VALUE,... (for
+instance `opencv:threads=8` or `pyav`), by --decoder or by
+$VIDEOTRACKER_DECODER. `configure` sets it for the process and the processes
+it starts; `open_capture` opens captures with it.
+"""
+
+import os
+
+import cv2
+
+from . import sequences
+
+ENVIRON = 'VIDEOTRACKER_DECODER'
+DEFAULT = 'opencv'
+
+def parse(text: str) -> tuple:
+    """Parses NAME:OPTION=VALUE,... into the backend's name and options
+
+    Raises a ValueError for unknown backends and malformed options.
+    """
+    name, _, text = (text or DEFAULT).partition(':')
+    name = name.strip().lower()
+    if name not in BACKENDS:
+        raise ValueError('Unknown decoder `%s` (known: %s)' % (name, ', '.join(BACKENDS)))
+    options = {}
+    for item in filter(None, text.split(',')):
+        option, _, value = item.partition('=')
+        if option.strip() != 'threads' or not value.strip().isdigit():
+            raise ValueError('Expected decoder options threads=N, got `%s`' % item)
+        options['threads'] = int(value)
+    return name, options
+
+def configure(text: str):
+    """Makes the backend given by text the backend of this session
+
+    Processes started afterwards use it too.
+    """
+    parse(text)
+    os.environ[ENVIRON] = text
+
+def current() -> tuple:
+    """Name and options of the backend of this session"""
+    return parse(os.environ.get(ENVIRON))
+
+def open_opencv(file_name: str, threads: int = None):
+    """A cv2.VideoCapture of file_name, decoding with threads threads
+
+    Without threads, or with OpenCV versions that cannot set them, OpenCV
+    chooses. 0 lets FFmpeg choose as well.
+    """
+    if threads is None or not hasattr(cv2, 'CAP_PROP_N_THREADS'):
+        return cv2.VideoCapture(file_name)
+    return cv2.VideoCapture(file_name, cv2.CAP_ANY, [cv2.CAP_PROP_N_THREADS, threads])
+
+class PyAVCapture:
+    """Reads a video with PyAV, like a cv2.VideoCapture
+
+    Frames are decoded by threads threads (0: one per CPU), several frames at
+    once. Frame numbers are mapped to timestamps through the frame rate, so
+    seeking assumes a constant frame rate, as OpenCV does.
+    """
+
+    def __init__(self, file_name: str, threads: int = 0):
+        try:
+            import av
+        except ImportError:
+            raise ValueError('The pyav decoder needs PyAV (pip install av)') from None
+        self.av = av
+        self.container = None
+        self.stream = None
+        self.fps = 0.0
+        self.start_pts = 0
+        self.position = 0 # Number of the next frame
+        self.milliseconds = 0.0
+        self._frames = None
+        self._pending = None # Frame found while seeking, to be grabbed next
+        self._grabbed = None
+        try:
+            self.container = av.open(file_name)
+            self.stream = self.container.streams.video[0]
+        except (av.error.FFmpegError, IndexError):
+            self.release()
+            return
+        self.stream.thread_type = 'AUTO'
+        self.stream.thread_count = threads
+        self.fps = float(self.stream.average_rate or self.stream.guessed_rate or 0)
+        self.start_pts = self.stream.start_time or 0
+
+    def isOpened(self) -> bool: # pylint: disable=invalid-name
+        """Whether the video could be opened"""
+        return self.container is not None
+
+    @property
+    def frame_count(self) -> int:
+        """Number of frames, from the header or estimated from the duration"""
+        if self.stream.frames:
+            return self.stream.frames
+        if self.container.duration and self.fps:
+            return int(round(self.container.duration / self.av.time_base * self.fps))
+        return 0
+
+    def pts(self, index: int) -> int:
+        """Presentation timestamp of frame index"""
+        return self.start_pts + int(round(index / self.fps / self.stream.time_base))
+
+    def next_frame(self):
+        """The next decoded frame, or None at the end"""
+        if self._pending is not None:
+            frame, self._pending = self._pending, None
+            return frame
+        if self._frames is None:
+            self._frames = self.container.decode(self.stream)
+        try:
+            return next(self._frames)
+        except (StopIteration, self.av.error.EOFError):
+            return None
+
+    def seek(self, index: int) -> bool:
+        """Positions the capture so that the next frame is frame index
+
+        Without a frame rate, frames cannot be found by timestamp, and the
+        position is left as it is.
+        """
+        if not self.fps:
+            return False
+        index = max(0, int(index))
+        self._pending = self._grabbed = None
+        target = self.pts(index)
+        self.container.seek(target, stream=self.stream, backward=True, any_frame=False)
+        self._frames = self.container.decode(self.stream)
+        # Seeking lands on the keyframe before target; decode up to target.
+        frame = self.next_frame()
+        while frame is not None and frame.pts is not None and frame.pts < target:
+            frame = self.next_frame()
+        self._pending = frame
+        self.position = index
+        return True
+
+    def keyframes(self):
+        """Decodes the keyframes only, from the start, as (frame number, BGR image)
+
+        Other frames are not decoded at all, which makes this much faster than
+        reading every frame. Frames are read from the start again afterwards.
+        """
+        context = self.stream.codec_context
+        self.container.seek(self.start_pts, stream=self.stream, backward=True, any_frame=False)
+        context.skip_frame = 'NONKEY'
+        try:
+            for frame in self.container.decode(self.stream):
+                if frame.pts is None or not self.fps:
+                    continue
+                seconds = float((frame.pts - self.start_pts) * self.stream.time_base)
+                yield int(round(seconds * self.fps)), frame.to_ndarray(format='bgr24')
+        finally:
+            context.skip_frame = 'DEFAULT'
+            self.seek(0)
+
+    def grab(self) -> bool:
+        """Decodes the next frame"""
+        if self.container is None:
+            return False
+        frame = self.next_frame()
+        self._grabbed = frame
+        if frame is None:
+            return False
+        if frame.pts is not None:
+            self.milliseconds = float((frame.pts - self.start_pts) * self.stream.time_base) * 1000
+        elif self.fps:
+            self.milliseconds = self.position / self.fps * 1000
+        self.position += 1
+        return True
+
+    def retrieve(self) -> tuple:
+        """The grabbed frame as a BGR image, as (exists, frame)"""
+        if self._grabbed is None:
+            return False, None
+        return True, self._grabbed.to_ndarray(format='bgr24')
+
+    def read(self) -> tuple:
+        """Decodes and returns the next frame, as (exists, frame)"""
+        if not self.grab():
+            return False, None
+        return self.retrieve()
+
+    def get(self, prop: int) -> float:
+        """The value of a capture property, 0 for unknown properties"""
+        if self.container is None:
+            return 0.0
+        context = self.stream.codec_context
+        tag = (context.codec_tag or '').ljust(4)[:4]
+        values = {
+            cv2.CAP_PROP_POS_FRAMES: self.position,
+            cv2.CAP_PROP_POS_MSEC: self.milliseconds,
+            cv2.CAP_PROP_POS_AVI_RATIO: self.position / self.frame_count if self.frame_count else 0,
+            cv2.CAP_PROP_FPS: self.fps,
+            cv2.CAP_PROP_FRAME_COUNT: self.frame_count,
+            cv2.CAP_PROP_FRAME_WIDTH: context.width,
+            cv2.CAP_PROP_FRAME_HEIGHT: context.height,
+            cv2.CAP_PROP_FOURCC: sum(ord(char) << 8 * index for index, char in enumerate(tag)),
+        }
+        return float(values.get(prop, 0))
+
+    def set(self, prop: int, value: float) -> bool:
+        """Sets the position, by frame, time or ratio
+
+        Returns False if the position cannot be set.
+        """
+        if self.container is None:
+            return False
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return self.seek(value)
+        if prop == cv2.CAP_PROP_POS_MSEC and self.fps:
+            return self.seek(round(value / 1000 * self.fps))
+        if prop == cv2.CAP_PROP_POS_AVI_RATIO and self.frame_count:
+            return self.seek(round(value * self.frame_count))
+        return False
+
+    def release(self):
+        """Closes the video"""
+        if self.container is not None:
+            self.container.close()
+            self.container = None
+
+BACKENDS = {
+    'opencv': open_opencv,
+    'pyav': PyAVCapture,
+}
+
+def open_capture(file_name: str, backend: str = None):
+    """A capture of file_name, opened by backend (by default the session's)"""
+    name, options = parse(backend) if backend is not None else current()
+    if sequences.is_sequence(file_name):
+        return sequences.SequenceCapture(file_name, threads=options.get('threads'))
+    return BACKENDS[name](file_name, **options)
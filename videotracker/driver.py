@@ -0,0 +1,266 @@
+"""Asynchronous runs of stacks
+
+A Driver runs a stack description (see pipeline) over a video as a chain of
+asyncio tasks: decoding, computing and one task per output sink. Tasks are
+connected by bounded queues, so a slow stage holds up the stages before it
+(back-pressure) instead of letting frames pile up in memory. Decoding and
+computing run in their own executor threads, blocking sinks in a shared
+one, so writing outputs overlaps with computing.
+
+For every stage the driver measures the items handled, the time spent working
+and the time spent waiting for input or for room downstream, which shows
+where a run is bound.
+
+Drivers run headless (`run`) or inside the GUI (see bridge).
+"""
+
+import asyncio
+import concurrent.futures
+import time
+
+import cv2
+
+from . import framecache, gating, metrics, outputs, spec, store
+from .contours import FEATURES, extract_features
+
+END = None # Marks the end of a queue
+
+class Stats:
+    """Items handled and seconds spent working and waiting by a stage"""
+
+    def __init__(self):
+        self.items = 0
+        self.busy = 0.0
+        self.starved = 0.0 # Waiting for input
+        self.blocked = 0.0 # Waiting for room downstream
+
+    def to_dict(self) -> dict:
+        """The statistics as a dictionary"""
+        return {name: round(value, 4) if isinstance(value, float) else value
+                for name, value in vars(self).items()}
+
+class CsvSink:
+    """Writes features to a CSV file, with an outputs.CsvWriter"""
+    blocking = True
+
+    def __init__(self, file_name: str, fields=FEATURES):
+        self.file_name = file_name
+        self.fields = list(fields)
+        self.writer = None
+
+    def open(self):
+        """Starts the writer"""
+        self.writer = outputs.CsvWriter(self.file_name, self.fields)
+        self.writer.start()
+
+    def write(self, frame: int, timestamp: float, image, data: list):
+        """Writes the features of a frame's contours"""
+        # pylint: disable=unused-argument
+        self.writer.write(frame, timestamp, extract_features(data))
+
+    def close(self):
+        """Flushes the remaining rows and closes the file"""
+        self.writer.close()
+
+class StoreSink:
+    """Writes contours to a contour store (see store)"""
+    blocking = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self.store = None
+
+    def open(self):
+        """Opens the store for writing"""
+        self.store = store.ContourStore(self.path, 'w')
+
+    def write(self, frame: int, timestamp: float, image, data: list):
+        """Appends a frame's contours"""
+        # pylint: disable=unused-argument
+        self.store.append(frame, timestamp, data)
+
+    def close(self):
+        """Closes the store"""
+        self.store.close()
+
+class CallbackSink:
+    """Calls function(frame, timestamp, image, data) for every frame
+
+    The function is called in the driver's event loop, so it must be quick.
+    """
+    blocking = False
+
+    def __init__(self, function):
+        self.write = function
+
+    def open(self):
+        """Nothing to open"""
+
+    def close(self):
+        """Nothing to close"""
+
+class Driver:
+    """Runs a stack description over in_file, handing results to sinks
+
+    Sinks have open, write(frame, timestamp, image, data) and close methods.
+    Sinks with blocking set are run in an executor thread. At most
+    queue_size frames wait between two stages. With frame_cache (see
+    framecache.capture), frames are read from a frame cache.
+    """
+
+    def __init__(self, in_file: str, description: dict, sinks=(), queue_size: int = 8,
+                 frame_cache: dict = None):
+        self.in_file = in_file
+        self.frame_cache = frame_cache
+        self.description = description
+        self.sinks = list(sinks)
+        self.queue_size = queue_size
+        self.stats = {}
+        self.stopped = False
+
+    def stop(self):
+        """Stops decoding; frames already decoded are still processed
+
+        May be called from any thread.
+        """
+        self.stopped = True
+
+    @staticmethod
+    async def put(queue: asyncio.Queue, item, stats: Stats):
+        """Puts item into queue, counting the wait as blocked"""
+        start = time.perf_counter()
+        await queue.put(item)
+        stats.blocked += time.perf_counter() - start
+
+    @staticmethod
+    async def get(queue: asyncio.Queue, stats: Stats):
+        """Gets an item from queue, counting the wait as starved"""
+        start = time.perf_counter()
+        item = await queue.get()
+        stats.starved += time.perf_counter() - start
+        return item
+
+    async def decode(self, capture, output: asyncio.Queue, executor):
+        """Reads frames into output"""
+        loop = asyncio.get_running_loop()
+        stats = self.stats['decode'] = Stats()
+        frame_number = 0
+        while not self.stopped:
+            start = time.perf_counter()
+            exists, frame = await loop.run_in_executor(executor, capture.read)
+            stats.busy += time.perf_counter() - start
+            if not exists:
+                break
+            metrics.collector().observe('stage_seconds', time.perf_counter() - start,
+                                        stage='decode')
+            metrics.collector().inc('frames_read')
+            frame_number += 1
+            stats.items += 1
+            timestamp = capture.get(cv2.CAP_PROP_POS_MSEC)
+            await self.put(output, (frame_number, timestamp, frame), stats)
+        await output.put(END)
+
+    async def compute(self, source: asyncio.Queue, outputs: list, executor):
+        """Runs the pipeline on frames from source, passing results to outputs"""
+        loop = asyncio.get_running_loop()
+        stats = self.stats['compute'] = Stats()
+        pipeline = spec.build(self.description, self.in_file)
+        pipeline.metrics = metrics.collector()
+        gate = None
+        if self.description.get('gate') is not None:
+            gate = gating.MotionGate(self.description['gate'])
+        data = None
+        while True:
+            item = await self.get(source, stats)
+            if item is END:
+                break
+            frame_number, timestamp, frame = item
+            if gate is None or gate(frame):
+                start = time.perf_counter()
+                result = await loop.run_in_executor(executor, pipeline, frame, ('data',))
+                stats.busy += time.perf_counter() - start
+                data = result.get('data')
+            else:
+                metrics.collector().inc('skipped_frames')
+            stats.items += 1
+            metrics.collector().inc('frames')
+            if data is not None:
+                for output in outputs:
+                    await self.put(output, (frame_number, timestamp, frame, data), stats)
+        for output in outputs:
+            await output.put(END)
+        self.stats['skipped'] = gate.skipped if gate is not None else 0
+
+    async def sink(self, name: str, sink, source: asyncio.Queue, executor):
+        """Hands results from source to sink"""
+        loop = asyncio.get_running_loop()
+        stats = self.stats[name] = Stats()
+
+        async def call(function, *args):
+            if sink.blocking:
+                return await loop.run_in_executor(executor, function, *args)
+            return function(*args)
+
+        await call(sink.open)
+        try:
+            while True:
+                item = await self.get(source, stats)
+                if item is END:
+                    break
+                start = time.perf_counter()
+                await call(sink.write, *item)
+                stats.busy += time.perf_counter() - start
+                metrics.collector().observe('stage_seconds', time.perf_counter() - start,
+                                            stage=name)
+                stats.items += 1
+        finally:
+            await call(sink.close)
+
+    @staticmethod
+    async def monitor(queues: dict, interval: float = 0.5):
+        """Reports the depths of queues (by name) to the metrics, until cancelled"""
+        while True:
+            for name, queue in queues.items():
+                metrics.collector().set('queue_depth', queue.qsize(), queue=name)
+            await asyncio.sleep(interval)
+
+    async def run(self) -> dict:
+        """Runs the stack over the whole video, returns the statistics per stage"""
+        capture = framecache.capture(self.in_file, self.frame_cache)
+        if not capture.isOpened():
+            raise ValueError('File is not readable by the decoder: `%s`' % self.in_file)
+        self.stats = {}
+        frames = asyncio.Queue(self.queue_size)
+        results = [asyncio.Queue(self.queue_size) for _ in self.sinks]
+        executors = [concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix=name)
+                     for name in ('decode', 'compute', 'sinks')]
+        start = time.perf_counter()
+        names = [f'sink{index}:{type(sink).__name__}' for index, sink in enumerate(self.sinks)]
+        queues = {'frames': frames, **dict(zip(names, results))}
+        monitor = asyncio.ensure_future(self.monitor(queues))
+        try:
+            await asyncio.gather(
+                self.decode(capture, frames, executors[0]),
+                self.compute(frames, results, executors[1]),
+                *(self.sink(name, sink, queue, executors[2])
+                  for name, sink, queue in zip(names, self.sinks, results)),
+            )
+        finally:
+            monitor.cancel()
+            capture.release()
+            for executor in executors:
+                executor.shutdown()
+        stats = {name: value.to_dict() if isinstance(value, Stats) else value
+                 for name, value in self.stats.items()}
+        stats['seconds'] = round(time.perf_counter() - start, 4)
+        return stats
+
+def run(in_file: str, description: dict, csv_file: str = None, store_file: str = None,
+        queue_size: int = 8) -> dict:
+    """Runs description over in_file with a Driver, writing the given outputs"""
+    sinks = []
+    if csv_file is not None:
+        sinks.append(CsvSink(csv_file))
+    if store_file is not None:
+        sinks.append(StoreSink(store_file))
+    return asyncio.run(Driver(in_file, description, sinks, queue_size).run())
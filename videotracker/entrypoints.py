@@ -1,19 +1,153 @@
 """Entrypoints for the videotracker"""
 
+import argparse
+import json
 import sys
 
-from PyQt5.QtWidgets import QApplication
-
-from . import windows
 from . import cli
 
 def gui():
     """GUI entrypoint"""
+    # Imported here, so that the other entrypoints do not load the widgets.
+    from PyQt5.QtWidgets import QApplication
+    from . import windows
     parser = cli.parser
     args = parser.parse_args()
+    configure_decoder(parser, args)
     app = QApplication(sys.argv)
     cli.setup_interrupt_handling()
     sys.excepthook = cli.pop_exception
-    widget = windows.MainView(csv_file=args.csv, vid_file=args.output, in_file=args.input)
+    stop_metrics = export_metrics(args)
+    widget = windows.MainView(csv_file=args.csv, vid_file=args.output, in_file=args.input,
+                              frame_cache=frame_cache(parser, args),
+                              store_contours=args.store_contours)
+    if args.module is not None:
+        from . import plugins
+        widget.module_load(plugins.registry().load('stack', args.module))
+    if args.spec is not None:
+        from . import spec
+        widget.module_spec(spec.load(args.spec))
     widget.show()
-    sys.exit(app.exec_())
+    status = app.exec_()
+    stop_metrics()
+    sys.exit(status)
+
+def configure_decoder(parser, args):
+    """Sets the decoder backend given by --decoder for the session"""
+    if args.decoder is None:
+        return
+    from . import decoders
+    try:
+        decoders.configure(args.decoder)
+    except ValueError as error:
+        parser.error(str(error))
+
+def frame_cache(parser, args) -> dict:
+    """Arguments of framecache.get given by --frame-cache and --gray-cache"""
+    if args.frame_cache is None:
+        return None
+    from . import framecache
+    try:
+        start, stop = framecache.parse_range(args.frame_cache)
+    except ValueError as error:
+        parser.error(str(error))
+    return {'start': start, 'stop': stop, 'gray': args.gray_cache}
+
+def export_metrics(args):
+    """Exports metrics as asked by --metrics-port and --metrics-file
+
+    Returns a function that stops exporting them.
+    """
+    if args.metrics_port is None and args.metrics_file is None:
+        return lambda: None
+    from . import metrics
+    server = sink = None
+    if args.metrics_port is not None:
+        server = metrics.serve(args.metrics_port)
+    if args.metrics_file is not None:
+        sink = metrics.JsonLinesSink(args.metrics_file, args.metrics_interval)
+        sink.start()
+    def stop():
+        if server is not None:
+            server.shutdown()
+        if sink is not None:
+            sink.close()
+    return stop
+
+def describe(parser, args) -> dict:
+    """Description of the stack given by --spec, or by --module and --config
+
+    Only stacks given by --module and --config need the stack's class and
+    thereby Qt.
+    """
+    from . import plugins, spec
+    if args.spec is not None:
+        try:
+            return spec.load(args.spec)
+        except (OSError, ValueError) as error:
+            parser.error(f'{args.spec}: {error}')
+    try:
+        stack = plugins.registry().load('stack', args.module)
+    except KeyError as error:
+        parser.error(error.args[0])
+    config = None
+    if args.config is not None:
+        with open(args.config) as handle:
+            config = json.load(handle)
+    return stack.describe(config)
+
+def batch():
+    """Batch entrypoint"""
+    # Imported here, so that the GUI entrypoint does not pay for it.
+    from . import batch as batch_module
+    args = cli.batch_parser.parse_args()
+    configure_decoder(cli.batch_parser, args)
+    description = describe(cli.batch_parser, args)
+    if args.from_store:
+        counts = batch_module.export_stores(args.inputs, description, output_dir=args.output_dir)
+        print(', '.join(f'{count} {state}' for state, count in counts.items()))
+        sys.exit(1 if counts['failed'] else 0)
+    if (args.start != 1 or args.stop is not None) and not args.cache:
+        cli.batch_parser.error('--start and --stop need --cache')
+    if args.start < 1 or (args.stop is not None and args.stop < args.start):
+        cli.batch_parser.error('Expected 1 <= --start <= --stop')
+    stop_metrics = export_metrics(args)
+    try:
+        counts = batch_module.run_batch(
+            args.inputs, description, args.queue, workers=args.jobs,
+            output_dir=args.output_dir, contours=not args.no_contours, retry=args.retry,
+            cache_size=args.cache << 20 if args.cache else None,
+            report_interval=args.metrics_interval, start=args.start, stop=args.stop,
+        )
+    finally:
+        stop_metrics()
+    print(', '.join(f'{count} {state}' for state, count in counts.items()))
+    sys.exit(1 if counts['failed'] else 0)
+
+def sweep():
+    """Parameter sweep entrypoint"""
+    # Imported here, so that the GUI entrypoint does not pay for it.
+    from . import sweep as sweep_module
+    args = cli.sweep_parser.parse_args()
+    configure_decoder(cli.sweep_parser, args)
+    description = describe(cli.sweep_parser, args)
+    grid = {}
+    if args.grid is not None:
+        with open(args.grid) as handle:
+            grid = json.load(handle)
+    for text in args.param:
+        try:
+            method, param, values = cli.parse_param(text)
+        except argparse.ArgumentTypeError as error:
+            cli.sweep_parser.error(str(error))
+        grid.setdefault(method, {})[param] = values
+    try:
+        sweep_module.check_grid(description, grid)
+    except ValueError as error:
+        cli.sweep_parser.error(str(error))
+    rows = sweep_module.run_sweep(args.input, description, grid,
+                                  samples=args.samples, workers=args.jobs,
+                                  frame_cache=frame_cache(cli.sweep_parser, args))
+    print(sweep_module.format_table(rows))
+    if args.csv is not None:
+        sweep_module.write_csv(rows, args.csv)
@@ -0,0 +1,301 @@
+"""Decoded frame caches
+
+Tuning and sweeps decode the same frames of a video again and again, and
+random seeks in compressed videos decode from the previous keyframe. A frame
+cache decodes a video, or a range of its frames, once into a raw file of
+frames with a fixed stride, optionally as grayscale. The file is memory-mapped,
+so that reading any frame from it is a slice of the map, without decoding or
+copying.
+
+Caches live in the frames directory of the cache (see helpers.cache_path),
+identified by the video file (see helpers.file_key), the frame range and the
+colour mode. A cache is complete once its description (a JSON file next to
+the frames) is written; the frames are written first.
+
+CacheCapture reads a cache like the captures of decoder backends (see
+decoders) read videos, so that code reading captures can read caches
+unchanged. Frames outside the cached range are decoded from the video.
+"""
+
+import bisect
+import json
+import os
+import threading
+
+import numpy as np
+
+import cv2
+
+from . import decoders, helpers
+from .runner import seek
+
+_LOCKS = {}
+_LOCK = threading.Lock()
+
+def cache_files(in_file: str, start: int = 0, stop: int = None, gray: bool = False) -> tuple:
+    """Frame file and description file of the cache of in_file
+
+    Caches are kept per decoder backend (see decoders), as backends may
+    decode slightly different images.
+    """
+    key = helpers.file_key(in_file, start, stop, gray, decoders.current()[0])
+    base = helpers.cache_path('frames', key)
+    return base + '.raw', base + '.json'
+
+def parse_range(text: str) -> tuple:
+    """Parses START:STOP (either may be left out) into (start, stop)
+
+    Frames are counted from 0 and stop is excluded, as in slices.
+    """
+    start, _, stop = (text or '').partition(':')
+    try:
+        return int(start) if start else 0, int(stop) if stop else None
+    except ValueError:
+        raise ValueError('Expected a frame range START:STOP, got `%s`' % text) from None
+
+class FrameCache:
+    """Decoded frames of a video, read from a memory-mapped file
+
+    Frames are indexed by their frame number in the video (counting from 0)
+    and are read-only views of the map. `in` tells whether a frame is cached.
+    """
+
+    def __init__(self, frame_file: str, info: dict):
+        self.frame_file = frame_file
+        self.info = info
+        self.start = info['start']
+        self.count = info['count']
+        self.times = info['times']
+        shape = (self.count, *info['shape'])
+        if self.count:
+            self.frames = np.memmap(frame_file, dtype=np.dtype(info['dtype']), mode='r',
+                                    shape=shape)
+        else:
+            self.frames = np.empty(shape, np.dtype(info['dtype']))
+
+    @property
+    def stop(self) -> int:
+        """Frame number after the last cached frame"""
+        return self.start + self.count
+
+    @property
+    def at_end(self) -> bool:
+        """Whether the video ends with the last cached frame"""
+        return self.info['at_end']
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, index: int) -> bool:
+        return self.start <= index < self.stop
+
+    def __getitem__(self, index: int):
+        if index not in self:
+            raise IndexError('Frame %d is not cached' % index)
+        return self.frames[index - self.start].view(np.ndarray)
+
+    def time(self, index: int) -> float:
+        """Time of frame index in milliseconds"""
+        return self.times[index - self.start]
+
+    def index(self, milliseconds: float) -> int:
+        """Number of the first cached frame at or after milliseconds"""
+        return self.start + bisect.bisect_left(self.times, milliseconds)
+
+def find(in_file: str, start: int = 0, stop: int = None, gray: bool = False) -> FrameCache:
+    """The complete cache of in_file, or None if there is none"""
+    frame_file, info_file = cache_files(in_file, start, stop, gray)
+    try:
+        with open(info_file) as handle:
+            info = json.load(handle)
+    except (OSError, ValueError):
+        return None
+    if not os.path.exists(frame_file):
+        return None
+    return FrameCache(frame_file, info)
+
+def build(in_file: str, start: int = 0, stop: int = None, gray: bool = False,
+          progress=None) -> FrameCache:
+    """Decodes frames start to stop (excluded) of in_file into a cache
+
+    Without stop, frames are decoded up to the end of the video. progress,
+    if given, is called with the number of frames decoded so far.
+    """
+    frame_file, info_file = cache_files(in_file, start, stop, gray)
+    # Temporary files are written first, so that an interrupted build leaves no
+    # cache behind. They are named per thread, as builds may overlap.
+    part = f'.{os.getpid()}.{threading.get_ident()}.part'
+    capture = decoders.open_capture(in_file)
+    if not capture.isOpened():
+        raise ValueError('File is not readable by the decoder: `%s`' % in_file)
+    info = {
+        'source': os.path.abspath(in_file),
+        'start': start,
+        'stop': stop,
+        'gray': gray,
+        'fps': capture.get(cv2.CAP_PROP_FPS),
+        'fourcc': capture.get(cv2.CAP_PROP_FOURCC),
+        'frame_count': capture.get(cv2.CAP_PROP_FRAME_COUNT),
+        'dtype': None,
+        'shape': None,
+        'count': 0,
+        'times': [],
+        'at_end': False,
+    }
+    try:
+        seek(capture, start)
+        with open(frame_file + part, 'wb') as handle:
+            while stop is None or start + info['count'] < stop:
+                exists, frame = capture.read()
+                if not exists:
+                    info['at_end'] = True
+                    break
+                if gray and frame.ndim == 3:
+                    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                if info['shape'] is None:
+                    info['dtype'], info['shape'] = frame.dtype.str, frame.shape
+                elif frame.shape != tuple(info['shape']):
+                    raise ValueError('Frame %d of `%s` changes size'
+                                     % (start + info['count'], in_file))
+                handle.write(np.ascontiguousarray(frame).data)
+                info['times'].append(capture.get(cv2.CAP_PROP_POS_MSEC))
+                info['count'] += 1
+                if progress is not None:
+                    progress(info['count'])
+    except BaseException:
+        if os.path.exists(frame_file + part):
+            os.remove(frame_file + part)
+        raise
+    finally:
+        capture.release()
+    if info['shape'] is None:
+        info['dtype'], info['shape'] = np.dtype(np.uint8).str, (0,)
+    os.replace(frame_file + part, frame_file)
+    with open(info_file + part, 'w') as handle:
+        json.dump(info, handle)
+    os.replace(info_file + part, info_file)
+    return FrameCache(frame_file, info)
+
+def get(in_file: str, start: int = 0, stop: int = None, gray: bool = False,
+        progress=None) -> FrameCache:
+    """The cache of in_file, built first if there is none
+
+    A cache that is being built by another thread is waited for.
+    """
+    with _LOCK:
+        lock = _LOCKS.setdefault(cache_files(in_file, start, stop, gray), threading.Lock())
+    with lock:
+        cache = find(in_file, start, stop, gray)
+        if cache is None:
+            cache = build(in_file, start, stop, gray, progress)
+        return cache
+
+class CacheCapture:
+    """Reads a frame cache like a cv2.VideoCapture reads the video
+
+    Frames that are not cached are decoded from the video, which is only
+    opened when they are needed.
+    """
+
+    def __init__(self, cache: FrameCache, file_name: str = None):
+        self.cache = cache
+        self.file_name = file_name or cache.info['source']
+        self.position = 0 # Number of the next frame
+        self.milliseconds = 0.0
+        self._grabbed = None # Number of the grabbed frame, and whether it is cached
+        self._capture = None
+
+    @property
+    def capture(self):
+        """Capture of the video, for frames that are not cached"""
+        if self._capture is None:
+            self._capture = decoders.open_capture(self.file_name)
+        return self._capture
+
+    def isOpened(self) -> bool: # pylint: disable=invalid-name
+        """Caches are always open"""
+        return True
+
+    def grab(self) -> bool:
+        """Grabs the next frame"""
+        index = self.position
+        self._grabbed = None
+        if index in self.cache:
+            self.milliseconds = self.cache.time(index)
+        elif self.cache.at_end and index >= self.cache.stop:
+            return False
+        else:
+            if int(self.capture.get(cv2.CAP_PROP_POS_FRAMES)) != index:
+                try:
+                    seek(self.capture, index)
+                except ValueError:
+                    return False
+            if not self.capture.grab():
+                return False
+            self.milliseconds = self.capture.get(cv2.CAP_PROP_POS_MSEC)
+        self._grabbed = (index, index in self.cache)
+        self.position += 1
+        return True
+
+    def retrieve(self) -> tuple:
+        """The grabbed frame, as (exists, frame)"""
+        if self._grabbed is None:
+            return False, None
+        index, cached = self._grabbed
+        if cached:
+            return True, self.cache[index]
+        return self.capture.retrieve()
+
+    def read(self) -> tuple:
+        """Grabs and returns the next frame, as (exists, frame)"""
+        if not self.grab():
+            return False, None
+        return self.retrieve()
+
+    def get(self, prop: int) -> float:
+        """The value of a capture property"""
+        info = self.cache.info
+        values = {
+            cv2.CAP_PROP_POS_FRAMES: self.position,
+            cv2.CAP_PROP_POS_MSEC: self.milliseconds,
+            cv2.CAP_PROP_FPS: info['fps'],
+            cv2.CAP_PROP_FOURCC: info['fourcc'],
+            cv2.CAP_PROP_FRAME_COUNT: info['frame_count'],
+        }
+        if info['shape'] and len(info['shape']) >= 2:
+            values[cv2.CAP_PROP_FRAME_HEIGHT], values[cv2.CAP_PROP_FRAME_WIDTH] = (
+                info['shape'][:2])
+        if prop in values:
+            return float(values[prop])
+        return self.capture.get(prop)
+
+    def set(self, prop: int, value: float) -> bool:
+        """Sets the position, by frame, time or ratio"""
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            self.position = max(0, int(value))
+        elif prop == cv2.CAP_PROP_POS_MSEC and self.cache.count and (
+                self.cache.times[0] <= value <= self.cache.times[-1]):
+            self.position = self.cache.index(value)
+        elif prop == cv2.CAP_PROP_POS_AVI_RATIO and self.cache.info['frame_count'] > 0:
+            self.position = int(round(value * self.cache.info['frame_count']))
+        else:
+            if not self.capture.set(prop, value):
+                return False
+            self.position = int(self.capture.get(cv2.CAP_PROP_POS_FRAMES))
+        return True
+
+    def release(self):
+        """Closes the video, if it was opened"""
+        if self._capture is not None:
+            self._capture.release()
+            self._capture = None
+
+def capture(file_name: str, frame_cache: dict = None):
+    """A capture of file_name, reading from a frame cache if frame_cache is given
+
+    frame_cache holds the arguments of `get` (start, stop, gray); the cache is
+    built first if there is none.
+    """
+    if frame_cache is None:
+        return decoders.open_capture(file_name)
+    return CacheCapture(get(file_name, **frame_cache), file_name)
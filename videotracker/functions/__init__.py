@@ -1,3 +1,22 @@
-from .functions import *
-from . import abc
-from . import params
+"""Functions of stacks
+
+The functions (see functions.py) are Qt widgets, while their operations (see
+ops.py) are not. Submodules and functions are therefore imported on first
+access, so that importing functions.ops for a headless run does not load Qt.
+"""
+
+import importlib
+
+SUBMODULES = ('abc', 'functions', 'ops', 'params')
+
+def __getattr__(name: str):
+    if name in SUBMODULES:
+        return importlib.import_module(f'.{name}', __name__)
+    if not name.startswith('__'):
+        module = importlib.import_module('.functions', __name__)
+        if hasattr(module, name):
+            return getattr(module, name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+def __dir__():
+    return sorted(set(globals()) | set(dir(importlib.import_module('.functions', __name__))))
@@ -1,16 +1,41 @@
-"""Abstract base classes for functions"""
+"""Abstract base classes for functions
+
+Functions are connected by Inputs and Outputs. An Input refers to the data of
+its source Output; nothing is copied. Data is kept until it is replaced, so
+that functions can recompute when their values change. During runs, stacks
+keep only what they need (see BaseStack.retain_outputs): a function that does
+not retain drops its inputs once it has computed with them, and an Output that
+does not retain drops its data once every Input connected to it has done so.
+"""
+
+import threading
+import time
 
 from PyQt5 import QtCore, QtWidgets
 
+from .. import helpers, metrics
+
 class WorkerThread(QtCore.QThread):
     """A worker thread, that is run by the functions"""
     def __init__(self, parent, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.parent = parent
+        self.used = None # Data of the inputs the last computation used
 
     def run(self):
-        """Runs the parent's method called function"""
-        self.parent.function()
+        """Runs the parent's method called function
+
+        Nothing is run until all inputs of the parent have data.
+        """
+        # pylint: disable=protected-access
+        if self.parent.ready:
+            used = {item: item.data for item in self.parent._inputs}
+            start = time.perf_counter()
+            self.parent.function()
+            metrics.collector().observe('stage_seconds', time.perf_counter() - start,
+                                        stage=self.parent.objectName()
+                                        or type(self.parent).__name__)
+            self.used = used
 
 class BaseIO(QtCore.QObject):
     """Abstract data"""
@@ -30,6 +55,11 @@ class BaseIO(QtCore.QObject):
         self._data = value
         self.changed.emit()
 
+    @property
+    def nbytes(self) -> int:
+        """Bytes of array data held"""
+        return helpers.nbytes(self._data)
+
 class Input(BaseIO):
     """Input data"""
     def __init__(self, *args, **kwargs):
@@ -54,16 +84,62 @@ class Input(BaseIO):
             pass
         except AttributeError:
             pass
+        if isinstance(self._source, Output):
+            self._source.consumers.discard(self)
         self._source = value
         self._source.changed.connect(self.get)
+        if isinstance(self._source, Output):
+            self._source.consumers.add(self)
 
     def get(self):
         """Sets the data"""
         if self.source:
             self.data = self.source.data
 
+    def release(self, value):
+        """Drops value, which a computation used, and tells the source
+
+        Data that has been replaced since is kept.
+        """
+        if self._data is value:
+            self._data = None
+        if isinstance(self._source, Output):
+            self._source.consumed(self, value)
+
 class Output(BaseIO):
-    """Output data"""
+    """Output data
+
+    Unless retain is set, the data is dropped once all consumers (the Inputs
+    connected to the output) have released it.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.retain = True
+        self.consumers = set()
+        self._waiting = set()
+        # Data is set in worker threads and released in the GUI thread.
+        self._lock = threading.Lock()
+
+    @property
+    def data(self):
+        """The data of this object"""
+        return self._data
+    @data.setter
+    def data(self, value):
+        with self._lock:
+            self._data = value
+            self._waiting = set(self.consumers)
+        self.changed.emit()
+
+    def consumed(self, consumer: Input, value):
+        """Notes that consumer is done with value"""
+        with self._lock:
+            if value is not self._data:
+                return
+            self._waiting.discard(consumer)
+            if not self.retain and not self._waiting:
+                self._data = None
 
 class BaseFunction(QtWidgets.QGroupBox):
     """Abstract function.
@@ -73,6 +149,12 @@ class BaseFunction(QtWidgets.QGroupBox):
     """
     title: str
     params: dict
+    region = None # Region of interest (roi.Region), set by the stack
+    in_file = None # Input video file, set by the stack
+    retain = True # Keep inputs after computing, set by the stack
+    keep_inputs = False # Always keep inputs, for functions comparing them between calls
+    view_only = False # Computed only while its output is displayed
+    active = True # Compute when inputs or values change, set by the stack
     #function: Callable
 
     valueChanged = QtCore.pyqtSignal(dict)
@@ -84,7 +166,7 @@ class BaseFunction(QtWidgets.QGroupBox):
         return {
             attribute: getattr(self, attribute)
             for attribute in dir(self)
-            if not attribute in ('io', 'outputs', 'inputs')
+            if not attribute in ('io', 'outputs', 'inputs', 'ready', 'held', 'nbytes')
             and isinstance(getattr(self, attribute), BaseIO)
         }
 
@@ -111,13 +193,16 @@ class BaseFunction(QtWidgets.QGroupBox):
         self.thread = WorkerThread(self)
         self.thread.started.connect(lambda: print(self.title + ' started'))
         self.thread.finished.connect(lambda: print(self.title + ' finished'))
+        self.thread.finished.connect(self.release_inputs)
         self.thread.setObjectName(type(self).__name__)
         #self.thread.finished.connect(self.extract)
         # We need to connect the valuechanges to a function that recomputes things.
         self.valueChanged.connect(self.__call__)
         # We also connect the input being changed to the function's call
-        for input_signal in self.inputs.values():
-            input_signal.changed.connect(self.thread.start)
+        self._inputs = list(self.inputs.values())
+        self._outputs = list(self.outputs.values())
+        for input_signal in self._inputs:
+            input_signal.changed.connect(self.__call__)
 
     def create_gui(self):
         """Creates the widget of this function"""
@@ -133,6 +218,34 @@ class BaseFunction(QtWidgets.QGroupBox):
         self.setLayout(layout)
         return self
 
+    @property
+    def ready(self) -> bool:
+        """Do all inputs have data?"""
+        return all(i.data is not None for i in self._inputs)
+
+    def release_inputs(self):
+        """Releases the inputs of the last computation, unless they are retained"""
+        used, self.thread.used = self.thread.used, None
+        if used is None or self.retain or self.keep_inputs:
+            return
+        for item, value in used.items():
+            item.release(value)
+
+    @property
+    def held(self) -> list:
+        """Data held by the inputs and outputs"""
+        return [item.data for item in self._inputs + self._outputs]
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes of array data held by the outputs"""
+        return helpers.nbytes(*(output.data for output in self._outputs))
+
+    @classmethod
+    def defaults(cls) -> dict:
+        """Values of a newly created function"""
+        return {param: cls.params[param].default for param in cls.params}
+
     def emit(self):
         """Emits a value_changed signal"""
         self.valueChanged.emit(self.values)
@@ -146,8 +259,16 @@ class BaseFunction(QtWidgets.QGroupBox):
         }
 
     def __call__(self):
-        """Runs this function's computation"""
-        self.thread.start()
+        """Runs this function's computation
+
+        An inactive function does not compute, and releases its inputs straight
+        away unless it retains them.
+        """
+        if self.active:
+            self.thread.start()
+        elif not (self.retain or self.keep_inputs):
+            for item in self._inputs:
+                item.release(item.data)
 
     def extract(self):
         """Extracts stuff from the thread and sets appropriate things"""
@@ -162,3 +283,34 @@ class ImageToImage(BaseFunction):
         self.input_image = Input()
         self.output_image = Output()
         super().__init__(*args, **kwargs)
+
+class ImageToData(BaseFunction):
+    """Image in, Data out"""
+    def __init__(self, *args, **kwargs):
+        self.input_image = Input()
+        self.output_data = Output()
+        super().__init__(*args, **kwargs)
+
+class DataToData(BaseFunction):
+    """Data in, Data out"""
+    def __init__(self, *args, **kwargs):
+        self.input_data = Input()
+        self.output_data = Output()
+        super().__init__(*args, **kwargs)
+
+class ImageDataToImage(BaseFunction):
+    """Image and Data in, Image out"""
+    def __init__(self, *args, **kwargs):
+        self.input_image = Input()
+        self.input_data = Input()
+        self.output_image = Output()
+        super().__init__(*args, **kwargs)
+
+class ImageDataToImageData(BaseFunction):
+    """Image and Data in, Image and Data out"""
+    def __init__(self, *args, **kwargs):
+        self.input_image = Input()
+        self.input_data = Input()
+        self.output_image = Output()
+        self.output_data = Output()
+        super().__init__(*args, **kwargs)
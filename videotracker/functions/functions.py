@@ -4,8 +4,10 @@ import collections
 
 import cv2
 
-from . import params
-from .abc import BaseFunction, ImageToImage
+from . import ops, params
+from .. import background, tracking
+from .abc import (BaseFunction, ImageToImage, ImageToData, DataToData, ImageDataToImage,
+                  ImageDataToImageData)
 
 ### FUNCTIONS ###
 # Unlike the previous parts, these can inherit from QWidget.
@@ -20,8 +22,7 @@ class GaussianBlur(ImageToImage):
     # These are the variables that define the out/input
     def function(self):
         """Blurs Gaussianly"""
-        self.output_image.data = cv2.GaussianBlur(cv2.cvtColor(self.input_image.data, cv2.COLOR_BGR2GRAY),
-                                                  (self.values['size'], self.values['size']), 0)
+        self.output_image.data = ops.gaussian_blur(self.input_image.data, **self.values)
 
 class AdaptiveThreshold(ImageToImage):
     """Computes an adaptive threshold"""
@@ -39,11 +40,9 @@ class AdaptiveThreshold(ImageToImage):
         """Applies an adaptive threshold"""
         # This is an example of a somewhat simple function, most of the inputs
         # are mapped directly to the function itself.
-        self.output_image.data = cv2.adaptiveThreshold(self.input_image.data, maxValue=255,
-                                                       thresholdType=cv2.THRESH_BINARY_INV,
-                                                       **self.values)
+        self.output_image.data = ops.adaptive_threshold(self.input_image.data, **self.values)
 
-class Contours(ImageToImage):
+class Contours(ImageToData):
     """Extracts contours"""
     title: str = 'Extract Contours'
     params: dict = {
@@ -60,10 +59,15 @@ class Contours(ImageToImage):
         ),
     }
     def function(self):
-        """Extracts contours"""
-        self.output_data.data = cv2.findContours(self.input_image.data, **self.values)
+        """Extracts contours
 
-class SizeFilter(ImageToImage):
+        Contours are returned in frame coordinates. With a region of interest,
+        contours outside of the region are dropped.
+        """
+        self.output_data.data = ops.find_contours(self.input_image.data, region=self.region,
+                                                  **self.values)
+
+class SizeFilter(DataToData):
     """Provides a method for size filters"""
     title: str = 'Filter by area'
     params: dict = {
@@ -72,21 +76,24 @@ class SizeFilter(ImageToImage):
     }
     def function(self):
         """Filters contours by enclosed area"""
-        self.output_data.data = [i for i in self.input_data.data
-                                 if self.values['minimum'] <= cv2.contourArea(i) <= self.values['maximum']]
+        self.output_data.data = ops.size_filter(self.input_data.data, **self.values)
+
+class DrawContours(ImageDataToImage):
+    """Draws Contours
 
-class DrawContours(ImageToImage):
-    """Draws Contours"""
+    Runs show contours as an overlay (see widgets.Overlay), so contours are
+    drawn into the image only while this function's output is displayed.
+    """
     title: str = 'Draw Contours'
+    view_only = True
     params: dict = {
         'color': params.ColorParam(),
         'thickness': params.IntParam(minimum=1, maximum=100, label='Thickness')
     }
     def function(self):
-        """Draws contours"""
-        self.output_image.data = cv2.drawContours(self.input_image.data,
-                                                  self.input_data.data,
-                                                  **self.values)
+        """Draws contours on a copy of the input image"""
+        self.output_image.data = ops.draw_contours(self.input_image.data, self.input_data.data,
+                                                   region=self.region, **self.values)
 
 class Morphology(ImageToImage):
     """Morphological operations"""
@@ -107,7 +114,79 @@ class Morphology(ImageToImage):
     }
     def function(self):
         """Morphological Operations"""
-        kernel = cv2.getStructuringElement(self.values['shape'],
-                                           (self.values['ksize'], self.values['ksize']))
-        self.output_image.data = cv2.morphologyEx(self.input_image.data,
-                                                  self.values['operation'], kernel)
+        self.output_image.data = ops.morphology(self.input_image.data, **self.values)
+
+class BackgroundSubtract(ImageToImage):
+    """Subtracts a background model and thresholds the difference"""
+    title: str = 'Background Subtraction'
+    params: dict = {
+        'samples': params.IntParam(minimum=3, maximum=500, value=25, label='Sampled Frames'),
+        'method': params.ChoiceParam(
+            choices=background.METHODS,
+            labels=('Median', 'Mode'),
+            label='Background Model',
+        ),
+        'thresh': params.IntParam(minimum=0, maximum=255, value=30, label='Threshold'),
+    }
+    def function(self):
+        """Thresholds the absolute difference to the background model
+
+        The model is built (or loaded from the cache) on first use.
+        """
+        self.output_image.data = ops.background_subtract(self.input_image.data, in_file=self.in_file,
+                                                         region=self.region, **self.values)
+
+class OpticalFlow(ImageDataToImageData):
+    """Follows detections between key frames with sparse optical flow
+
+    For a key frame, the frame is passed on as output image to be segmented,
+    and the resulting contours (the data input) are passed on as output data.
+    For all other frames, the last detected contours are moved along with the
+    Lucas-Kanade flow at their centroids. A frame is a key frame every
+    interval frames, or when an object is lost. The flow is computed on the
+    frame cropped to the region of interest, while contours are in frame
+    coordinates (see ops.OpticalFlow).
+    """
+    title: str = 'Optical Flow'
+    params: dict = {
+        'interval': params.IntParam(minimum=1, maximum=1000, value=10, label='Detection Interval'),
+        'window': params.IntParam(minimum=5, maximum=101, value=21, singleStep=2,
+                                  label='Window Size'),
+        'levels': params.IntParam(minimum=0, maximum=8, value=3, label='Pyramid Levels'),
+    }
+    keep_inputs = True # Frames are told apart by their input image
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tracker = tracking.FlowTracker()
+        self.frame = None
+        self.gray = None
+
+    @property
+    def offset(self) -> tuple:
+        """Position (x, y) of the input image in the frame"""
+        return self.region.offset if self.region else (0, 0)
+
+    @property
+    def ready(self) -> bool:
+        """Only a frame is needed; detections are requested by this function"""
+        return self.input_image.data is not None
+
+    def function(self):
+        """Tracks contours or requests a detection"""
+        for param, value in self.values.items():
+            setattr(self.tracker, param, value)
+        if self.input_image.data is not self.frame:
+            # A new frame
+            self.frame = self.input_image.data
+            self.gray = ops.to_8bit(ops.to_gray(self.frame))
+            contours = self.tracker.track(self.gray)
+            if contours is None:
+                self.output_image.data = self.frame
+            else:
+                self.output_data.data = ops.shift_contours(contours, self.offset)
+        elif self.input_data.data is not None:
+            # New detections for the current frame
+            offset = self.offset
+            self.tracker.reset(self.gray, ops.shift_contours(self.input_data.data,
+                                                             (-offset[0], -offset[1])))
+            self.output_data.data = self.input_data.data
@@ -0,0 +1,163 @@
+"""Operations behind the functions
+
+Each operation is the computation of one function (see functions.py), without
+any widgets or threads. Operations take the function's inputs as positional
+arguments and its values as keyword arguments. `OPERATIONS` maps function
+names to operations, so that stacks can be executed without Qt (see
+pipeline.py).
+
+Some operations need more than their inputs and values, such as the region of
+interest or the input file. These are passed as the keyword arguments named in
+`Operation.context`.
+"""
+
+from dataclasses import dataclass, field
+from typing import Callable
+
+import numpy as np
+
+import cv2
+
+from .. import background, tracking
+
+@dataclass
+class Operation:
+    """Description of an operation
+
+    inputs and outputs are the kinds ('image' or 'data') of the inputs and
+    outputs, in order. A stateful operation is a class, instantiated once per
+    pipeline. A lazy operation gets its data inputs as callables, to be called
+    only when needed, and passes its image input on as its image output.
+
+    scaled maps values measured in pixels to their dimension: 1 for lengths,
+    2 for areas. They are scaled along with images (see preview).
+    """
+    function: Callable
+    inputs: tuple = ('image',)
+    outputs: tuple = ('image',)
+    context: tuple = ()
+    stateful: bool = False
+    lazy: bool = False
+    scaled: dict = field(default_factory=dict)
+
+def hex_to_bgr(color: str) -> tuple:
+    """Converts a colour string like '#ff0000' into a BGR tuple for OpenCV"""
+    color = color.lstrip('#')
+    red, green, blue = (int(color[i:i+2], 16) for i in (0, 2, 4))
+    return (blue, green, red)
+
+def to_gray(image):
+    """Converts BGR images to grayscale, returns grayscale images unchanged"""
+    if image.ndim == 3:
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return image
+
+def to_8bit(image):
+    """Scales images of other depths (e.g. 16 bit microscopy) to 8 bit
+
+    Integer images are scaled by the range of their type, others are taken
+    to range from 0 to 255.
+    """
+    if image.dtype == np.uint8:
+        return image
+    if np.issubdtype(image.dtype, np.integer):
+        return cv2.convertScaleAbs(image, alpha=255 / np.iinfo(image.dtype).max)
+    return cv2.convertScaleAbs(image)
+
+def gaussian_blur(image, size):
+    """Blurs Gaussianly"""
+    return cv2.GaussianBlur(to_gray(image), (size, size), 0)
+
+def adaptive_threshold(image, **values):
+    """Applies an adaptive threshold"""
+    return cv2.adaptiveThreshold(to_8bit(image), maxValue=255, thresholdType=cv2.THRESH_BINARY_INV,
+                                 **values)
+
+def morphology(image, ksize, shape, operation):
+    """Morphological Operations"""
+    kernel = cv2.getStructuringElement(shape, (ksize, ksize))
+    return cv2.morphologyEx(image, operation, kernel)
+
+def find_contours(image, mode, method, region=None):
+    """Extracts contours
+
+    Contours are returned in frame coordinates. With a region of interest,
+    contours outside of the region are dropped.
+    """
+    offset = region.offset if region else (0, 0)
+    # OpenCV 3 returns (image, contours, hierarchy), OpenCV 4 returns
+    # (contours, hierarchy).
+    contours = cv2.findContours(image, mode=mode, method=method, offset=offset)[-2]
+    if region:
+        contours = region.select(contours)
+    return contours
+
+def size_filter(contours, minimum, maximum):
+    """Filters contours by enclosed area"""
+    return [i for i in contours if minimum <= cv2.contourArea(i) <= maximum]
+
+def draw_contours(image, contours, color, thickness, region=None):
+    """Draws contours on a copy of the image"""
+    offset = region.offset if region else (0, 0)
+    return cv2.drawContours(image.copy(), contours, contourIdx=-1,
+                            color=hex_to_bgr(color), thickness=thickness,
+                            offset=(-offset[0], -offset[1]))
+
+def background_subtract(image, samples, method, thresh, in_file=None, region=None):
+    """Thresholds the absolute difference to the background model of in_file
+
+    The model is built (or loaded from the cache) on first use.
+    """
+    model = background.get_model(in_file, samples, method)
+    if region:
+        model = region.crop(model)
+    if model.shape[:2] != image.shape[:2]:
+        # A downscaled image, as in previews.
+        model = cv2.resize(model, (image.shape[1], image.shape[0]), interpolation=cv2.INTER_AREA)
+    difference = cv2.absdiff(to_8bit(to_gray(image)), model)
+    return cv2.threshold(difference, thresh, 255, cv2.THRESH_BINARY)[1]
+
+def shift_contours(contours: list, offset) -> list:
+    """Contours moved by offset (x, y)"""
+    if not any(offset):
+        return list(contours)
+    shift = np.array(offset, np.int32)
+    return [contour + shift for contour in contours]
+
+class OpticalFlow:
+    """Follows detections between key frames with sparse optical flow
+
+    detect is called for key frames only, and should return the contours
+    detected in image, in frame coordinates. The flow is computed on image,
+    which is cropped to the region of interest, so contours are moved into
+    its coordinates for tracking and back into frame coordinates afterwards.
+    """
+    def __init__(self):
+        self.tracker = tracking.FlowTracker()
+
+    def __call__(self, image, detect, region=None, **values):
+        for param, value in values.items():
+            setattr(self.tracker, param, value)
+        offset = region.offset if region else (0, 0)
+        gray = to_8bit(to_gray(image))
+        contours = self.tracker.track(gray)
+        if contours is None:
+            contours = detect()
+            self.tracker.reset(gray, shift_contours(contours, (-offset[0], -offset[1])))
+            return image, contours
+        return image, shift_contours(contours, offset)
+
+OPERATIONS = {
+    'GaussianBlur': Operation(gaussian_blur, scaled={'size': 1}),
+    'AdaptiveThreshold': Operation(adaptive_threshold, scaled={'blockSize': 1}),
+    'Morphology': Operation(morphology, scaled={'ksize': 1}),
+    'Contours': Operation(find_contours, outputs=('data',), context=('region',)),
+    'SizeFilter': Operation(size_filter, inputs=('data',), outputs=('data',),
+                            scaled={'minimum': 2, 'maximum': 2}),
+    'DrawContours': Operation(draw_contours, inputs=('image', 'data'), context=('region',),
+                              scaled={'thickness': 1}),
+    'BackgroundSubtract': Operation(background_subtract, context=('in_file', 'region')),
+    'OpticalFlow': Operation(OpticalFlow, inputs=('image', 'data'), outputs=('image', 'data'),
+                             context=('region',), stateful=True, lazy=True,
+                             scaled={'window': 1}),
+}
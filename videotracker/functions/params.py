@@ -1,16 +1,22 @@
 """Parameters used by functions
 
 These parameters provide methods for constructing widgets and labels for a
-QGridLayout.
+QGridLayout. Widget classes may be given by name, and Qt is only imported
+when widgets are made, so that parameters (and their defaults) can be read
+without Qt.
 """
 
 from dataclasses import dataclass
 from types import MethodType
-from typing import Callable
+from typing import Callable, Union
 
-from PyQt5 import QtWidgets
-
-from .. import widgets
+def widget_class(name: str):
+    """The widget class called name, from QtWidgets or from widgets"""
+    from PyQt5 import QtWidgets
+    if hasattr(QtWidgets, name):
+        return getattr(QtWidgets, name)
+    from .. import widgets
+    return getattr(widgets, name)
 
 # Parameters
 @dataclass
@@ -19,7 +25,8 @@ class BaseParam:
 
     Subclass this to create a parameter that can create a widget when called
     with .widget()
-    widget_callable is the type of widget to define. If the widget does not
+    widget_callable is the type of widget to define, or its name (see
+    widget_class). If the widget does not
     provide the value property (setValue, valueChanged, value), You need to
     manually define .widget (see ChoiceParam for an example).
     The most common types of parameter are however defined (see methods below).
@@ -32,7 +39,12 @@ class BaseParam:
 
     """
     label: str = ''
-    widget_callable: Callable = QtWidgets.QWidget
+    widget_callable: Union[Callable, str] = 'QWidget'
+
+    @property
+    def default(self):
+        """Value of a newly created widget"""
+        return None
 
     def widget(self):
         """Returns a widget  dictionary: A dict with 'label' and 'widget'"""
@@ -42,47 +54,71 @@ class BaseParam:
             if not member.startswith('__')
             and member not in ('label', 'widget_callable')
         }
+        callable_ = self.widget_callable
+        if isinstance(callable_, str):
+            callable_ = widget_class(callable_)
         return {
-            'widget': self.widget_callable(**construct),
-            'label': QtWidgets.QLabel(self.label),
+            'widget': callable_(**construct),
+            'label': widget_class('QLabel')(self.label),
         }
 
 @dataclass
 class IntParam(BaseParam):
     """Integer Parameter"""
-    widget_callable: Callable = QtWidgets.QSpinBox
+    widget_callable: Union[Callable, str] = 'QSpinBox'
     minimum: int = 0
     maximum: int = 100
     value: int = minimum
     singleStep: int = 1
 
+    @property
+    def default(self) -> int:
+        """Value of a newly created widget"""
+        return min(max(self.value, self.minimum), self.maximum)
+
 @dataclass
 class FloatParam(BaseParam):
     """Integer Parameter"""
-    widget_callable: Callable = QtWidgets.QDoubleSpinBox
+    widget_callable: Union[Callable, str] = 'QDoubleSpinBox'
     label: str = ''
     minimum: float = 0
     maximum: float = 100
+    value: float = minimum
     singleStep: float = 1
 
+    @property
+    def default(self) -> float:
+        """Value of a newly created widget"""
+        return float(min(max(self.value, self.minimum), self.maximum))
+
 @dataclass
 class ColorParam(BaseParam):
     """Parameter for a colour"""
-    widget_callable: Callable = widgets.ColorButton
+    widget_callable: Union[Callable, str] = 'ColorButton'
     label: str = 'Colour'
 
+    @property
+    def default(self) -> str:
+        """Value of a newly created widget"""
+        return '#000000'
+
 @dataclass
 class ChoiceParam(BaseParam):
     """Choice Parameter"""
-    widget_callable: Callable = QtWidgets.QComboBox
+    widget_callable: Union[Callable, str] = 'QComboBox'
     label: str = ''
     choices: tuple = tuple()
     labels: tuple = tuple()
 
+    @property
+    def default(self):
+        """Value of a newly created widget"""
+        return next(iter(self.choices), None)
+
     def widget(self):
         """Creates a widget dictionary"""
-        dictionary = {'label': QtWidgets.QLabel(self.label)}
-        widget = dictionary['widget'] = QtWidgets.QComboBox()
+        dictionary = {'label': widget_class('QLabel')(self.label)}
+        widget = dictionary['widget'] = widget_class('QComboBox')()
         for label, choice in zip(self.labels, self.choices):
             widget.addItem(label, choice)
         widget.valueChanged = widget.currentIndexChanged
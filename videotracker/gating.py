@@ -0,0 +1,48 @@
+"""Gating of frames by motion
+
+A MotionGate decides cheaply whether a frame differs enough from the last
+processed frame to be worth processing. Frames are compared downsampled and in
+grayscale.
+"""
+
+import numpy as np
+
+import cv2
+
+class MotionGate:
+    """Lets frames pass only when they changed since the last passed frame
+
+    The change is the largest absolute difference of grayscale pixel values,
+    computed on frames downsampled by scale. Downsampling averages out noise,
+    while the maximum still catches small moving objects. Frames with a change
+    below threshold are counted as skipped.
+    """
+
+    def __init__(self, threshold: float = 8.0, scale: float = 0.125):
+        self.threshold = threshold
+        self.scale = scale
+        self.last = None
+        self.skipped = 0
+
+    def reset(self):
+        """Forgets the last frame and the count of skipped frames"""
+        self.last = None
+        self.skipped = 0
+
+    def shrink(self, frame: np.ndarray) -> np.ndarray:
+        """Downsampled grayscale version of frame"""
+        small = cv2.resize(frame, None, fx=self.scale, fy=self.scale,
+                           interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return small
+
+    def __call__(self, frame: np.ndarray) -> bool:
+        """Should frame be processed?"""
+        small = self.shrink(frame)
+        if (self.last is None or self.last.shape != small.shape
+                or cv2.absdiff(small, self.last).max() >= self.threshold):
+            self.last = small
+            return True
+        self.skipped += 1
+        return False
@@ -1,10 +1,11 @@
-"""Various helper functions"""
+"""Various helper functions
 
-import os
-
-from PyQt5 import QtWidgets, QtCore
+Helpers are used by the GUI as well as by headless runs, so Qt and OpenCV are
+imported by the helpers that need them, not when the module is loaded.
+"""
 
-import cv2
+import hashlib
+import os
 
 def disconnect(signal, *args, **kwargs):
     """Disconnects the signal, catching any TypeError"""
@@ -23,9 +24,11 @@ def video_max_frame(filename: str) -> int:
     frame we are.  If your filename does not exist, raises a FileNotFoundError.
     If your filename is not a video, raises a ValueError.
     """
-    if not os.path.exists(filename):
+    import cv2
+    from . import decoders, sequences
+    if not (os.path.exists(filename) or sequences.is_pattern(filename)):
         raise FileNotFoundError(filename)
-    cap = cv2.VideoCapture(filename)
+    cap = decoders.open_capture(filename)
     test = cap.set(cv2.CAP_PROP_POS_AVI_RATIO, 1.0)
     if not test:
         raise ValueError('File is not a video: `%s`' % filename)
@@ -33,8 +36,69 @@ def video_max_frame(filename: str) -> int:
     cap.release()
     return value
 
+def cache_path(*parts: str) -> str:
+    """Path within the videotracker cache directory
+
+    The cache directory is $VIDEOTRACKER_CACHE, or videotracker in
+    $XDG_CACHE_HOME (by default ~/.cache). Directories leading up to the path
+    are created.
+    """
+    root = os.environ.get('VIDEOTRACKER_CACHE') or os.path.join(
+        os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+        'videotracker'
+    )
+    path = os.path.join(root, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+def file_key(file_name: str, *extra) -> str:
+    """A short hash identifying a file by path, size and modification time
+
+    Extra values (e.g. parameters) are included in the hash. Image sequences
+    (see sequences) are identified by all of their files.
+    """
+    if os.path.isfile(file_name):
+        stat = os.stat(file_name)
+        identity = (os.path.abspath(file_name), stat.st_size, stat.st_mtime_ns) + extra
+    else:
+        from . import sequences
+        stats = [(name, os.stat(name)) for name in sequences.sequence_files(file_name)]
+        if not stats:
+            raise FileNotFoundError(file_name)
+        identity = (os.path.abspath(file_name),) + tuple(
+            (name, stat.st_size, stat.st_mtime_ns) for name, stat in stats) + extra
+    return hashlib.sha1(repr(identity).encode()).hexdigest()[:16]
+
+def buffers(value) -> dict:
+    """Arrays holding the data of value (an array, or lists of arrays) by id
+
+    Views are traced back to the array they view, so that shared data counts
+    once. Views of memory-mapped files count on their own, as only the part
+    of a file that is viewed is read.
+    """
+    import numpy as np
+    if isinstance(value, (list, tuple)):
+        found = {}
+        for item in value:
+            found.update(buffers(item))
+        return found
+    if not hasattr(value, 'nbytes'):
+        return {}
+    while (getattr(value, 'base', None) is not None and hasattr(value.base, 'nbytes')
+           and not isinstance(value.base, np.memmap)):
+        value = value.base
+    return {id(value): value.nbytes}
+
+def nbytes(*values) -> int:
+    """Bytes of array data held by values, counting shared data once"""
+    found = {}
+    for value in values:
+        found.update(buffers(value))
+    return sum(found.values())
+
 def change_cursor(value: bool):
     """Changes cursor for the app. When true changes to hourglass, when false to normal"""
+    from PyQt5 import QtWidgets, QtCore
     if value:
         QtWidgets.qApp.setOverrideCursor(QtCore.Qt.WaitCursor)
     else:
@@ -43,16 +107,19 @@ def change_cursor(value: bool):
 def get_image(file_handle):
     """Attempts to read an image from file_handle in several ways
 
-    First reads images with cv2.imread. If that fails, tries cv2.VideoCapture.
+    First reads images with cv2.imread. If that fails, tries the decoder of
+    the session (see decoders).
     raises ValueError if that fails, else returns first image from video or
     just the image.
     """
+    import cv2
+    from . import decoders
     if not os.path.exists(file_handle):
         raise FileNotFoundError
     img = cv2.imread(file_handle)
     if img is not None:
         return img
-    cap = cv2.VideoCapture(file_handle)
+    cap = decoders.open_capture(file_handle)
     ok, img = cap.read() # pylint: disable=invalid-name # This name is fine
     cap.release()
     if ok:
@@ -0,0 +1,281 @@
+"""Live metrics of runs
+
+Runs report what they do to the metrics collector of their process (see
+`collector`): frames read and processed, time spent per stage and frame, queue
+depths, dropped and skipped frames, cache hits and misses. Throughput and
+resident memory are added when metrics are exported.
+
+Metrics are exported continuously, in the Prometheus text format by a local
+HTTP server (`serve`), or as JSON lines appended to a file at regular
+intervals (`JsonLinesSink`). Batches gather the metrics of their worker
+processes (see `Reporter`) in the collector of the batch, labelled by worker.
+"""
+
+import collections
+import http.server
+import json
+import os
+import sys
+import threading
+import time
+
+PREFIX = 'videotracker_'
+WINDOW = 10.0 # Seconds over which throughput is measured
+
+# Type and help of every metric
+METRICS = {
+    'frames': ('counter', 'Frames processed'),
+    'frames_read': ('counter', 'Frames read from videos'),
+    'skipped_frames': ('counter', 'Static frames skipped by the motion gate'),
+    'dropped_frames': ('counter', 'Processed frames that were not displayed'),
+    'stage_seconds': ('summary', 'Seconds spent per frame in a stage'),
+    'queue_depth': ('gauge', 'Items waiting in a queue'),
+    'cache_hits': ('counter', 'Cache hits'),
+    'cache_misses': ('counter', 'Cache misses'),
+    'jobs': ('gauge', 'Batch jobs by state'),
+    'frames_per_second': ('gauge', f'Frames processed per second over the last {WINDOW:.0f} s'),
+    'resident_memory_bytes': ('gauge', 'Resident memory of the process'),
+}
+
+def resident_memory() -> int:
+    """Resident memory of this process in bytes, or None if unknown
+
+    Where /proc is missing, this is the peak resident memory.
+    """
+    try:
+        with open('/proc/self/statm') as handle:
+            return int(handle.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError: # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def family(name: str) -> str:
+    """Exported name of metric name, as in Prometheus"""
+    return PREFIX + name + ('_total' if METRICS[name][0] == 'counter' else '')
+
+class Metrics:
+    """Thread safe collection of counters, gauges and summaries
+
+    Metrics are named as in METRICS and told apart by labels, given as
+    keyword arguments.
+    """
+
+    def __init__(self):
+        self.values = {}
+        self.workers = {}
+        self.frames = 0 # Frames processed by this process
+        self.worker_frames = {}
+        self.history = collections.deque() # (time, frames), for the throughput
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """Adds value to counter name"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + value
+            if name == 'frames':
+                self.frames += value
+                self.note_frames()
+
+    def set(self, name: str, value: float, **labels):
+        """Sets gauge name to value"""
+        with self._lock:
+            self.values[name, tuple(sorted(labels.items()))] = value
+
+    def observe(self, name: str, seconds: float, **labels):
+        """Adds a duration to summary name"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            count, total = self.values.get(key, (0, 0.0))
+            self.values[key] = (count + 1, total + seconds)
+
+    def note_frames(self):
+        """Notes the number of frames processed so far, for the throughput
+
+        Called with the lock held.
+        """
+        now = time.monotonic()
+        frames = self.frames + sum(self.worker_frames.values())
+        # The first count is kept apart, as a start to measure from.
+        if len(self.history) < 2 or now - self.history[-1][0] >= 0.5:
+            self.history.append((now, frames))
+        else:
+            self.history[-1] = (self.history[-1][0], frames)
+        self.prune(now)
+
+    def prune(self, now: float):
+        """Forgets frame counts older than WINDOW seconds, apart from the latest"""
+        while len(self.history) > 1 and now - self.history[0][0] > WINDOW:
+            self.history.popleft()
+
+    def throughput(self) -> float:
+        """Frames per second over the last WINDOW seconds"""
+        with self._lock:
+            now = time.monotonic()
+            self.prune(now)
+            if not self.history:
+                return 0.0
+            (start, first), (_, last) = self.history[0], self.history[-1]
+        return (last - first) / (now - start) if now > start else 0.0
+
+    def merge(self, worker, samples: list):
+        """Takes the samples of a worker process, replacing its earlier ones"""
+        worker = str(worker)
+        with self._lock:
+            self.workers[worker] = samples
+            self.worker_frames[worker] = sum(value for name, _, _, value in samples
+                                             if name == 'frames')
+            self.note_frames()
+
+    def samples(self) -> list:
+        """All samples as (metric, sample name, labels, value)
+
+        Summaries give two samples, the count and the sum. Samples of worker
+        processes have a worker label.
+        """
+        with self._lock:
+            values = dict(self.values)
+            workers = dict(self.workers)
+        result = []
+        for (name, labels), value in sorted(values.items()):
+            labels = dict(labels)
+            if METRICS[name][0] == 'summary':
+                result.append((name, family(name) + '_count', labels, value[0]))
+                result.append((name, family(name) + '_sum', labels, value[1]))
+            else:
+                result.append((name, family(name), labels, value))
+        result.append(('frames_per_second', family('frames_per_second'), {}, self.throughput()))
+        memory = resident_memory()
+        if memory is not None:
+            result.append(('resident_memory_bytes', family('resident_memory_bytes'), {}, memory))
+        for worker, worker_samples in sorted(workers.items()):
+            result.extend((name, sample, dict(labels, worker=worker), value)
+                          for name, sample, labels, value in worker_samples)
+        return result
+
+    def snapshot(self) -> dict:
+        """The current samples, by sample name, for JSON"""
+        return {
+            'time': time.time(),
+            'metrics': [{'name': sample, 'labels': labels, 'value': value}
+                        for _, sample, labels, value in self.samples()],
+        }
+
+    def prometheus(self) -> str:
+        """The current samples in the Prometheus text format"""
+        by_metric = {}
+        for name, sample, labels, value in self.samples():
+            by_metric.setdefault(name, []).append((sample, labels, value))
+        lines = []
+        for name, samples in by_metric.items():
+            kind, description = METRICS[name]
+            lines.append(f'# HELP {family(name)} {description}')
+            lines.append(f'# TYPE {family(name)} {kind}')
+            for sample, labels, value in samples:
+                text = ','.join(
+                    '{}="{}"'.format(label, str(label_value).replace('\\', '\\\\')
+                                     .replace('"', '\\"').replace('\n', '\\n'))
+                    for label, label_value in sorted(labels.items())
+                )
+                lines.append(f'{sample}{{{text}}} {value!r}' if text else f'{sample} {value!r}')
+        return '\n'.join(lines) + '\n'
+
+_COLLECTOR = Metrics()
+
+def collector() -> Metrics:
+    """The metrics collector of this process"""
+    return _COLLECTOR
+
+def reset():
+    """Starts this process's metrics afresh, as worker processes do after forking"""
+    global _COLLECTOR # pylint: disable=global-statement
+    _COLLECTOR = Metrics()
+
+def serve(port: int, host: str = '127.0.0.1', metrics: Metrics = None):
+    """Serves metrics in the Prometheus text format at http://host:port/metrics
+
+    The server runs in a daemon thread; its shutdown method stops it.
+    Without metrics, the collector of the process is served.
+    """
+    class Handler(http.server.BaseHTTPRequestHandler):
+        """Answers requests for /metrics"""
+
+        def do_GET(self):
+            """Sends the metrics"""
+            # pylint: disable=invalid-name
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = (metrics or collector()).prometheus().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args): # pylint: disable=arguments-differ
+            """Requests are not logged"""
+
+    server = http.server.ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name='MetricsServerThread',
+                     daemon=True).start()
+    return server
+
+class JsonLinesSink(threading.Thread):
+    """Appends a snapshot of the metrics to a file every interval seconds
+
+    Every line is a JSON object with the time and the samples (see
+    Metrics.snapshot). `close` writes a last snapshot and stops the thread.
+    """
+
+    def __init__(self, file_name: str, interval: float = 10.0, metrics: Metrics = None):
+        super().__init__(name='MetricsSinkThread', daemon=True)
+        self.file_name = file_name
+        self.interval = interval
+        self.metrics = metrics
+        self._finish = threading.Event()
+
+    def write(self):
+        """Appends a snapshot"""
+        line = json.dumps((self.metrics or collector()).snapshot())
+        with open(self.file_name, 'a') as handle:
+            handle.write(line + '\n')
+
+    def run(self):
+        while not self._finish.wait(self.interval):
+            self.write()
+
+    def close(self):
+        """Writes a last snapshot and stops"""
+        self._finish.set()
+        if self.is_alive():
+            self.join()
+        self.write()
+
+class Reporter(threading.Thread):
+    """Hands the samples of this process to send(worker, samples) regularly
+
+    Worker processes report to the process that collects their metrics, for
+    instance through a multiprocessing queue. `report` reports straight away.
+    """
+
+    def __init__(self, send, interval: float = 5.0):
+        super().__init__(name='MetricsReporterThread', daemon=True)
+        self.send = send
+        self.interval = interval
+
+    def report(self):
+        """Sends the current samples, without the derived ones of this process"""
+        samples = [sample for sample in collector().samples()
+                   if sample[0] != 'frames_per_second']
+        self.send(os.getpid(), samples)
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            self.report()
@@ -0,0 +1,124 @@
+"""Output writers
+
+Writers take the results of a run and put them into files. They run in their
+own thread, so that slow disks (network filesystems in particular) do not
+stall the computation.
+"""
+
+import csv
+import io
+import os
+import queue
+import threading
+import time
+
+from .contours import FEATURES
+
+class CsvWriter(threading.Thread):
+    """Writes features to a CSV file in a background thread
+
+    Features are handed over one frame at a time with `write`. The writer
+    thread formats them in bulk and writes them out once `buffer_size` rows
+    have accumulated or `flush_interval` seconds have passed since the last
+    flush, whichever comes first. `close` flushes the remaining rows, closes
+    the file and waits for the thread to finish.
+
+    With append, rows are added to the end of an existing file, without a
+    new header. `sync` waits until all queued rows are on disk.
+
+    Exceptions in the writer thread are raised again by `close`.
+    """
+
+    def __init__(self, file_name: str, fields=FEATURES,
+                 buffer_size: int = 1000, flush_interval: float = 1.0,
+                 append: bool = False):
+        super().__init__(name='CsvWriterThread', daemon=True)
+        self.file_name = file_name
+        self.fields = list(fields)
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.append = append
+        self.rows_written = 0
+        self.size = 0
+        self.error = None
+        self._queue = queue.Queue()
+
+    def write(self, frame: int, timestamp: float, features: list):
+        """Queues the features of a frame for writing"""
+        if self.error is not None:
+            raise self.error
+        self._queue.put((frame, timestamp, features))
+
+    def sync(self) -> int:
+        """Waits until all queued rows are written, returns the file size in bytes"""
+        done = threading.Event()
+        self._queue.put(done)
+        while not done.wait(0.1):
+            if not self.is_alive():
+                break
+        if self.error is not None:
+            raise self.error
+        return self.size
+
+    def close(self):
+        """Flushes all queued rows and closes the file"""
+        if self.is_alive():
+            self._queue.put(None)
+            self.join()
+        if self.error is not None:
+            raise self.error
+
+    def run(self):
+        """Collects batches from the queue and flushes them periodically"""
+        try:
+            with open(self.file_name, 'a' if self.append else 'w', newline='') as handle:
+                if not self.append:
+                    writer = csv.DictWriter(handle, fieldnames=self.fields,
+                                            extrasaction='ignore')
+                    writer.writeheader()
+                    handle.flush()
+                self.size = os.fstat(handle.fileno()).st_size
+                buffer = []
+                last_flush = time.monotonic()
+                while True:
+                    timeout = max(0, self.flush_interval - (time.monotonic() - last_flush))
+                    try:
+                        batch = self._queue.get(timeout=timeout)
+                    except queue.Empty:
+                        batch = ()
+                    if batch is None:
+                        break
+                    if isinstance(batch, threading.Event):
+                        self.flush(handle, buffer)
+                        buffer = []
+                        last_flush = time.monotonic()
+                        batch.set()
+                        continue
+                    if batch:
+                        buffer.append(batch)
+                    if (sum(len(features) for _, _, features in buffer) >= self.buffer_size
+                            or time.monotonic() - last_flush >= self.flush_interval):
+                        self.flush(handle, buffer)
+                        buffer = []
+                        last_flush = time.monotonic()
+                self.flush(handle, buffer)
+        except Exception as error: # pylint: disable=broad-except
+            # Kept for the thread that owns the writer.
+            self.error = error
+
+    def flush(self, handle, batches):
+        """Formats batches of features and writes them to handle in one go"""
+        if not batches:
+            return
+        text = io.StringIO()
+        writer = csv.DictWriter(text, fieldnames=self.fields, extrasaction='ignore')
+        rows = [
+            dict(features, timestamp=timestamp, frame=frame)
+            for frame, timestamp, frame_features in batches
+            for features in frame_features
+        ]
+        writer.writerows(rows)
+        handle.write(text.getvalue())
+        handle.flush()
+        self.rows_written += len(rows)
+        self.size = os.fstat(handle.fileno()).st_size
@@ -0,0 +1,141 @@
+"""Execution of stacks without Qt
+
+A Pipeline runs the operations (see functions.ops) of a stack's functions
+frame by frame, following the stack's method graph. It needs no widgets and no
+threads, so it can be used from batch jobs and worker processes.
+
+Pipelines are built from stack descriptions: plain dictionaries as returned by
+segmentations.BaseStack.describe, with the keys
+
+    stack         Name of the stack class
+    methods       For every method of the stack, the name of its function
+    method_graph  The stack's method graph
+    values        For every method, the values of its parameters
+    rois          Polygons of the regions of interest
+    gate          Threshold of the motion gate, or None
+"""
+
+import json
+import time
+
+from . import roi
+from .functions.ops import OPERATIONS
+
+ALIASES = {'input_image': 'INPUT', 'output_image': 'IMAGE', 'output_data': 'DATA'}
+
+class Pipeline:
+    """A stack's functions executed frame by frame without widgets
+
+    Calling a pipeline with a frame returns a dictionary with the stack's
+    output image ('image') and output data ('data'), as far as the stack has
+    them. Only outputs that are asked for (by kinds) are computed.
+
+    Pipelines that differ only in some values can share a dictionary shared
+    for a frame: the results of methods whose values, and whose upstream
+    methods' values, are the same (see signature) are then computed once for
+    all of them. The time each result took is kept in shared as well.
+    """
+
+    def __init__(self, methods: dict, method_graph: dict, values: dict,
+                 rois=(), in_file: str = None, shared: dict = None):
+        self.method_graph = {ALIASES.get(edge, edge): end for edge, end in method_graph.items()}
+        self.operations = {name: OPERATIONS[function] for name, function in methods.items()}
+        self.states = {
+            name: operation.function() for name, operation in self.operations.items()
+            if operation.stateful
+        }
+        self.values = values
+        self.region = roi.Region(rois)
+        self.context = {'region': self.region, 'in_file': in_file}
+        self.image = None
+        self.results = {}
+        self.shared = shared
+        self.metrics = None # Collector of stage times (see metrics), if any
+
+    @classmethod
+    def from_description(cls, description: dict, in_file: str = None):
+        """Builds a pipeline from a stack description"""
+        return cls(description['methods'], description['method_graph'],
+                   description['values'], description.get('rois', ()), in_file)
+
+    def sources(self, name: str) -> tuple:
+        """Sources of the inputs of method name"""
+        end = self.method_graph[name]
+        return tuple(end) if isinstance(end, (tuple, list)) else (end,)
+
+    def output(self, source: str, kind: str):
+        """The output of kind ('image' or 'data') of source for the current frame"""
+        source = ALIASES.get(source, source)
+        if source == 'INPUT':
+            return self.image
+        return self.evaluate(source)[self.operations[source].outputs.index(kind)]
+
+    def signature(self, name: str) -> str:
+        """Identifies the outputs of method name by all values they depend on
+
+        Outputs that depend on state (of stateful or lazy operations) have no
+        signature (None), as they cannot be shared.
+        """
+        operation = self.operations[name]
+        if operation.stateful or operation.lazy:
+            return None
+        upstream = []
+        for source in self.sources(name):
+            source = ALIASES.get(source, source)
+            upstream.append(source if source == 'INPUT' else self.signature(source))
+            if upstream[-1] is None:
+                return None
+        return json.dumps([name, self.values.get(name, {}), upstream], sort_keys=True)
+
+    def evaluate(self, name: str) -> tuple:
+        """Computes (once per frame) the outputs of method name"""
+        if name in self.results:
+            return self.results[name]
+        key = self.signature(name) if self.shared is not None else None
+        if key is not None:
+            if key not in self.shared:
+                # Inputs first, so that only this method is timed.
+                for source, kind in zip(self.sources(name), self.operations[name].inputs):
+                    self.output(source, kind)
+                start = time.perf_counter()
+                self.shared[key] = self.compute(name)
+                self.shared['time', key] = time.perf_counter() - start
+            self.results[name] = self.shared[key]
+            return self.results[name]
+        self.results[name] = self.compute(name)
+        return self.results[name]
+
+    def compute(self, name: str) -> tuple:
+        """Computes the outputs of method name"""
+        operation = self.operations[name]
+        pairs = list(zip(operation.inputs, self.sources(name)))
+        if operation.lazy:
+            inputs = [
+                self.output(source, kind) if kind == 'image'
+                else (lambda source=source, kind=kind: self.output(source, kind))
+                for kind, source in pairs
+            ]
+            # The image is passed on before the operation runs, so that
+            # methods it calls on may use it.
+            self.results[name] = (inputs[0], None)
+        else:
+            inputs = [self.output(source, kind) for kind, source in pairs]
+        function = self.states.get(name, operation.function)
+        context = {key: self.context[key] for key in operation.context}
+        start = time.perf_counter()
+        result = function(*inputs, **self.values.get(name, {}), **context)
+        if self.metrics is not None:
+            # Lazy operations include the time of the methods they call on.
+            self.metrics.observe('stage_seconds', time.perf_counter() - start, stage=name)
+        if len(operation.outputs) == 1:
+            result = (result,)
+        return tuple(result)
+
+    def __call__(self, frame, kinds=('image', 'data')) -> dict:
+        self.results = {}
+        self.image = self.region.crop(frame)
+        edges = {'image': 'IMAGE', 'data': 'DATA'}
+        return {
+            kind: self.output(self.method_graph[edges[kind]], kind)
+            for kind in kinds if edges[kind] in self.method_graph
+        }
@@ -0,0 +1,279 @@
+"""Registry of stacks and functions
+
+Stacks and functions are found in three places, in this order:
+
+- the built-in modules segmentations and functions.functions,
+- entry points of installed packages, in the groups videotracker.stacks and
+  videotracker.functions (for instance `my_stack = my_package.stacks:MyStack`),
+- python files in the plugin directories: $VIDEOTRACKER_PLUGINS (a list of
+  directories separated like PATH), or videotracker/plugins in
+  $XDG_DATA_HOME (by default ~/.local/share).
+
+Plugins found later replace plugins of the same kind and name found earlier.
+
+Finding plugins does not import them. Their source is parsed instead, which
+gives their name, description and parameters: the methods of a stack and the
+parameters of a function. A plugin is imported when it is loaded, and only
+the module it is in. A plugin module may define OPERATIONS (see
+functions.ops), which are added to the known operations when it is loaded,
+so that its functions can be run without Qt (see pipeline).
+"""
+
+import ast
+import glob
+import importlib
+import importlib.util
+import os
+import sys
+from dataclasses import dataclass, field
+
+GROUPS = {'stack': 'videotracker.stacks', 'function': 'videotracker.functions'}
+BUILTIN = {
+    'stack': 'videotracker.segmentations',
+    'function': 'videotracker.functions.functions',
+}
+# Class attributes marking a class as a stack or a function
+MARKERS = {'methods': 'stack', 'params': 'function'}
+
+@dataclass
+class Plugin:
+    """A stack or a function that can be loaded
+
+    For stacks, methods maps the stack's methods to the names of their
+    functions. For functions, params maps the function's parameters to their
+    type (as 'type') and the arguments of the parameter that are literals.
+    """
+    name: str
+    kind: str
+    module: str
+    attribute: str
+    path: str = None
+    origin: str = 'builtin'
+    description: str = ''
+    title: str = ''
+    methods: dict = field(default_factory=dict)
+    params: dict = field(default_factory=dict)
+
+    @property
+    def summary(self) -> str:
+        """First line of the description"""
+        return next(iter(self.description.splitlines()), '')
+
+    def load(self):
+        """Imports the plugin's module and returns the plugin"""
+        if self.module in sys.modules:
+            module = sys.modules[self.module]
+        elif self.origin == 'directory':
+            spec = importlib.util.spec_from_file_location(self.module, self.path)
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[self.module] = module
+            try:
+                spec.loader.exec_module(module)
+            except BaseException:
+                del sys.modules[self.module]
+                raise
+        else:
+            module = importlib.import_module(self.module)
+        if self.origin != 'builtin' and hasattr(module, 'OPERATIONS'):
+            from .functions import ops
+            ops.OPERATIONS.update(module.OPERATIONS)
+        obj = module
+        for part in self.attribute.split('.'):
+            obj = getattr(obj, part)
+        return obj
+
+def literal(node: ast.AST, default=None):
+    """The value of node, if it is a literal"""
+    try:
+        return ast.literal_eval(node)
+    except ValueError:
+        return default
+
+def name_of(node: ast.AST) -> str:
+    """The name node refers to, as in `name` or `module.name`"""
+    if isinstance(node, ast.Attribute):
+        return node.attr
+    if isinstance(node, ast.Name):
+        return node.id
+    return None
+
+def describe_class(node: ast.ClassDef) -> dict:
+    """Kind, title, methods and params of the class defined by node"""
+    info = {'kind': None, 'title': '', 'methods': {}, 'params': {}}
+    for statement in node.body:
+        if isinstance(statement, ast.Assign) and len(statement.targets) == 1:
+            target, value = statement.targets[0], statement.value
+        elif isinstance(statement, ast.AnnAssign) and statement.value is not None:
+            target, value = statement.target, statement.value
+        else:
+            continue
+        attribute = name_of(target)
+        if attribute == 'title':
+            info['title'] = literal(value, '')
+        elif attribute in MARKERS and isinstance(value, ast.Dict):
+            info['kind'] = MARKERS[attribute]
+            entries = {}
+            for key, item in zip(value.keys, value.values):
+                key = literal(key) if key is not None else None
+                if not isinstance(key, str):
+                    continue
+                if attribute == 'methods':
+                    entries[key] = name_of(item)
+                elif isinstance(item, ast.Call):
+                    entries[key] = {'type': name_of(item.func)}
+                    for keyword in item.keywords:
+                        argument = literal(keyword.value, Ellipsis)
+                        if keyword.arg is not None and argument is not Ellipsis:
+                            entries[key][keyword.arg] = argument
+            info[attribute] = entries
+    return info
+
+def scan_source(source: str, module: str, path: str = None, origin: str = 'builtin') -> list:
+    """Plugins defined in the python source of module
+
+    Classes are stacks if they set methods, functions if they set params, and
+    otherwise take after a plugin they inherit from in the same source.
+    Classes whose names start with Base are abstract and skipped.
+    """
+    found = {}
+    for node in ast.parse(source, path or module).body:
+        if not isinstance(node, ast.ClassDef):
+            continue
+        info = describe_class(node)
+        parent = next((found[name_of(base)] for base in node.bases if name_of(base) in found),
+                      None)
+        if info['kind'] is None and parent is None:
+            continue
+        plugin = Plugin(
+            name=node.name, kind=info['kind'] or parent.kind, module=module,
+            attribute=node.name, path=path, origin=origin,
+            description=ast.get_docstring(node) or '',
+            title=info['title'] or (parent.title if parent else ''),
+            methods=info['methods'] or (dict(parent.methods) if parent else {}),
+            params=info['params'] or (dict(parent.params) if parent else {}),
+        )
+        found[node.name] = plugin
+    return [plugin for name, plugin in found.items() if not name.startswith('Base')]
+
+def scan_file(path: str, module: str, origin: str) -> list:
+    """Plugins defined in the python file path"""
+    with open(path, encoding='utf-8') as handle:
+        return scan_source(handle.read(), module, path, origin)
+
+def module_path(module: str) -> str:
+    """Source file of module, found without importing it
+
+    Packages containing module are imported, as python needs them to find it.
+    """
+    spec = importlib.util.find_spec(module)
+    if spec is None or not spec.has_location:
+        return None
+    return spec.origin
+
+def entry_points(group: str) -> list:
+    """Entry points of installed packages in group"""
+    try:
+        from importlib import metadata
+    except ImportError: # Python < 3.8
+        return []
+    points = metadata.entry_points()
+    if hasattr(points, 'select'):
+        return list(points.select(group=group))
+    return list(points.get(group, ()))
+
+def plugin_dirs() -> list:
+    """Directories searched for plugin files"""
+    if os.environ.get('VIDEOTRACKER_PLUGINS'):
+        return [path for path in os.environ['VIDEOTRACKER_PLUGINS'].split(os.pathsep) if path]
+    return [os.path.join(
+        os.environ.get('XDG_DATA_HOME') or os.path.expanduser('~/.local/share'),
+        'videotracker', 'plugins'
+    )]
+
+class Registry:
+    """Stacks and functions by kind and name
+
+    A new registry holds the built-in plugins, those of entry points and
+    those in the plugin directories. add_file adds the plugins of other
+    files.
+    """
+
+    def __init__(self, dirs: list = None):
+        self.plugins = {kind: {} for kind in GROUPS}
+        self.errors = {}
+        package = os.path.dirname(os.path.abspath(__file__))
+        for kind, module in BUILTIN.items():
+            path = os.path.join(package, *module.split('.')[1:]) + '.py'
+            self.add(plugin for plugin in scan_file(path, module, 'builtin')
+                     if plugin.kind == kind)
+        for kind, group in GROUPS.items():
+            for point in entry_points(group):
+                self.add_entry_point(kind, point)
+        for directory in plugin_dirs() if dirs is None else dirs:
+            for path in sorted(glob.glob(os.path.join(directory, '*.py'))):
+                self.add_file(path)
+
+    def add(self, plugins):
+        """Adds plugins, replacing those of the same kind and name"""
+        for plugin in plugins:
+            self.plugins[plugin.kind][plugin.name] = plugin
+
+    def add_entry_point(self, kind: str, point):
+        """Adds the plugin named by an entry point"""
+        module, _, attribute = point.value.partition(':')
+        module, attribute = module.strip(), attribute.strip()
+        plugin = Plugin(point.name, kind, module, attribute or point.name, origin='entry point')
+        try:
+            plugin.path = module_path(module)
+            if plugin.path is not None:
+                described = {found.attribute: found
+                             for found in scan_file(plugin.path, module, plugin.origin)}
+                if attribute in described:
+                    found = described[attribute]
+                    plugin.description, plugin.title = found.description, found.title
+                    plugin.methods, plugin.params = found.methods, found.params
+        except (ImportError, OSError, SyntaxError) as error:
+            # The plugin stays loadable; loading it reports the problem.
+            self.errors[point.value] = error
+        self.add([plugin])
+
+    def add_file(self, path: str) -> list:
+        """Adds the plugins in the python file path and returns them
+
+        Files that cannot be parsed are recorded in errors.
+        """
+        path = os.path.abspath(path)
+        stem = os.path.splitext(os.path.basename(path))[0]
+        try:
+            plugins = scan_file(path, f'videotracker_plugin_{stem}', 'directory')
+        except (OSError, SyntaxError, UnicodeDecodeError) as error:
+            self.errors[path] = error
+            return []
+        self.add(plugins)
+        return plugins
+
+    def stacks(self) -> dict:
+        """Stack plugins by name"""
+        return self.plugins['stack']
+
+    def functions(self) -> dict:
+        """Function plugins by name"""
+        return self.plugins['function']
+
+    def load(self, kind: str, name: str):
+        """Loads the plugin of kind called name
+
+        Raises a KeyError if there is no such plugin.
+        """
+        if name not in self.plugins[kind]:
+            raise KeyError('No %s called `%s`' % (kind, name))
+        return self.plugins[kind][name].load()
+
+_REGISTRY = None
+
+def registry(refresh: bool = False) -> Registry:
+    """The registry of plugins, searched for on first use"""
+    global _REGISTRY # pylint: disable=global-statement
+    if _REGISTRY is None or refresh:
+        _REGISTRY = Registry()
+    return _REGISTRY
@@ -0,0 +1,85 @@
+"""Quick previews on downscaled frames
+
+While parameters are being changed, a Preview runs the stack on a downscaled
+copy of the frame, so that results show up straight away even for large
+frames. Values measured in pixels (see functions.ops.Operation.scaled) are
+scaled to match, and contours are scaled back to frame coordinates.
+"""
+
+import numpy as np
+
+import cv2
+
+from .functions.ops import OPERATIONS
+from .pipeline import Pipeline
+
+def scale_value(value, factor: float, dimension: int):
+    """value (a length or an area) scaled by factor
+
+    Odd lengths stay odd and lengths of at least 3 stay at least 3, as
+    OpenCV needs for kernel and block sizes.
+    """
+    if not value:
+        return value
+    scaled = value * factor ** dimension
+    if not isinstance(value, int):
+        return scaled
+    scaled = max(1, int(round(scaled)))
+    if dimension == 1 and value % 2:
+        scaled |= 1
+        scaled = max(scaled, min(value, 3))
+    return scaled
+
+def scale_values(methods: dict, values: dict, factor: float) -> dict:
+    """values of methods (as in a stack description) scaled by factor"""
+    return {
+        method: {
+            param: scale_value(value, factor, OPERATIONS[methods[method]].scaled[param])
+            if param in OPERATIONS[methods[method]].scaled else value
+            for param, value in values.get(method, {}).items()
+        }
+        for method in methods
+    }
+
+class Preview:
+    """Runs a stack description on frames downscaled to at most max_pixels
+
+    Calling a preview with a frame and the name of a view (a method with an
+    output image, or 'input') returns the view's image, the size in frame
+    pixels that image stands for and the stack's output data in frame
+    coordinates.
+    """
+
+    def __init__(self, description: dict, in_file: str = None, max_pixels: int = 640 * 360):
+        self.description = description
+        self.in_file = in_file
+        self.max_pixels = max_pixels
+
+    def factor(self, frame: np.ndarray) -> float:
+        """Scale factor for frame"""
+        height, width = frame.shape[:2]
+        return min(1.0, (self.max_pixels / (height * width)) ** 0.5)
+
+    def __call__(self, frame: np.ndarray, view: str = 'input') -> dict:
+        description = self.description
+        factor = self.factor(frame)
+        small = frame
+        if factor < 1:
+            small = cv2.resize(frame, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA)
+        rois = [[[x * factor, y * factor] for x, y in polygon]
+                for polygon in description.get('rois', [])]
+        pipeline = Pipeline(description['methods'], description['method_graph'],
+                            scale_values(description['methods'], description['values'], factor),
+                            rois, self.in_file)
+        result = pipeline(small, kinds=('data',))
+        data = result.get('data')
+        if data is not None and factor < 1:
+            data = [np.rint(contour / factor).astype(np.int32) for contour in data]
+        if view == 'input':
+            image = frame
+        else:
+            image = pipeline.output(view, 'image')
+        height, width = image.shape[:2]
+        if image is not frame:
+            height, width = int(round(height / factor)), int(round(width / factor))
+        return {'image': image, 'size': (width, height), 'data': data}
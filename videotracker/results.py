@@ -0,0 +1,250 @@
+"""Cache of segmentation results
+
+Results are cached on disk by the content of the video and the complete stack
+description, so running the same configuration over the same video again (or
+over part of it) reads contours from the cache instead of segmenting. Videos
+are identified by a fingerprint of sampled blocks of their content, so renamed
+or copied videos still hit the cache.
+
+Results are cached in chunks of CHUNK frames. Only missing chunks are computed.
+Like checkpoints (see checkpoint), chunks keep the state that later frames
+depend on (stateful operations, the motion gate) as it is at their end. A
+chunk is computed from the state at the end of the chunk before it, so results
+are the same as those of an uncached run. For descriptions with state, the
+missing chunks before a chunk are computed first.
+
+The cache has a size limit. When it is exceeded, the least recently used
+chunks are removed.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import threading
+
+import cv2
+
+from . import decoders, gating, helpers, metrics, sequences, spec
+from .runner import seek
+
+CHUNK = 500
+VERSION = 2 # Format of chunks, part of their key
+
+_FINGERPRINTS = {}
+
+def fingerprint(file_name: str, blocks: int = 16, block_size: int = 1 << 16) -> str:
+    """A hash of the size and of blocks evenly spaced blocks of file_name
+
+    Much faster than hashing the whole file, while telling apart any two
+    videos in practice. Image sequences are fingerprinted by the sizes of
+    their files and blocks of their first, middle and last file.
+    """
+    key = helpers.file_key(file_name)
+    if key not in _FINGERPRINTS and not os.path.isfile(file_name):
+        files = sequences.sequence_files(file_name)
+        digest = hashlib.sha1(repr([os.path.getsize(name) for name in files]).encode())
+        for name in {files[0], files[len(files) // 2], files[-1]}:
+            digest.update(fingerprint(name, 4, block_size).encode())
+        _FINGERPRINTS[key] = digest.hexdigest()
+    if key not in _FINGERPRINTS:
+        size = os.path.getsize(file_name)
+        digest = hashlib.sha1(str(size).encode())
+        with open(file_name, 'rb') as handle:
+            for index in range(blocks):
+                handle.seek(max(0, size - block_size) * index // max(1, blocks - 1))
+                digest.update(handle.read(block_size))
+        _FINGERPRINTS[key] = digest.hexdigest()
+    return _FINGERPRINTS[key]
+
+class ResultsCache:
+    """On-disk cache of per frame contours, limited to max_bytes
+
+    Entries live in the results directory of the cache (see
+    helpers.cache_path). `frames` gives the results of a run, computing only
+    what is not cached yet.
+    """
+
+    def __init__(self, max_bytes: int = 1 << 30):
+        self.max_bytes = max_bytes
+        self.root = os.path.dirname(helpers.cache_path('results', ''))
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(in_file: str, description: dict) -> str:
+        """Key of the results of description over in_file
+
+        Backends may decode slightly different images, so the decoder backend
+        is part of the key.
+        """
+        identity = json.dumps([fingerprint(in_file), description, decoders.current()[0],
+                               VERSION], sort_keys=True)
+        return hashlib.sha1(identity.encode()).hexdigest()
+
+    def chunk_file(self, key: str, index: int) -> str:
+        """File of the index-th chunk of the results with key"""
+        return os.path.join(self.root, key, '%08d.pkl' % index)
+
+    def load(self, key: str, index: int) -> dict:
+        """A cached chunk, or None"""
+        file_name = self.chunk_file(key, index)
+        try:
+            with open(file_name, 'rb') as handle:
+                chunk = pickle.load(handle)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        # The modification time doubles as the time of last use.
+        try:
+            os.utime(file_name)
+        except FileNotFoundError:
+            # Evicted by another process meanwhile.
+            pass
+        return chunk
+
+    def save(self, key: str, index: int, chunk: dict):
+        """Caches a chunk, then keeps the cache within its size limit
+
+        Processes share the cache, so chunks are written under names of their
+        own first.
+        """
+        file_name = self.chunk_file(key, index)
+        part = f'{file_name}.{os.getpid()}.{threading.get_ident()}.part'
+        while True:
+            os.makedirs(os.path.dirname(file_name), exist_ok=True)
+            try:
+                handle = open(part, 'wb')
+            except FileNotFoundError:
+                # Another process evicted the last chunk of the directory.
+                continue
+            break
+        with handle:
+            pickle.dump(chunk, handle, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(part, file_name)
+        self.evict()
+
+    def evict(self):
+        """Removes least recently used chunks until the cache fits max_bytes
+
+        Chunks that other processes are writing are left alone, and chunks
+        they removed meanwhile are skipped.
+        """
+        entries = []
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                if name.endswith('.part'):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(directory, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, os.path.join(directory, name)))
+        total = sum(size for _, size, _ in entries)
+        for _, size, file_name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(file_name)
+            except FileNotFoundError:
+                pass
+            total -= size
+            try:
+                os.rmdir(os.path.dirname(file_name))
+            except OSError:
+                # Other chunks of the same results are left.
+                pass
+
+    @staticmethod
+    def stateful(in_file: str, description: dict) -> bool:
+        """Whether results of description depend on the frames before them"""
+        return description.get('gate') is not None or bool(spec.build(description, in_file).states)
+
+    def compute(self, in_file: str, description: dict, index: int, state: dict = None) -> dict:
+        """Runs description over the index-th chunk of in_file
+
+        A chunk holds a list of (frame, timestamp, contours), whether the
+        video ended within the chunk, and the state at its end. state is the
+        state at the end of the chunk before, if any.
+        """
+        pipeline = spec.build(description, in_file)
+        pipeline.metrics = metrics.collector()
+        gate = None
+        if description.get('gate') is not None:
+            gate = gating.MotionGate(description['gate'])
+        data = None
+        if state is not None:
+            pipeline.states, gate, data = state['states'], state['gate'], state['data']
+        capture = decoders.open_capture(in_file)
+        if not capture.isOpened():
+            raise ValueError('File is not readable by the decoder: `%s`' % in_file)
+        frames = []
+        last = False
+        try:
+            try:
+                seek(capture, index * CHUNK)
+            except ValueError:
+                return {'frames': frames, 'last': True, 'state': None}
+            for frame_number in range(index * CHUNK + 1, (index + 1) * CHUNK + 1):
+                exists, frame = capture.read()
+                if not exists:
+                    last = True
+                    break
+                timestamp = capture.get(cv2.CAP_PROP_POS_MSEC)
+                if gate is None or gate(frame):
+                    data = pipeline(frame, kinds=('data',)).get('data')
+                if data is not None:
+                    frames.append((frame_number, timestamp, data))
+        finally:
+            capture.release()
+        return {'frames': frames, 'last': last,
+                'state': {'states': pipeline.states, 'gate': gate, 'data': data}}
+
+    def chunk(self, key: str, in_file: str, description: dict, index: int,
+              stateful: bool) -> dict:
+        """The index-th chunk, from the cache or computed
+
+        With stateful, missing chunks before it are computed first, as each
+        chunk starts from the state at the end of the chunk before.
+        """
+        chunk = self.load(key, index)
+        if chunk is not None:
+            self.hits += 1
+            metrics.collector().inc('cache_hits', cache='results')
+            return chunk
+        missing = [index]
+        previous = None
+        while stateful and missing[-1] > 0:
+            previous = self.load(key, missing[-1] - 1)
+            if previous is not None:
+                break
+            missing.append(missing[-1] - 1)
+        for number in reversed(missing):
+            self.misses += 1
+            metrics.collector().inc('cache_misses', cache='results')
+            if previous is not None and previous['last']:
+                # The video ended before this chunk.
+                chunk = {'frames': [], 'last': True, 'state': None}
+            else:
+                chunk = self.compute(in_file, description, number,
+                                     previous['state'] if previous is not None else None)
+            self.save(key, number, chunk)
+            previous = chunk
+        return chunk
+
+    def frames(self, in_file: str, description: dict, start: int = 1, stop: int = None):
+        """Yields frame number, timestamp and contours for frames start to stop
+
+        Frames are numbered from 1, stop is included. Without stop, frames up
+        to the end of the video are given.
+        """
+        key = self.key(in_file, description)
+        stateful = self.stateful(in_file, description)
+        index = (start - 1) // CHUNK
+        while stop is None or index * CHUNK < stop:
+            chunk = self.chunk(key, in_file, description, index, stateful)
+            for frame in chunk['frames']:
+                if start <= frame[0] and (stop is None or frame[0] <= stop):
+                    yield frame
+            if chunk['last']:
+                break
+            index += 1
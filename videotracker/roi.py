@@ -0,0 +1,75 @@
+"""Regions of interest
+
+A region of interest consists of one or more polygons in frame coordinates.
+Processing is restricted to the bounding box of all polygons, and detections
+whose centroid lies outside of every polygon are dropped.
+"""
+
+from typing import Tuple
+
+import numpy as np
+
+import cv2
+
+from .contours import contour_centroid
+
+class Region:
+    """Region of interest made of polygons
+
+    An empty region covers the whole frame.
+    Polygons are given as sequences of (x, y) points. Polygons with fewer than
+    three points are ignored.
+    """
+
+    def __init__(self, polygons=()):
+        self.polygons = [
+            np.asarray(polygon, dtype=np.int32).reshape(-1, 2)
+            for polygon in polygons if len(polygon) >= 3
+        ]
+        if self.polygons:
+            left, top, width, height = cv2.boundingRect(np.concatenate(self.polygons))
+            self.box = (max(left, 0), max(top, 0),
+                        width + min(left, 0), height + min(top, 0))
+        else:
+            self.box = None
+
+    def __bool__(self):
+        return bool(self.polygons)
+
+    def __repr__(self):
+        return '<Region of {} polygons>'.format(len(self.polygons))
+
+    @property
+    def offset(self) -> Tuple[int, int]:
+        """Position (x, y) of the cropped image in the frame"""
+        if self.box is None:
+            return (0, 0)
+        return self.box[:2]
+
+    def crop(self, image: np.ndarray) -> np.ndarray:
+        """The part of the image within the bounding box of the region
+
+        This is a view of image, not a copy.
+        """
+        if self.box is None:
+            return image
+        left, top, width, height = self.box
+        return image[top:top+height, left:left+width]
+
+    def contains(self, contour: np.ndarray) -> bool:
+        """Is the centroid of contour (in frame coordinates) within the region?"""
+        if not self.polygons:
+            return True
+        centre = contour_centroid(contour)
+        return any(cv2.pointPolygonTest(polygon, centre, False) >= 0
+                   for polygon in self.polygons)
+
+    def select(self, contours: list) -> list:
+        """Contours (in frame coordinates) with their centroid within the region"""
+        if not self.polygons:
+            return contours
+        return [contour for contour in contours if self.contains(contour)]
+
+    def to_list(self) -> list:
+        """Polygons as lists of [x, y] points, suitable for serialisation"""
+        return [polygon.tolist() for polygon in self.polygons]
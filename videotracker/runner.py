@@ -0,0 +1,179 @@
+"""Runs of stacks over whole videos without a GUI"""
+
+import os
+import time
+
+import cv2
+
+from . import checkpoint, decoders, gating, metrics, outputs, spec, store
+from .contours import extract_features
+
+def seek(capture, frame_number: int):
+    """Positions capture so that the next frame read is frame_number + 1
+
+    Seeking is not exact for every codec. If the capture ends up elsewhere,
+    frames are grabbed from the start instead.
+    """
+    if not frame_number:
+        return
+    capture.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
+    if capture.get(cv2.CAP_PROP_POS_FRAMES) == frame_number:
+        return
+    capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+    for _ in range(frame_number):
+        if not capture.grab():
+            raise ValueError('Video ended before frame %d' % frame_number)
+
+def resumable(state: dict, csv_file: str = None, store_file: str = None) -> bool:
+    """Whether the outputs still hold at least what the checkpoint state wrote
+
+    Outputs that were removed or cut short since cannot be continued.
+    """
+    try:
+        if csv_file is not None and os.path.getsize(csv_file) < state['csv']:
+            return False
+        if store_file is not None:
+            sizes = store.ContourStore(store_file).sizes()
+            if any(sizes[name] < size for name, size in state['store'].items()):
+                return False
+    except OSError:
+        return False
+    return True
+
+def run(in_file: str, description: dict, csv_file: str = None, store_file: str = None,
+        checkpoint_file: str = None, checkpoint_interval: int = 1000, cache=None,
+        start: int = 1, stop: int = None) -> dict:
+    """Runs the stack described by description over all frames of in_file
+
+    Writes the features to csv_file and the contours to store_file, if given.
+    Frames are numbered from 1, as in the GUI. Returns statistics of the run:
+    the number of frames, of skipped static frames and of rows written.
+
+    With checkpoint_file, a checkpoint is saved every checkpoint_interval
+    frames. If the run is interrupted, running it again with the same
+    arguments continues from the last checkpoint: outputs are cut back to
+    the checkpoint and appended to, giving the same result as an
+    uninterrupted run. If the outputs were removed or cut short since, the
+    run starts over. The checkpoint is removed when the run completes.
+
+    With a results cache (see results.ResultsCache), contours are taken from
+    the cache where possible. Cached chunks make checkpoints unnecessary, so
+    checkpoint_file is ignored. With a cache, only frames start to stop
+    (stop included) may be run; without stop, up to the end of the video.
+    """
+    if cache is not None:
+        return run_cached(in_file, description, cache, csv_file, store_file, start, stop)
+    if start != 1 or stop is not None:
+        raise ValueError('Running a range of frames needs a results cache')
+    capture = decoders.open_capture(in_file)
+    if not capture.isOpened():
+        raise ValueError('File is not readable by the decoder: `%s`' % in_file)
+    pipeline = spec.build(description, in_file)
+    collector = pipeline.metrics = metrics.collector()
+    gate = None
+    if description.get('gate') is not None:
+        gate = gating.MotionGate(description['gate'])
+    frame_number = 0
+    data = None
+    state = None
+    saved = None
+    if checkpoint_file is not None:
+        saved = checkpoint.Checkpoint(
+            checkpoint_file, checkpoint.run_key(in_file, description, csv_file, store_file)
+        )
+        state = saved.load()
+        if state is not None and not resumable(state, csv_file, store_file):
+            # The outputs changed since: start over.
+            saved.remove()
+            state = None
+    if state is not None:
+        frame_number, data = state['frame'], state['data']
+        pipeline.states, gate = state['states'], state['gate']
+        if csv_file is not None:
+            with open(csv_file, 'r+b') as handle:
+                handle.truncate(state['csv'])
+        seek(capture, frame_number)
+    writer = None
+    if csv_file is not None:
+        writer = outputs.CsvWriter(csv_file, append=state is not None)
+        writer.rows_written = state['rows'] if state is not None else 0
+        writer.start()
+    contour_store = None
+    if store_file is not None:
+        contour_store = store.ContourStore(store_file, 'w' if state is None else 'a')
+        if state is not None:
+            contour_store.truncate(state['store'])
+    try:
+        while True:
+            start = time.perf_counter()
+            exists, frame = capture.read()
+            if not exists:
+                break
+            collector.observe('stage_seconds', time.perf_counter() - start, stage='decode')
+            collector.inc('frames_read')
+            frame_number += 1
+            timestamp = capture.get(cv2.CAP_PROP_POS_MSEC)
+            if gate is None or gate(frame):
+                data = pipeline(frame, kinds=('data',)).get('data')
+            else:
+                collector.inc('skipped_frames')
+            collector.inc('frames')
+            if data is not None:
+                if writer is not None:
+                    writer.write(frame_number, timestamp, extract_features(data))
+                if contour_store is not None:
+                    contour_store.append(frame_number, timestamp, data)
+            if saved is not None and frame_number % checkpoint_interval == 0:
+                saved.save(
+                    frame=frame_number, data=data, states=pipeline.states, gate=gate,
+                    csv=writer.sync() if writer is not None else None,
+                    rows=writer.rows_written if writer is not None else 0,
+                    store=contour_store.sizes() if contour_store is not None else None,
+                )
+    finally:
+        capture.release()
+        if contour_store is not None:
+            contour_store.close()
+        if writer is not None:
+            writer.close()
+    if saved is not None:
+        saved.remove()
+    return {
+        'frames': frame_number,
+        'skipped': gate.skipped if gate is not None else 0,
+        'rows': writer.rows_written if writer is not None else 0,
+    }
+
+def run_cached(in_file: str, description: dict, cache, csv_file: str = None,
+               store_file: str = None, start: int = 1, stop: int = None) -> dict:
+    """Writes the results of description over frames start to stop of in_file
+
+    Results come from cache, which computes only what it is missing.
+    Returns the same statistics as run, apart from skipped frames, and the
+    numbers of cache hits and misses in chunks.
+    """
+    writer = None
+    if csv_file is not None:
+        writer = outputs.CsvWriter(csv_file)
+        writer.start()
+    contour_store = store.ContourStore(store_file, 'w') if store_file is not None else None
+    hits, misses = cache.hits, cache.misses
+    frame_number = 0
+    try:
+        for frame_number, timestamp, data in cache.frames(in_file, description, start, stop):
+            metrics.collector().inc('frames')
+            if writer is not None:
+                writer.write(frame_number, timestamp, extract_features(data))
+            if contour_store is not None:
+                contour_store.append(frame_number, timestamp, data)
+    finally:
+        if contour_store is not None:
+            contour_store.close()
+        if writer is not None:
+            writer.close()
+    return {
+        'frames': frame_number,
+        'rows': writer.rows_written if writer is not None else 0,
+        'hits': cache.hits - hits,
+        'misses': cache.misses - misses,
+    }
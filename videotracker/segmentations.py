@@ -28,14 +28,91 @@ then used by __call__ to calculate the next result.
 
 #import json
 #import csv
+import threading
 
 from PyQt5 import QtWidgets, QtCore
 #import cv2
 
 from .video import Video, VideoThread
-#from . import contours
+from . import bridge
+from . import contours
+from . import driver
 from . import functions
-from .functions import params
+from . import gating
+from . import helpers
+from . import metrics
+from . import outputs
+from . import preview
+from . import roi
+from . import spec
+from . import store
+from .functions import abc, params
+
+class PreviewThread(QtCore.QThread):
+    """Computes previews (see preview.Preview) off the GUI thread
+
+    Building a preview can take long, for instance when a background model is
+    built first. Requests made meanwhile replace each other, so that only the
+    latest is computed next. result is emitted with each preview, unless it
+    was cancelled (see cancel); failed with a message if it failed. The
+    thread waits for requests until it is stopped.
+    """
+    result = QtCore.pyqtSignal(dict)
+    failed = QtCore.pyqtSignal(str)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.setObjectName('PreviewThread')
+        self._condition = threading.Condition()
+        self._pending = None
+        self._stopped = False
+        self.serial = 0 # Number of the latest request
+        self._cancelled = 0 # Requests up to this number are cancelled
+
+    def request(self, description: dict, in_file: str, frame, view: str):
+        """Computes a preview of frame, after the one being computed"""
+        with self._condition:
+            self.serial += 1
+            self._pending = (self.serial, description, in_file, frame, view)
+            self._condition.notify()
+        if not self.isRunning():
+            self.start()
+
+    def cancel(self, serial: int = None):
+        """Cancels the requests up to serial (by default, all so far)
+
+        Cancelled previews are not computed, or their results not emitted.
+        """
+        with self._condition:
+            self._cancelled = max(self._cancelled, self.serial if serial is None else serial)
+            if self._pending is not None and self._pending[0] <= self._cancelled:
+                self._pending = None
+
+    def stop(self):
+        """Cancels all requests and waits for the thread to finish"""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self.cancel()
+        self.wait()
+
+    def run(self):
+        """Computes the latest preview whenever one is pending"""
+        while True:
+            with self._condition:
+                while self._pending is None and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                (serial, description, in_file, frame, view), self._pending = self._pending, None
+            try:
+                result = preview.Preview(description, in_file)(frame, view)
+            except (OSError, ValueError) as error:
+                self.failed.emit(f'Preview failed: {error}')
+                continue
+            with self._condition:
+                if serial > self._cancelled:
+                    self.result.emit(result)
 
 class BaseStack(QtWidgets.QWidget):
     """An abstract stack of function"""
@@ -43,6 +120,12 @@ class BaseStack(QtWidgets.QWidget):
     output_changed = QtCore.pyqtSignal()  # Computational output(s) have changed
     view_changed = QtCore.pyqtSignal() # The chosen view has changed.
     pos_changed = QtCore.pyqtSignal(int)
+    finished = QtCore.pyqtSignal() # A run has gone through all frames
+    overlay_changed = QtCore.pyqtSignal(dict) # The style of the overlay has changed
+    message = QtCore.pyqtSignal(str) # A message for the user
+    preview_changed = QtCore.pyqtSignal(dict) # A quick preview is available (see preview)
+    stack_requested = QtCore.pyqtSignal(dict) # A specification of another stack was loaded
+    rois_changed = QtCore.pyqtSignal(list) # The configuration set the regions of interest
 
     # Methods to be used and description of connections between methods to be
     # made.
@@ -59,6 +142,9 @@ class BaseStack(QtWidgets.QWidget):
         self._enabled = value
         for widget in self.widgets:
             self.widgets[widget].setEnabled(value)
+        self.gate_choice.setEnabled(value)
+        self.gate_threshold.setEnabled(value)
+        self.background_choice.setEnabled(value)
 
     def set_running(self, value: bool):
         """Sets the running property
@@ -74,7 +160,13 @@ class BaseStack(QtWidgets.QWidget):
         return self._running
     @running.setter
     def running(self, value: bool):
+        if value == self._running:
+            return
         self._running = value
+        if value:
+            self.start()
+        else:
+            self.stop()
 
     @property
     def in_file(self) -> str:
@@ -83,11 +175,16 @@ class BaseStack(QtWidgets.QWidget):
     @in_file.setter
     def in_file(self, value: str):
         self.files['in'] = value
+        for method in self.methods.values():
+            method.in_file = value
         if value is not None:
-            self.video = VideoThread(value)
+            self.video = VideoThread(value, frame_cache=self.frame_cache)
+            self.video.cache_ready.connect(
+                lambda: self.message.emit('Frames are read from the frame cache'))
             print(f'VideoCaptureThread: {self.video.currentThread()}')
             self.video.start()
             self.video.frame_loaded.connect(self.fetch_image)
+            self.video.exhausted.connect(self.exhausted)
             self.video.fetch(1)
         # This might cause problems, depending on what the behaviour of the
         # video object was.
@@ -98,8 +195,242 @@ class BaseStack(QtWidgets.QWidget):
         return self.video.pos
 
     def fetch_image(self):
-        """Fetches current frame from video object"""
-        self.input_image.data = self.video.frame
+        """Fetches current frame from video object
+
+        The stack's functions get the part of the frame within the region of
+        interest.
+        """
+        self.frame_image.data = self.video.frame
+        if self.running and self.gate is not None and not self.gate(self.video.frame):
+            # Nothing moved: the previous detections stand for this frame.
+            metrics.collector().inc('skipped_frames')
+            self.record()
+            QtCore.QTimer.singleShot(0, self.advance)
+            return
+        if self.previewing:
+            self._frame_stale = True
+            self.emit_preview()
+            self.refine_timer.start()
+            return
+        self.input_image.data = self.region.crop(self.video.frame)
+
+    @property
+    def previewing(self) -> bool:
+        """Are changes previewed on downscaled frames first?"""
+        return (self.preview_choice.isChecked() and not self.running
+                and self.frame_image.data is not None)
+
+    def value_edited(self, method: abc.BaseFunction):
+        """Recomputes method after its values changed
+
+        When previewing, a preview is shown straight away and the
+        computation waits until values have not changed for a moment.
+        """
+        if not self.previewing:
+            method()
+            return
+        self._stale.add(method)
+        self.emit_preview()
+        self.refine_timer.start()
+
+    def emit_preview(self):
+        """Requests a preview of the current frame
+
+        The preview is computed in the preview thread, which emits
+        preview_changed once it is done.
+        """
+        self.preview_thread.request(self.description, self.in_file, self.frame_image.data,
+                                    self.image_choice.value())
+
+    def refine(self):
+        """Computes at full resolution what was only previewed so far"""
+        # Previews so far are outdated once the full resolution results are in.
+        self._refined = self.preview_thread.serial
+        if self._frame_stale:
+            # A new input runs all functions.
+            self._frame_stale = False
+            self._stale.clear()
+            self.input_image.data = self.region.crop(self.frame_image.data)
+            return
+        for method in self._stale:
+            method()
+        self._stale.clear()
+
+    @property
+    def rois(self) -> list:
+        """Polygons of the region of interest, as lists of [x, y] points
+
+        Setting this restricts processing to the bounding box of the polygons
+        and drops contours outside of them. The current frame is processed
+        again.
+        """
+        return self.region.to_list()
+    @rois.setter
+    def rois(self, value: list):
+        self.region = roi.Region(value)
+        for method in self.methods.values():
+            method.region = self.region
+        if self.frame_image.data is not None:
+            self.fetch_image()
+
+    @property
+    def view_offset(self) -> tuple:
+        """Position of the displayed view in the frame"""
+        return (0, 0) if self.view is self.frame_image else self.region.offset
+
+    def release(self):
+        """Stops the video and waits for running functions
+
+        Call this before deleting the stack, so that no function runs on
+        widgets that no longer exist.
+        """
+        self.running = False
+        self.refine_timer.stop()
+        self.preview_thread.stop()
+        if self.video is not None:
+            helpers.disconnect(self.video.frame_loaded)
+            self.video.quit()
+            self.video.wait()
+        for method in self.methods.values():
+            for method_input in method.inputs.values():
+                helpers.disconnect(method_input.changed)
+            method.thread.wait()
+
+    def start(self):
+        """Starts a run over all frames of the input
+
+        Opens the outputs and loads the first frame. Every following frame is
+        loaded once the stack has finished with the previous one (see
+        `advance`).
+        """
+        # Runs compute every frame at full resolution anyway.
+        self.refine_timer.stop()
+        self.preview_thread.cancel()
+        self._stale.clear()
+        self._frame_stale = False
+        if self.background_choice.isChecked():
+            self.start_driver()
+            return
+        if self.csv_file is not None and self.output_data is not None:
+            self.writer = outputs.CsvWriter(self.csv_file)
+            self.writer.start()
+        if self.store_file is not None and self.output_data is not None:
+            self.store = store.ContourStore(self.store_file, 'w')
+        self.gate = gating.MotionGate(self.gate_threshold.value()) if self.gate_choice.isChecked() else None
+        self.retain_outputs()
+        # Forget the loaded frame, so that the first frame is read again.
+        self.video.current_frame = 0
+        self.video.fetch(1)
+
+    def start_driver(self):
+        """Starts a run with the asynchronous driver (see driver and bridge)
+
+        The functions' widgets are not involved: the driver runs the stack's
+        description in threads of its own and reports the frames it processed.
+        """
+        sinks = []
+        if self.csv_file is not None and self.output_data is not None:
+            sinks.append(driver.CsvSink(self.csv_file))
+        if self.store_file is not None and self.output_data is not None:
+            sinks.append(driver.StoreSink(self.store_file))
+        # A frame cache that is still being built is not waited for.
+        run_driver = driver.Driver(self.in_file, self.description, sinks,
+                                   frame_cache=self.frame_cache if self.video.cached else None)
+        self.driver_thread = bridge.DriverThread(run_driver, self)
+        self.driver_thread.result.connect(self.driver_result)
+        self.driver_thread.done.connect(self.driver_done)
+        self.driver_thread.failed.connect(self.driver_failed)
+        self.driver_thread.start()
+
+    def driver_result(self, result: dict):
+        """Shows a frame processed by the driver"""
+        height, width = result['image'].shape[:2]
+        self.pos_changed.emit(result['frame'])
+        self.preview_changed.emit({'image': result['image'], 'size': (width, height),
+                                   'offset': (0, 0), 'data': result['data']})
+
+    def driver_done(self, stats: dict):
+        """Ends a run of the driver"""
+        compute = stats.get('compute', {})
+        self.message.emit(f"Run completed: {compute.get('items', 0)} frames in "
+                          f"{stats['seconds']:.1f} s ({compute.get('busy', 0):.1f} s computing), "
+                          f"skipped {stats['skipped']} static frames")
+        self.finished.emit()
+
+    def driver_failed(self, error: Exception):
+        """Ends a failed run of the driver, reporting the error
+
+        The error is not raised: exceptions escaping a slot abort the application.
+        """
+        self.message.emit(f'Run failed: {type(error).__name__}: {error}')
+        self.finished.emit()
+
+    def stop(self):
+        """Stops a run, flushing and closing the outputs"""
+        if self.driver_thread is not None:
+            # Whatever the driver still reports is of no interest any more.
+            for signal in (self.driver_thread.result, self.driver_thread.done,
+                           self.driver_thread.failed):
+                helpers.disconnect(signal)
+            self.driver_thread.stop()
+            self.driver_thread = None
+        if self.writer is not None:
+            writer, self.writer = self.writer, None
+            try:
+                writer.close()
+            except Exception as error: # pylint: disable=broad-except
+                # Raised again from the writer thread; exceptions escaping a
+                # slot abort the application.
+                self.message.emit(f'Writing {writer.file_name} failed: '
+                                  f'{type(error).__name__}: {error}')
+            else:
+                print(f'Wrote {writer.rows_written} rows to {writer.file_name}')
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+        if self.gate is not None:
+            self.message.emit(f'Run stopped, skipped {self.gate.skipped} static frames')
+            print(f'Skipped {self.gate.skipped} static frames')
+            self.gate = None
+        if not all(method.retain for method in self.methods.values()):
+            self.retain_outputs()
+            # Functions need their inputs again for tuning.
+            if self.frame_image.data is not None:
+                self.input_image.data = self.region.crop(self.frame_image.data)
+
+    def record(self):
+        """Hands the features and contours of the current frame to the outputs"""
+        if not self.running:
+            return
+        metrics.collector().inc('frames')
+        try:
+            if self.writer is not None:
+                features = contours.extract_features(self.output_data.data)
+                self.writer.write(self.video.current_frame, self.video.time, features)
+            if self.store is not None:
+                self.store.append(self.video.current_frame, self.video.time, self.output_data.data)
+        except Exception as error: # pylint: disable=broad-except
+            self.record_failed(error)
+
+    def record_failed(self, error: Exception):
+        """Ends a run whose outputs could not be written, reporting the error
+
+        The error is not raised: exceptions escaping a slot abort the application.
+        """
+        # Ending the run closes the outputs (see stop).
+        self.finished.emit()
+        self.message.emit(f'Run failed: {type(error).__name__}: {error}')
+
+    def advance(self):
+        """Loads the next frame if a run is in progress"""
+        if self.running:
+            self.pos_changed.emit(self.video.current_frame)
+            self.video.fetch(self.video.current_frame + 1)
+
+    def exhausted(self):
+        """Ends a run when the video has no more frames"""
+        if self.running:
+            self.finished.emit()
 
     def __init__(self, *args, input_file=None, csv_file=None, vid_file=None, **kwargs):
         super().__init__(*args, **kwargs)
@@ -110,19 +441,39 @@ class BaseStack(QtWidgets.QWidget):
         self.csv_file: str = csv_file
         self.vid_file: str = vid_file
         self.input_file: str = input_file
+        self.store_file: str = None
+        self.frame_cache: dict = None # Arguments of framecache.get, to read from a frame cache
+        self.writer = None
+        self.store = None
+        self.gate = None
+        self.driver_thread = None
         self._running = False
         self._enabled = False
         self.widgets = {}
+        self.frame_image = abc.Output()
+        self.input_image = abc.Output()
+        self.output_image = None
+        self.output_data = None
+        self.region = roi.Region()
+        # Full resolution computations wait for values and frames to settle.
+        self.refine_timer = QtCore.QTimer(self, singleShot=True, interval=300)
+        self.refine_timer.timeout.connect(self.refine)
+        self.preview_thread = PreviewThread(self)
+        self.preview_thread.result.connect(self.preview_changed.emit)
+        self.preview_thread.failed.connect(self.message.emit)
+        self._refined = 0
+        self.output_changed.connect(lambda: self.preview_thread.cancel(self._refined))
+        self._stale = set()
+        self._frame_stale = False
         self.create_gui()
         #self.create_methods()
         self.connect_methods()
-        self._inputs = {
-            fun: self.methods[fun].input_image for fun in self.methods
-        }
-        self._outputs = {
+        self._outputs = {'input': self.frame_image}
+        self._outputs.update({
             fun: self.methods[fun].output_image for fun in self.methods
-        }
-        self.view = self._outputs['morphology']
+            if hasattr(self.methods[fun], 'output_image')
+        })
+        self.view = None
         self.display()
 
     @property
@@ -137,23 +488,58 @@ class BaseStack(QtWidgets.QWidget):
         self.methods = self.widgets = {
             function: self.methods[function]() for function in self.methods
         }
-        for widget in self.widgets:
-            self.widgets[widget].valueChanged.connect(self.valueChanged.emit)
-            layout.addWidget(self.widgets[widget])
+        for function, widget in self.widgets.items():
+            # Names the function's stage in the metrics
+            widget.setObjectName(function)
+            widget.valueChanged.connect(self.valueChanged.emit)
+            # The stack decides when functions recompute (see value_edited).
+            helpers.disconnect(widget.valueChanged, widget.__call__)
+            widget.valueChanged.connect(lambda _, widget=widget: self.value_edited(widget))
+            layout.addWidget(widget)
         box = QtWidgets.QGroupBox('Other options')
+        images = [widget for widget in self.widgets
+                  if hasattr(self.widgets[widget], 'output_image')]
         widgets = params.ChoiceParam(
-            choices=self.widgets.keys(),
-            labels=(self.widgets[widget].title for widget in self.widgets),
+            choices=['input'] + images,
+            labels=['Input'] + [self.widgets[widget].title for widget in images],
             label='Display Image'
         ).widget()
         image_choice = QtWidgets.QHBoxLayout()
         image_choice.addWidget(widgets['label'])
         image_choice.addWidget(widgets['widget'])
         value_load = QtWidgets.QHBoxLayout()
-        value_load.addWidget(QtWidgets.QPushButton('Load...'))
-        value_load.addWidget(QtWidgets.QPushButton('Save...'))
+        value_load.addWidget(QtWidgets.QPushButton('Load...', clicked=self.spec_load,
+                                                   toolTip='Load a stack specification'))
+        value_load.addWidget(QtWidgets.QPushButton('Save...', clicked=self.spec_save,
+                                                   toolTip='Save the stack specification'))
+        self.overlay_choice = QtWidgets.QCheckBox('Show contours', checked=True,
+                                                  statusTip='Draw contours over the image')
+        self.overlay_choice.stateChanged.connect(self.emit_overlay)
+        for widget in self.widgets.values():
+            if isinstance(widget, functions.DrawContours):
+                widget.valueChanged.connect(self.emit_overlay)
+        self.gate_choice = QtWidgets.QCheckBox('Skip static frames',
+                                               statusTip='During runs, frames without motion '
+                                               'reuse the previous detections')
+        self.gate_threshold = params.FloatParam(minimum=0, maximum=255, singleStep=0.5,
+                                                value=8.0).widget()['widget']
+        self.gate_threshold.setToolTip('Change of pixel values below which a frame is static')
+        gate = QtWidgets.QHBoxLayout()
+        gate.addWidget(self.gate_choice)
+        gate.addWidget(self.gate_threshold)
+        self.preview_choice = QtWidgets.QCheckBox('Fast preview', checked=True,
+                                                  statusTip='While values or frames change, '
+                                                  'show results on a downscaled frame first')
         boxbox = QtWidgets.QVBoxLayout()
         boxbox.addLayout(image_choice)
+        boxbox.addWidget(self.overlay_choice)
+        boxbox.addWidget(self.preview_choice)
+        self.background_choice = QtWidgets.QCheckBox(
+            'Run in background', statusTip='Runs process frames in background threads, '
+            'showing only some of them'
+        )
+        boxbox.addWidget(self.background_choice)
+        boxbox.addLayout(gate)
         boxbox.addLayout(value_load)
         box.setLayout(boxbox)
         output_control = QtWidgets.QGridLayout()
@@ -166,40 +552,116 @@ class BaseStack(QtWidgets.QWidget):
         self.image_choice.valueChanged.connect(self.display)
 
     def display(self):
-        """Changes displays or something, idk"""
-        self.view = self._outputs[self.image_choice.value()]
+        """Changes displays or something, idk
+
+        Functions that are only viewed (such as DrawContours) compute only
+        while their output is displayed.
+        """
+        self.view = self._outputs.get(self.image_choice.value())
+        self.retain_outputs()
+        for method in self.methods.values():
+            active = not method.view_only or method.output_image is self.view
+            if active and not method.active:
+                method.active = True
+                method()
+            method.active = active
         self.view_changed.emit()
 
+    def retain_outputs(self):
+        """Applies the retention policy to the functions' data
+
+        While tuning, all inputs and outputs are kept for inspection and
+        recomputation. During runs (other than in the background), only the
+        outputs of the stack, the displayed view and the frame are kept;
+        everything else is dropped once the functions downstream are done
+        with it.
+        """
+        keep_all = not self.running or self.driver_thread is not None
+        keep = {self.output_image, self.output_data, self.view, self.frame_image}
+        self.input_image.retain = keep_all
+        for method in self.methods.values():
+            method.retain = keep_all
+            for output in method.outputs.values():
+                output.retain = keep_all or output in keep
+
+    @property
+    def memory(self) -> dict:
+        """Bytes of array data held by each function's outputs
+
+        'frame' is the frame and the stack's input, 'total' all data held by
+        the stack, counting data shared between functions once.
+        """
+        usage = {name: method.nbytes for name, method in self.methods.items()}
+        usage['frame'] = helpers.nbytes(self.frame_image.data, self.input_image.data)
+        usage['total'] = helpers.nbytes(
+            self.frame_image.data, self.input_image.data,
+            *(data for method in self.methods.values() for data in method.held)
+        )
+        return usage
+
+    @property
+    def overlay(self) -> dict:
+        """Style of the contour overlay, see widgets.Overlay.set_style
+
+        Colour and thickness follow the stack's DrawContours function, if it
+        has one.
+        """
+        style = {'visible': self.overlay_choice.isChecked() and self.output_data is not None}
+        for widget in self.widgets.values():
+            if isinstance(widget, functions.DrawContours):
+                style.update(widget.values)
+        return style
+
+    def emit_overlay(self):
+        """Emits an overlay_changed signal"""
+        self.overlay_changed.emit(self.overlay)
+
     def create_methods(self):
         """Constructs methods for this method"""
         for method in self.methods:
             self.methods[method] = self.methods[method]()
 
     def connect_methods(self):
-        """Connects the methods for this function stack"""
+        """Connects the methods for this function stack
+
+        Special names in the graph are INPUT (the input image of the stack),
+        IMAGE (the output image of the stack) and DATA (the output data of the
+        stack). The names input_image and output_image are equivalent to INPUT
+        and IMAGE. A function with a tuple of sources gets its image input
+        connected to the first source and its data input to the second.
+        """
+        aliases = {'input_image': 'INPUT', 'output_image': 'IMAGE', 'output_data': 'DATA'}
         for edge in self.method_graph:
-            # Special names: IMAGE, DATA, INPUT
             end = self.method_graph[edge]
             print("{} → {}".format(end, edge))
-            if edge == 'output_image':
+            edge = aliases.get(edge, edge)
+            if edge == 'IMAGE':
                 # Output image is mapped to this guy's output
                 self.output_image = self.methods[end].output_image
-            elif edge == 'output_data':
+                self.output_image.changed.connect(self.output_changed.emit)
+            elif edge == 'DATA':
                 self.output_data = self.methods[end].output_data
-            elif end == 'input_image':
-                # Input image is mapped to this guy's input
-                self.input_image = self.methods[edge].input_image
+                self.output_data.changed.connect(self.output_changed.emit)
             else:
                 # Other edges are mapped between edges
-                connection_end = self.methods[edge].input_image
-                connection_start = self.methods[end].output_image
-                #print('{} → {}'.format(connection_end, connection_start))
-                connection_end.source = connection_start
-            if edge.startswith('output'):
-                getattr(self.methods[end], edge).changed.connect(self.output_changed.emit)
-
-            # Connection is made
-            #print('{} → {}'.format(connection_start, connection_end))
+                method = self.methods[edge]
+                sources = end if isinstance(end, tuple) else (end,)
+                connection_ends = [getattr(method, name) for name in ('input_image', 'input_data')
+                                   if hasattr(method, name)]
+                for connection_end, source in zip(connection_ends, sources):
+                    source = aliases.get(source, source)
+                    if source == 'INPUT':
+                        connection_end.source = self.input_image
+                    elif connection_end is getattr(method, 'input_data', None):
+                        connection_end.source = self.methods[source].output_data
+                    else:
+                        connection_end.source = self.methods[source].output_image
+        # During a run, the next frame is loaded once the last output is ready.
+        if self.output_data is not None:
+            self.output_data.changed.connect(self.record)
+            self.output_data.changed.connect(self.advance)
+        elif self.output_image is not None:
+            self.output_image.changed.connect(self.advance)
 
     @property
     def values(self) -> dict:
@@ -209,6 +671,100 @@ class BaseStack(QtWidgets.QWidget):
             for function in self.widgets
         }
 
+    @property
+    def config(self) -> dict:
+        """Configuration of the stack
+
+        Values of the functions, regions of interest and the motion gate
+        threshold (None when static frames are not skipped).
+        """
+        return {
+            'values': self.values,
+            'rois': self.rois,
+            'gate': self.gate_threshold.value() if self.gate_choice.isChecked() else None,
+        }
+    @config.setter
+    def config(self, value: dict):
+        for function, values in value.get('values', {}).items():
+            for param, param_value in values.items():
+                self.widgets[function].widgets[param]['widget'].setValue(param_value)
+        self.rois = value.get('rois', [])
+        self.rois_changed.emit(self.rois)
+        self.gate_choice.setChecked(value.get('gate') is not None)
+        if value.get('gate') is not None:
+            self.gate_threshold.setValue(value['gate'])
+
+    @classmethod
+    def describe(cls, config: dict = None) -> dict:
+        """Description of the stack for running it without Qt (see pipeline)
+
+        Functions have their default values, unless config (see config)
+        gives other values.
+        """
+        config = dict(config or {})
+        values = config.pop('values', {})
+        description = {
+            'stack': cls.__name__,
+            'methods': {method: cls.methods[method].__name__ for method in cls.methods},
+            'method_graph': dict(cls.method_graph),
+            'values': {
+                method: {**cls.methods[method].defaults(), **values.get(method, {})}
+                for method in cls.methods
+            },
+            'rois': [],
+            'gate': None,
+        }
+        description.update(config)
+        return description
+
+    @property
+    def description(self) -> dict:
+        """Description of the stack with its current configuration"""
+        return self.describe(self.config)
+
+    def spec_save(self):
+        """Saves the stack's specification (see spec) to a file picked by the user"""
+        file_name, _ = QtWidgets.QFileDialog.getSaveFileName(self, 'Save stack specification',
+                                                             None, '*.json')
+        if not file_name:
+            return
+        description = self.description
+        spec.save(description, file_name)
+        self.message.emit(f'Saved {description["stack"]} ({spec.digest(description)[:8]})')
+
+    def spec_load(self):
+        """Loads a stack specification (see spec) from a file picked by the user
+
+        Specifications of other stacks are passed on with stack_requested.
+        """
+        file_name, _ = QtWidgets.QFileDialog.getOpenFileName(self, 'Load stack specification',
+                                                             None, '*.json')
+        if not file_name:
+            return
+        try:
+            description = spec.load(file_name)
+        except (OSError, ValueError) as error:
+            self.message.emit(f'Could not load `{file_name}`: {error}')
+            return
+        if description['stack'] != type(self).__name__:
+            self.stack_requested.emit(description)
+        else:
+            self.spec_apply(description)
+
+    def spec_apply(self, description: dict) -> bool:
+        """Configures the stack as in description, if it describes this stack
+
+        The functions and method graph must be those of the stack.
+        """
+        own = spec.normalize(self.describe())
+        theirs = spec.normalize(description)
+        if any(own[key] != theirs[key] for key in ('stack', 'methods', 'method_graph')):
+            self.message.emit(f'Specification does not match {type(self).__name__}')
+            return False
+        self.config = description
+        self.message.emit(f'Loaded {description["stack"]} ({spec.digest(description)[:8]})')
+        return True
+
 class ShortStack(BaseStack):
     """A short stack that does not output data, but only images"""
     methods = {
@@ -250,6 +806,56 @@ class ThresholdStack(BaseStack):
         'gaussian_blur': 'INPUT'
     }
 
+class BackgroundStack(BaseStack):
+    """A function stack subtracting a background model
+
+    The background is the median or mode of frames sampled across the video.
+    Suited to videos from static cameras.
+    """
+    methods = {
+        'background_subtract': functions.BackgroundSubtract,
+        'contour_extract': functions.Contours,
+        'size_filter': functions.SizeFilter,
+        'draw_contours': functions.DrawContours,
+    }
+    method_graph = {
+        'IMAGE': 'draw_contours',
+        'DATA': 'size_filter',
+        'draw_contours': ('INPUT', 'size_filter'),
+        'size_filter': 'contour_extract',
+        'contour_extract': 'background_subtract',
+        'background_subtract': 'INPUT',
+    }
+
+class FlowStack(BaseStack):
+    """A function stack tracking detections with optical flow
+
+    Adaptive threshold segmentation only runs on key frames. In between,
+    detected objects are followed with sparse optical flow at their centroids.
+    """
+    methods = {
+        'optical_flow': functions.OpticalFlow,
+        'gaussian_blur': functions.GaussianBlur,
+        'adaptive_threshold': functions.AdaptiveThreshold,
+        'morphology': functions.Morphology,
+        'contour_extract': functions.Contours,
+        'size_filter': functions.SizeFilter,
+        'draw_contours': functions.DrawContours,
+    }
+    # optical_flow passes key frames on to gaussian_blur and gets the
+    # detections back from size_filter.
+    method_graph = {
+        'IMAGE': 'draw_contours',
+        'DATA': 'optical_flow',
+        'draw_contours': ('INPUT', 'optical_flow'),
+        'optical_flow': ('INPUT', 'size_filter'),
+        'size_filter': 'contour_extract',
+        'contour_extract': 'morphology',
+        'morphology': 'adaptive_threshold',
+        'adaptive_threshold': 'gaussian_blur',
+        'gaussian_blur': 'optical_flow',
+    }
+
 class NullStack(BaseStack):
     """A stack that does nothing.
 
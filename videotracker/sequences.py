@@ -0,0 +1,297 @@
+"""Image sequences and multi-page TIFF stacks as videos
+
+Microscopes write directories of numbered images, or multi-page TIFF stacks,
+rather than videos. SequenceCapture reads them like the captures of decoder
+backends (see decoders) read videos, so they can be opened wherever a video
+can. A sequence is given as:
+
+- a directory: its images, in natural order (frame2 before frame10),
+- a glob pattern such as `frames/*.png`: the matching images, in natural order,
+- a TIFF file with more than one page: its pages.
+
+Images keep their bit depth. Pages of uncompressed TIFF files are memory-mapped
+rather than read, so reading them copies nothing. Other images are read by a
+pool of threads, ahead of the frame being read. Sequences have no frame rate;
+times are given at FPS frames per second.
+"""
+
+import concurrent.futures
+import glob
+import os
+import re
+import struct
+import threading
+
+import numpy as np
+
+import cv2
+
+FPS = 25.0
+EXTENSIONS = ('.tif', '.tiff', '.png', '.jpg', '.jpeg', '.bmp', '.pgm', '.ppm', '.jp2', '.webp')
+TIFF_EXTENSIONS = ('.tif', '.tiff')
+AHEAD = 8 # Frames read ahead, per thread
+
+# struct formats of TIFF field types
+TIFF_TYPES = {1: 'B', 2: 'B', 3: 'H', 4: 'I', 5: 'II', 6: 'b', 7: 'B', 8: 'h', 9: 'i',
+              10: 'ii', 11: 'f', 12: 'd', 16: 'Q', 17: 'q', 18: 'Q'}
+TIFF_TAGS = {256: 'width', 257: 'height', 258: 'bits', 259: 'compression',
+             262: 'photometric', 273: 'offsets', 277: 'samples', 279: 'counts',
+             284: 'planar', 322: 'tile_width', 339: 'format'}
+TIFF_FORMATS = {1: 'u', 2: 'i', 3: 'f'}
+
+def natural_key(file_name: str) -> list:
+    """Sorts file names with numbers in numeric order"""
+    return [int(part) if part.isdigit() else part.lower()
+            for part in re.split(r'(\d+)', os.path.basename(file_name))]
+
+def is_pattern(path: str) -> bool:
+    """Whether path is a glob pattern"""
+    return glob.has_magic(path)
+
+def sequence_files(path: str) -> list:
+    """Image files of the directory or glob pattern path, in natural order"""
+    if os.path.isdir(path):
+        files = [os.path.join(path, name) for name in os.listdir(path)]
+    else:
+        files = glob.glob(path)
+    return sorted((name for name in files
+                   if os.path.isfile(name) and name.lower().endswith(EXTENSIONS)),
+                  key=natural_key)
+
+def tiff_pages(file_name: str) -> list:
+    """Layout of every page of a TIFF file, or None if it is not a TIFF file
+
+    Pages whose pixels lie uncompressed in one piece of the file are given as
+    (offset, shape, dtype, rgb), other pages as None.
+    """
+    with open(file_name, 'rb') as handle:
+        header = handle.read(16)
+        if header[:2] not in (b'II', b'MM'):
+            return None
+        order = '<' if header[:2] == b'II' else '>'
+        version = struct.unpack(order + 'H', header[2:4])[0]
+        # Formats of offsets, of the number of entries of a page and of the
+        # number of values of an entry
+        if version == 42:
+            offset_format, entries_format, count_format, inline = 'I', 'H', 'I', 4
+            offset = struct.unpack(order + 'I', header[4:8])[0]
+        elif version == 43: # BigTIFF
+            offset_format, entries_format, count_format, inline = 'Q', 'Q', 'Q', 8
+            offset = struct.unpack(order + 'Q', header[8:16])[0]
+        else:
+            return None
+        pages = []
+        seen = set()
+        while offset and offset not in seen:
+            seen.add(offset)
+            handle.seek(offset)
+            size = struct.calcsize(count_format)
+            entry_size = 4 + size + inline
+            count = struct.unpack(order + entries_format,
+                                  handle.read(struct.calcsize(entries_format)))[0]
+            entries = handle.read(count * entry_size)
+            fields = {}
+            for index in range(count):
+                entry = entries[index * entry_size:(index + 1) * entry_size]
+                tag, kind = struct.unpack(order + 'HH', entry[:4])
+                if tag not in TIFF_TAGS or kind not in TIFF_TYPES:
+                    continue
+                number = struct.unpack(order + count_format, entry[4:4 + size])[0]
+                value_format = order + TIFF_TYPES[kind] * number
+                length = struct.calcsize(value_format)
+                data = entry[4 + size:4 + size + inline]
+                if length > inline:
+                    position = handle.tell()
+                    handle.seek(struct.unpack(order + offset_format, data[:inline])[0])
+                    data = handle.read(length)
+                    handle.seek(position)
+                fields[TIFF_TAGS[tag]] = struct.unpack(value_format, data[:length])
+            pages.append(tiff_layout(fields, order))
+            offset = struct.unpack(order + offset_format,
+                                   handle.read(struct.calcsize(offset_format)))[0]
+    return pages
+
+def tiff_layout(fields: dict, order: str) -> tuple:
+    """(offset, shape, dtype, rgb) of a TIFF page with fields, if it can be mapped"""
+    samples = fields.get('samples', (1,))[0]
+    bits = set(fields.get('bits', (1,)))
+    kind = TIFF_FORMATS.get(fields.get('format', (1,))[0])
+    offsets, counts = fields.get('offsets', ()), fields.get('counts', ())
+    if (fields.get('compression', (1,))[0] != 1 or 'tile_width' in fields
+            or (samples > 1 and fields.get('planar', (1,))[0] != 1)
+            or len(bits) != 1 or min(bits) not in (8, 16, 32, 64) or kind is None
+            or not offsets or len(offsets) != len(counts) or 'width' not in fields
+            or 'height' not in fields):
+        return None
+    if any(start + count != following
+           for start, count, following in zip(offsets, counts, offsets[1:])):
+        return None
+    dtype = np.dtype(f'{order}{kind}{min(bits) // 8}')
+    shape = (fields['height'][0], fields['width'][0]) + ((samples,) if samples > 1 else ())
+    if int(np.prod(shape)) * dtype.itemsize > sum(counts):
+        return None
+    rgb = samples >= 3 and fields.get('photometric', (2,))[0] == 2
+    return offsets[0], shape, dtype, rgb
+
+def tiff_page_count(file_name: str) -> int:
+    """Number of pages of a TIFF file, 0 if it cannot be read"""
+    try:
+        pages = tiff_pages(file_name)
+    except (OSError, struct.error):
+        pages = None
+    if pages is not None:
+        return len(pages)
+    try:
+        return cv2.imcount(file_name)
+    except cv2.error:
+        return 0
+
+def is_sequence(path: str) -> bool:
+    """Whether path is read as an image sequence rather than a video"""
+    if os.path.isdir(path) or (is_pattern(path) and not os.path.exists(path)):
+        return True
+    return (path.lower().endswith(TIFF_EXTENSIONS) and os.path.isfile(path)
+            and tiff_page_count(path) > 1)
+
+def to_bgr(image):
+    """Drops the alpha channel of BGRA images"""
+    if image is not None and image.ndim == 3 and image.shape[2] == 4:
+        return cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
+    return image
+
+def read_image(file_name: str):
+    """An image at its own bit depth, as grayscale or BGR"""
+    return to_bgr(cv2.imread(file_name, cv2.IMREAD_UNCHANGED))
+
+def read_page(file_name: str, index: int):
+    """Page index of a TIFF file, decoded by OpenCV"""
+    try:
+        exists, pages = cv2.imreadmulti(file_name, start=index, count=1,
+                                        flags=cv2.IMREAD_UNCHANGED)
+    except TypeError: # OpenCV without page ranges
+        exists, pages = cv2.imreadmulti(file_name, flags=cv2.IMREAD_UNCHANGED)
+        pages = pages[index:index + 1]
+    return to_bgr(pages[0]) if exists and pages else None
+
+class SequenceCapture:
+    """Reads an image sequence or a TIFF stack, like a cv2.VideoCapture
+
+    At most threads images are read at once (by default one per CPU).
+    """
+
+    def __init__(self, path: str, threads: int = None, fps: float = FPS):
+        self.path = path
+        self.fps = fps
+        self.position = 0 # Number of the next frame
+        self._grabbed = None
+        self._ahead = {}
+        self._lock = threading.Lock()
+        self._map = None
+        self.pages = None
+        if os.path.isfile(path):
+            self.files = None
+            try:
+                self.pages = tiff_pages(path)
+            except (OSError, struct.error):
+                self.pages = None
+            self.count = len(self.pages) if self.pages is not None else tiff_page_count(path)
+            if self.pages is not None and any(self.pages):
+                self._map = np.memmap(path, dtype=np.uint8, mode='r')
+        else:
+            self.files = sequence_files(path)
+            self.count = len(self.files)
+        threads = threads or os.cpu_count() or 1
+        self.ahead = AHEAD * threads
+        self.pool = concurrent.futures.ThreadPoolExecutor(threads,
+                                                          thread_name_prefix='SequenceReader')
+        first = self.frame(0) if self.count else None
+        self.shape = first.shape if first is not None else (0, 0)
+
+    def isOpened(self) -> bool: # pylint: disable=invalid-name
+        """Whether the sequence has images"""
+        return self.count > 0 and self.pool is not None
+
+    def mapped(self, index: int) -> bool:
+        """Whether frame index is a memory-mapped page"""
+        return self._map is not None and self.pages[index] is not None
+
+    def frame(self, index: int):
+        """Reads frame index, or returns None if it cannot be read"""
+        if self.mapped(index):
+            offset, shape, dtype, rgb = self.pages[index]
+            frame = np.ndarray(shape, dtype, buffer=self._map, offset=offset)
+            # Reversing the channels gives BGR as a view, without copying.
+            return frame[..., 2::-1] if rgb else frame
+        if self.files is not None:
+            return read_image(self.files[index])
+        return read_page(self.path, index)
+
+    def fetch(self, index: int):
+        """Frame index, read ahead by the pool along with the frames after it"""
+        if self.mapped(index):
+            return self.frame(index)
+        with self._lock:
+            for ahead in range(index, min(index + self.ahead, self.count)):
+                if ahead not in self._ahead and not self.mapped(ahead):
+                    self._ahead[ahead] = self.pool.submit(self.frame, ahead)
+            for stale in [key for key in self._ahead if not index <= key < index + self.ahead]:
+                self._ahead.pop(stale).cancel()
+            future = self._ahead.pop(index)
+        return future.result()
+
+    def grab(self) -> bool:
+        """Reads the next frame"""
+        self._grabbed = None
+        if not 0 <= self.position < self.count:
+            return False
+        frame = self.fetch(self.position)
+        if frame is None:
+            return False
+        self._grabbed = frame
+        self.position += 1
+        return True
+
+    def retrieve(self) -> tuple:
+        """The grabbed frame, as (exists, frame)"""
+        return self._grabbed is not None, self._grabbed
+
+    def read(self) -> tuple:
+        """Reads and returns the next frame, as (exists, frame)"""
+        if not self.grab():
+            return False, None
+        return self.retrieve()
+
+    def get(self, prop: int) -> float:
+        """The value of a capture property, 0 for unknown properties"""
+        values = {
+            cv2.CAP_PROP_POS_FRAMES: self.position,
+            cv2.CAP_PROP_POS_MSEC: max(self.position - 1, 0) * 1000 / self.fps,
+            cv2.CAP_PROP_POS_AVI_RATIO: self.position / self.count if self.count else 0,
+            cv2.CAP_PROP_FPS: self.fps,
+            cv2.CAP_PROP_FRAME_COUNT: self.count,
+            cv2.CAP_PROP_FRAME_WIDTH: self.shape[1],
+            cv2.CAP_PROP_FRAME_HEIGHT: self.shape[0],
+        }
+        return float(values.get(prop, 0))
+
+    def set(self, prop: int, value: float) -> bool:
+        """Sets the position, by frame, time or ratio"""
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            self.position = max(0, int(value))
+        elif prop == cv2.CAP_PROP_POS_MSEC:
+            self.position = max(0, int(round(value / 1000 * self.fps)))
+        elif prop == cv2.CAP_PROP_POS_AVI_RATIO:
+            self.position = max(0, int(round(value * self.count)))
+        else:
+            return False
+        return True
+
+    def release(self):
+        """Stops reading ahead and closes the files"""
+        if self.pool is not None:
+            for future in self._ahead.values():
+                future.cancel()
+            self._ahead.clear()
+            self.pool.shutdown(wait=False)
+            self.pool = None
+        self._map = None
@@ -0,0 +1,84 @@
+"""Stack specifications
+
+A specification is a stack description (see pipeline) written as versioned
+JSON: the stack class, its method graph and the values of its functions,
+regions of interest and motion gate. Specifications are saved from the GUI and
+rebuild the same pipeline without Qt, in another process or on another
+machine. Like stack descriptions, they need no widgets to be read, so workers
+can load them cheaply.
+
+Specifications are identified by a digest of their canonical form, which is
+the same for equal specifications however they were written.
+"""
+
+import hashlib
+import json
+
+from . import plugins
+from .functions.ops import OPERATIONS
+from .pipeline import Pipeline
+
+FORMAT = 'videotracker-stack'
+VERSION = 1
+KEYS = ('stack', 'methods', 'method_graph', 'values', 'rois', 'gate')
+
+def normalize(description: dict) -> dict:
+    """The parts of description that make up a specification, as JSON types"""
+    missing = [key for key in KEYS if key not in description]
+    if missing:
+        raise ValueError('Stack specification lacks %s' % ', '.join(missing))
+    return json.loads(json.dumps({key: description[key] for key in KEYS}))
+
+def dumps(description: dict, indent: int = None) -> str:
+    """The specification of description as JSON"""
+    spec = {'format': FORMAT, 'version': VERSION, **normalize(description)}
+    separators = (',', ':') if indent is None else (',', ': ')
+    return json.dumps(spec, sort_keys=True, indent=indent, separators=separators)
+
+def loads(text: str) -> dict:
+    """The stack description specified by the JSON text
+
+    Raises a ValueError if text is not a specification, or one of a newer
+    version.
+    """
+    spec = json.loads(text)
+    if not isinstance(spec, dict) or spec.get('format') != FORMAT:
+        raise ValueError('Not a stack specification')
+    if not isinstance(spec.get('version'), int) or spec['version'] > VERSION:
+        raise ValueError('Stack specification version %s is not supported (newest: %d)'
+                         % (spec.get('version'), VERSION))
+    description = normalize(spec)
+    # Functions with several inputs have them as tuples, as in stacks.
+    description['method_graph'] = {
+        edge: tuple(end) if isinstance(end, list) else end
+        for edge, end in description['method_graph'].items()
+    }
+    return description
+
+def save(description: dict, file_name: str):
+    """Saves the specification of description to file_name"""
+    with open(file_name, 'w') as handle:
+        handle.write(dumps(description, indent=2))
+        handle.write('\n')
+
+def load(file_name: str) -> dict:
+    """The stack description specified in file_name"""
+    with open(file_name) as handle:
+        return loads(handle.read())
+
+def digest(description: dict) -> str:
+    """Identifies the specification of description"""
+    return hashlib.sha1(dumps(description).encode()).hexdigest()
+
+def build(description: dict, in_file: str = None):
+    """A pipeline (see pipeline) running description
+
+    Functions that are not built in are looked up in the plugin registry
+    (see plugins). Raises a ValueError for unknown functions.
+    """
+    for function in set(description['methods'].values()) - set(OPERATIONS):
+        if function in plugins.registry().functions():
+            plugins.registry().load('function', function)
+        if function not in OPERATIONS:
+            raise ValueError('Unknown function `%s`' % function)
+    return Pipeline.from_description(description, in_file)
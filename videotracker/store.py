@@ -0,0 +1,237 @@
+"""Array-backed storage for contours
+
+A ContourStore keeps the contours of every frame of a run in three flat files
+inside a directory:
+
+    points.bin   All contour points as int32 (x, y) pairs
+    objects.bin  For every contour, the int64 offset of its end in points
+    frames.bin   For every frame: frame number, timestamp and the offset of its
+                 end in objects
+
+New frames are appended to the end of the files. For reading, the files are
+memory-mapped, so that contours can be replayed, re-filtered or re-exported
+without running the segmentation again and without creating a Python object
+per contour.
+"""
+
+import os
+
+import numpy as np
+
+POINT_DTYPE = np.dtype(np.int32)
+OBJECT_DTYPE = np.dtype(np.int64)
+FRAME_DTYPE = np.dtype([
+    ('frame', np.int64),
+    ('timestamp', np.float64),
+    ('objects', np.int64),
+])
+
+FILES = {
+    'points': POINT_DTYPE,
+    'objects': OBJECT_DTYPE,
+    'frames': FRAME_DTYPE,
+}
+
+def _map(file_name: str, dtype: np.dtype) -> np.ndarray:
+    """Memory-maps file_name as a one dimensional array of dtype"""
+    if not os.path.exists(file_name) or os.path.getsize(file_name) < dtype.itemsize:
+        return np.empty(0, dtype)
+    return np.memmap(file_name, dtype=dtype, mode='r',
+                     shape=(os.path.getsize(file_name) // dtype.itemsize,))
+
+class ContourStore:
+    """Contours of a run, stored in flat memory-mapped arrays
+
+    Modes are 'r' for reading, 'w' for writing a new store (existing contents
+    are removed) and 'a' for appending to an existing store.
+
+    Write contours with `append`, one frame at a time. Read them with
+    indexing (store[i] gives the frame number, timestamp and contours of the
+    i-th stored frame) or by iterating. `areas` and `replay` work on all
+    contours at once.
+    """
+
+    def __init__(self, path: str, mode: str = 'r'):
+        if mode not in ('r', 'w', 'a'):
+            raise ValueError('Invalid mode: `%s`' % mode)
+        self.path = path
+        self.mode = mode
+        self._handles = {}
+        self._arrays = None
+        if mode in ('w', 'a'):
+            os.makedirs(path, exist_ok=True)
+            self._handles = {
+                name: open(self.file_name(name), mode + 'b') for name in FILES
+            }
+        elif not os.path.isdir(path):
+            raise FileNotFoundError(path)
+        sizes = self.sizes()
+        self._points = sizes['points']
+        self._objects = sizes['objects']
+
+    def file_name(self, name: str) -> str:
+        """File name of one of the store's arrays"""
+        return os.path.join(self.path, name + '.bin')
+
+    def append(self, frame: int, timestamp: float, contours: list):
+        """Appends the contours of a frame"""
+        if not self._handles:
+            raise ValueError('ContourStore is not writable')
+        points = [np.asarray(contour).reshape(-1, 2) for contour in contours]
+        if points:
+            lengths = np.fromiter((len(p) for p in points), OBJECT_DTYPE, len(points))
+            ends = self._points + np.cumsum(lengths)
+            np.concatenate(points).astype(POINT_DTYPE, copy=False).tofile(self._handles['points'])
+            ends.tofile(self._handles['objects'])
+            self._points = int(ends[-1])
+            self._objects += len(points)
+        np.array([(frame, timestamp, self._objects)], FRAME_DTYPE).tofile(self._handles['frames'])
+        self._arrays = None
+
+    def flush(self):
+        """Flushes appended data to disk"""
+        for handle in self._handles.values():
+            handle.flush()
+
+    def sizes(self) -> dict:
+        """Number of points, objects and frames in the store's files"""
+        self.flush()
+        return {name: os.path.getsize(self.file_name(name)) // self.itemsize(name)
+                for name in FILES}
+
+    @staticmethod
+    def itemsize(name: str) -> int:
+        """Bytes per entry of one of the store's arrays"""
+        # Points are (x, y) pairs.
+        return FILES[name].itemsize * (2 if name == 'points' else 1)
+
+    def truncate(self, sizes: dict):
+        """Drops everything appended after the store had sizes (see sizes)"""
+        if not self._handles:
+            raise ValueError('ContourStore is not writable')
+        self.flush()
+        for name, handle in self._handles.items():
+            handle.truncate(sizes[name] * self.itemsize(name))
+        self._points = sizes['points']
+        self._objects = sizes['objects']
+        self._arrays = None
+
+    def close(self):
+        """Closes the files of the store"""
+        for handle in self._handles.values():
+            handle.close()
+        self._handles = {}
+        self._arrays = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def arrays(self) -> dict:
+        """Memory-mapped arrays of the store: points, objects and frames"""
+        if self._arrays is None:
+            self.flush()
+            self._arrays = {name: _map(self.file_name(name), FILES[name]) for name in FILES}
+            self._arrays['points'] = self._arrays['points'].reshape(-1, 2)
+        return self._arrays
+
+    @property
+    def frames(self) -> np.ndarray:
+        """Frame numbers, timestamps and object offsets of all stored frames"""
+        return self.arrays['frames']
+
+    def object_starts(self) -> np.ndarray:
+        """Offset of the first point of every contour"""
+        arrays = self.arrays
+        if 'starts' not in arrays:
+            ends = arrays['objects']
+            arrays['starts'] = np.zeros(len(ends), OBJECT_DTYPE)
+            arrays['starts'][1:] = ends[:-1]
+        return arrays['starts']
+
+    def frame_starts(self) -> np.ndarray:
+        """Offset of the first object of every frame"""
+        ends = self.frames['objects']
+        starts = np.zeros_like(ends)
+        starts[1:] = ends[:-1]
+        return starts
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __getitem__(self, index: int) -> tuple:
+        index = range(len(self))[index]
+        record = self.frames[index]
+        start = int(self.frames['objects'][index - 1]) if index else 0
+        return (int(record['frame']), float(record['timestamp']),
+                self.contours(start, int(record['objects'])))
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def contours(self, start: int, stop: int, mask: np.ndarray = None) -> list:
+        """Contours start to stop as (n, 1, 2) views into the points array
+
+        If mask is given, only contours for which mask is True are returned.
+        """
+        points = self.arrays['points']
+        ends = self.arrays['objects']
+        starts = self.object_starts()
+        return [
+            points[starts[i]:ends[i]].reshape(-1, 1, 2)
+            for i in range(start, stop)
+            if mask is None or mask[i]
+        ]
+
+    def areas(self) -> np.ndarray:
+        """Enclosed area of every contour, as computed by cv2.contourArea"""
+        points = self.arrays['points'].astype(np.float64)
+        ends = self.arrays['objects']
+        if not len(ends):
+            return np.empty(0)
+        starts = self.object_starts()
+        # Shoelace formula, with the point following the last point of each
+        # contour being its first point.
+        following = np.arange(1, len(points) + 1)
+        following[ends - 1] = starts
+        cross = (points[:, 0] * points[following, 1]
+                 - points[following, 0] * points[:, 1])
+        return np.abs(np.add.reduceat(cross, starts)) / 2
+
+    def size_filter(self, minimum: float, maximum: float) -> np.ndarray:
+        """Mask of contours whose area lies between minimum and maximum
+
+        The same criterion as functions.SizeFilter.
+        """
+        areas = self.areas()
+        return (minimum <= areas) & (areas <= maximum)
+
+    def replay(self, mask: np.ndarray = None):
+        """Yields frame number, timestamp and contours for every stored frame
+
+        If mask is given, only contours for which mask is True are included.
+        """
+        frames = self.frames
+        starts = self.frame_starts()
+        for index, record in enumerate(frames):
+            yield (int(record['frame']), float(record['timestamp']),
+                   self.contours(int(starts[index]), int(record['objects']), mask))
+
+    def export_csv(self, file_name: str, minimum: float = 0, maximum: float = np.inf):
+        """Writes the features of stored contours within an area range to CSV"""
+        # Imported here, as writing CSV is not the usual business of a store.
+        # pylint: disable=import-outside-toplevel
+        from .contours import extract_features
+        from .outputs import CsvWriter
+        writer = CsvWriter(file_name)
+        writer.start()
+        try:
+            for frame, timestamp, contours in self.replay(self.size_filter(minimum, maximum)):
+                writer.write(frame, timestamp, extract_features(contours))
+        finally:
+            writer.close()
+        return writer.rows_written
@@ -0,0 +1,156 @@
+"""Parameter sweeps
+
+A sweep runs a stack with every combination of a grid of parameter values over
+frames sampled from a video, and reports the number of objects found and the
+time taken per combination. Methods whose values (and whose upstream methods'
+values) are the same in several combinations are computed once per frame for
+all of them (see pipeline.Pipeline), so blurring happens once per blur size
+and not once per combination. Frames are evaluated in parallel.
+"""
+
+import concurrent.futures
+import csv
+import itertools
+import time
+
+import cv2
+
+from . import background, framecache
+from .pipeline import Pipeline
+from .runner import seek
+
+def combinations(grid: dict) -> list:
+    """All combinations of the values in grid
+
+    grid maps methods to parameters to lists of values, for instance
+    {'adaptive_threshold': {'blockSize': [11, 21], 'C': [2, 5]}}. Combinations
+    have the same form, with single values.
+    """
+    keys = [(method, param) for method, params in grid.items() for param in params]
+    result = []
+    for values in itertools.product(*(grid[method][param] for method, param in keys)):
+        combination = {}
+        for (method, param), value in zip(keys, values):
+            combination.setdefault(method, {})[param] = value
+        result.append(combination)
+    return result
+
+def check_grid(description: dict, grid: dict):
+    """Raises a ValueError if grid has methods or parameters description lacks
+
+    Descriptions (see segmentations.BaseStack.describe) hold the values of
+    every parameter of every method.
+    """
+    unknown = [f'{method}.{param}' for method, params in grid.items() for param in params
+               if param not in description['values'].get(method, {})]
+    if unknown:
+        raise ValueError('Unknown methods or parameters: %s (known: %s)' % (
+            ', '.join(unknown),
+            ', '.join(f'{method}.{param}' for method, values in description['values'].items()
+                      for param in values),
+        ))
+
+def sample_frames(file_name: str, samples: int, frame_cache: dict = None) -> list:
+    """samples frames spread evenly across the video file_name
+
+    With frame_cache (see framecache.capture), frames are read from a frame
+    cache.
+    """
+    capture = framecache.capture(file_name, frame_cache)
+    if not capture.isOpened():
+        raise ValueError('File is not readable by the decoder: `%s`' % file_name)
+    frames = []
+    try:
+        count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        for index in background.sample_indices(count, samples):
+            seek(capture, index)
+            exists, frame = capture.read()
+            if exists:
+                frames.append(frame)
+    finally:
+        capture.release()
+    return frames
+
+def evaluate(frame, description: dict, combos: list, in_file: str = None) -> list:
+    """Object count and seconds for every combination on one frame
+
+    The seconds are what the combination would take on its own, including
+    shared methods.
+    """
+    shared = {}
+    result = []
+    for combination in combos:
+        values = {
+            method: {**description['values'].get(method, {}), **combination.get(method, {})}
+            for method in description['methods']
+        }
+        pipeline = Pipeline(description['methods'], description['method_graph'], values,
+                            description.get('rois', ()), in_file, shared)
+        known = set(shared)
+        start = time.perf_counter()
+        data = pipeline(frame, kinds=('data',)).get('data')
+        elapsed = time.perf_counter() - start
+        # Time of shared methods, whether computed now or for an earlier
+        # combination, plus the time of methods that cannot be shared.
+        timings = [shared.get(('time', pipeline.signature(name)), 0) for name in pipeline.results]
+        unshared = elapsed - sum(shared[key] for key in set(shared) - known
+                                 if isinstance(key, tuple))
+        result.append((len(data) if data is not None else None, sum(timings) + unshared))
+    return result
+
+def run_sweep(in_file: str, description: dict, grid: dict, samples: int = 10,
+              workers: int = None, frame_cache: dict = None) -> list:
+    """Runs description with every combination of grid on samples frames
+
+    Returns a row per combination: the swept values (as 'method.param'), the
+    mean, minimum and maximum number of objects per frame and the mean
+    milliseconds per frame. With frame_cache, frames are sampled from a frame
+    cache (see framecache), which makes repeated sweeps of a video cheap.
+    """
+    frames = sample_frames(in_file, samples, frame_cache)
+    combos = combinations(grid)
+    with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+        per_frame = list(pool.map(
+            lambda frame: evaluate(frame, description, combos, in_file), frames
+        ))
+    rows = []
+    for index, combination in enumerate(combos):
+        counts = [results[index][0] for results in per_frame if results[index][0] is not None]
+        seconds = [results[index][1] for results in per_frame]
+        row = {
+            f'{method}.{param}': value
+            for method, params in combination.items() for param, value in params.items()
+        }
+        row.update({
+            'objects': sum(counts) / len(counts) if counts else None,
+            'min': min(counts) if counts else None,
+            'max': max(counts) if counts else None,
+            'ms': 1000 * sum(seconds) / len(seconds) if seconds else None,
+        })
+        rows.append(row)
+    return rows
+
+def format_table(rows: list) -> str:
+    """rows as a text table with aligned columns"""
+    if not rows:
+        return ''
+    columns = list(rows[0])
+    cells = [columns] + [
+        ['-' if row[column] is None else
+         f'{row[column]:.2f}' if isinstance(row[column], float) else str(row[column])
+         for column in columns]
+        for row in rows
+    ]
+    widths = [max(len(line[i]) for line in cells) for i in range(len(columns))]
+    return '\n'.join(
+        '  '.join(cell.rjust(width) for cell, width in zip(line, widths)) for line in cells
+    )
+
+def write_csv(rows: list, file_name: str):
+    """Writes rows to a CSV file"""
+    if not rows:
+        return
+    with open(file_name, 'w', newline='') as handle:
+        writer = csv.DictWriter(handle, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
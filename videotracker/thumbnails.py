@@ -0,0 +1,186 @@
+"""Thumbnail strips of videos
+
+A strip holds small thumbnails of a video, one every step frames, to show an
+overview of the video along the frame slider and to preview frames while the
+slider is dragged, before the frame itself is decoded.
+
+Strips are built in the background, so decoding them must be cheap and must
+not slow down runs: where the backend can (see decoders), keyframes alone are
+decoded, and a strip then holds the keyframes that are at least step frames
+apart. Otherwise frames are read in order, converting only every step-th one.
+Builders decode with one thread, and `idle` lowers the priority of the thread
+building a strip as far as the system allows.
+
+Strips live in the thumbnails directory of the cache (see helpers.cache_path),
+one per video file (see helpers.file_key), size and backend.
+"""
+
+import bisect
+import math
+import os
+import sys
+import threading
+
+import numpy as np
+
+import cv2
+
+from . import decoders, helpers, sequences
+
+COUNT = 200 # Thumbnails of a strip, at most
+HEIGHT = 64 # Height of thumbnails in pixels
+UPDATE = 16 # Thumbnails built between progress reports
+
+def strip_file(in_file: str, step: int = None, height: int = HEIGHT) -> str:
+    """File of the strip of in_file"""
+    key = helpers.file_key(in_file, step, height, COUNT, decoders.current()[0])
+    return helpers.cache_path('thumbnails', key + '.npz')
+
+def idle():
+    """Lowers the priority of the calling thread to the lowest there is
+
+    Only Linux schedules threads, rather than processes, by priority; elsewhere
+    this does nothing. Threads started afterwards by this thread, such as those
+    of decoders, inherit its priority.
+    """
+    if not sys.platform.startswith('linux'):
+        return
+    thread = threading.get_native_id()
+    try:
+        os.sched_setscheduler(thread, os.SCHED_IDLE, os.sched_param(0))
+    except (AttributeError, OSError):
+        try:
+            os.setpriority(os.PRIO_PROCESS, thread, 19)
+        except (AttributeError, OSError):
+            pass
+
+def thumbnail(frame, height: int = HEIGHT):
+    """frame, scaled to height and converted to 8 bit BGR"""
+    from .functions.ops import to_8bit
+    frame = to_8bit(frame)
+    if frame.ndim == 2:
+        frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+    width = max(1, int(round(frame.shape[1] * height / frame.shape[0])))
+    return cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+
+class Strip:
+    """Thumbnails of a video and the numbers of the frames they show
+
+    size is the (width, height) of the frames of the video.
+    """
+
+    def __init__(self, indices: list, images: list, size: tuple):
+        self.indices = list(indices)
+        self.images = list(images)
+        self.size = tuple(size)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def nearest(self, index: int):
+        """The thumbnail of the frame nearest frame index, None if there is none"""
+        if not self.indices:
+            return None
+        found = bisect.bisect_left(self.indices, index)
+        if found == len(self.indices) or (
+                found and index - self.indices[found - 1] < self.indices[found] - index):
+            found -= 1
+        return self.images[found]
+
+    def save(self, file_name: str):
+        """Saves the strip, replacing file_name once it is written"""
+        part = f'{file_name}.{os.getpid()}.{threading.get_ident()}.part'
+        images = np.stack(self.images) if self.images else np.empty((0, HEIGHT, 0, 3), np.uint8)
+        with open(part, 'wb') as handle:
+            np.savez(handle, indices=np.array(self.indices, np.int64), images=images,
+                     size=np.array(self.size, np.int64))
+        os.replace(part, file_name)
+
+    @classmethod
+    def load(cls, file_name: str):
+        """The strip saved in file_name"""
+        with np.load(file_name) as data:
+            return cls(data['indices'].tolist(), list(data['images']), data['size'].tolist())
+
+def find(in_file: str, step: int = None, height: int = HEIGHT) -> Strip:
+    """The strip of in_file, or None if there is none"""
+    try:
+        return Strip.load(strip_file(in_file, step, height))
+    except (OSError, ValueError, KeyError):
+        return None
+
+def frames(capture, step: int):
+    """Frames of capture at least step frames apart, as (frame number, frame)
+
+    Frames that are read without being kept are given as (frame number, None),
+    so that callers can stop in between.
+    """
+    if hasattr(capture, 'keyframes'):
+        following = 0
+        for index, frame in capture.keyframes():
+            if index >= following:
+                following = index + step
+                yield index, frame
+            else:
+                yield index, None
+    elif isinstance(capture, sequences.SequenceCapture):
+        # Images are read one by one, so skipping them costs nothing.
+        for index in range(0, capture.count, step):
+            yield index, capture.frame(index)
+    else:
+        index = 0
+        while capture.grab():
+            yield index, capture.retrieve()[1] if index % step == 0 else None
+            index += 1
+
+def build(in_file: str, step: int = None, height: int = HEIGHT, progress=None,
+          proceed=None) -> Strip:
+    """Builds and saves the strip of in_file, with a thumbnail every step frames
+
+    Without step, the strip has at most COUNT thumbnails; for videos that
+    tell neither their frame count nor their frame rate, the strip is
+    thinned out whenever it grows beyond COUNT. progress, if given,
+    is called with the strip built so far every UPDATE thumbnails. proceed, if
+    given, is called before every frame; the build is abandoned, returning
+    None, if it returns False.
+    """
+    name, _ = decoders.current()
+    capture = decoders.open_capture(in_file, f'{name}:threads=1')
+    if not capture.isOpened():
+        raise ValueError('File is not readable by the decoder: `%s`' % in_file)
+    size = (int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    every = step
+    if every is None:
+        count = capture.get(cv2.CAP_PROP_FRAME_COUNT)
+        # Without a frame count, a thumbnail per second
+        every = math.ceil(count / COUNT) if count > 0 else int(capture.get(cv2.CAP_PROP_FPS))
+    every = max(1, every)
+    strip = Strip([], [], size)
+    found = frames(capture, every)
+    try:
+        for index, frame in found:
+            if proceed is not None and not proceed():
+                return None
+            if frame is None or (strip.indices and index < strip.indices[-1] + every):
+                continue
+            strip.indices.append(index)
+            strip.images.append(thumbnail(frame, height))
+            if step is None and len(strip) > COUNT:
+                # Every other thumbnail goes, and later ones are twice as far apart.
+                strip.indices, strip.images = strip.indices[::2], strip.images[::2]
+                every *= 2
+            if progress is not None and len(strip) % UPDATE == 0:
+                progress(Strip(strip.indices, strip.images, size))
+    finally:
+        found.close()
+        capture.release()
+    strip.save(strip_file(in_file, step, height))
+    return strip
+
+def get(in_file: str, progress=None, proceed=None) -> Strip:
+    """The strip of in_file, built first if there is none"""
+    strip = find(in_file)
+    if strip is None:
+        strip = build(in_file, progress=progress, proceed=proceed)
+    return strip
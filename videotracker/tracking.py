@@ -0,0 +1,67 @@
+"""Tracking of objects between frames
+
+A FlowTracker follows detected objects with sparse pyramidal Lucas-Kanade
+optical flow, computed only at the objects' centroids. Detection (full
+segmentation) is then only needed every few frames, or when an object is
+lost.
+"""
+
+import numpy as np
+
+import cv2
+
+from .contours import contour_centroid
+
+class FlowTracker:
+    """Propagates contours between detections with sparse optical flow
+
+    After `reset` with the contours detected in a frame, `track` moves those
+    contours along with the flow at their centroids. `track` returns None once
+    a new detection is due: after interval frames, or when an object was lost.
+    """
+
+    def __init__(self, interval: int = 10, window: int = 21, levels: int = 3):
+        self.interval = interval
+        self.window = window
+        self.levels = levels
+        self.previous = None
+        self.contours = []
+        self.origins = np.empty((0, 1, 2), np.float32)
+        self.points = self.origins
+        self.age = 0
+
+    @property
+    def due(self) -> bool:
+        """Is a new detection due?"""
+        return self.previous is None or self.age >= self.interval
+
+    def reset(self, gray: np.ndarray, contours: list):
+        """Starts tracking contours detected in the grayscale frame gray"""
+        self.previous = gray
+        self.contours = list(contours)
+        self.origins = np.array([contour_centroid(contour) for contour in self.contours],
+                                np.float32).reshape(-1, 1, 2)
+        self.points = self.origins
+        self.age = 0
+
+    def track(self, gray: np.ndarray) -> list:
+        """Contours moved to the grayscale frame gray
+
+        Returns None if a detection is due instead.
+        """
+        if self.due:
+            return None
+        if len(self.points):
+            points, status, _ = cv2.calcOpticalFlowPyrLK(
+                self.previous, gray, self.points, None,
+                winSize=(self.window, self.window), maxLevel=self.levels,
+            )
+            if points is None or not status.all():
+                # An object was lost, the number of tracks changes.
+                self.previous = None
+                return None
+            self.points = points
+        self.previous = gray
+        self.age += 1
+        shifts = np.rint(self.points - self.origins).astype(np.int32)
+        return [contour + shift for contour, shift in zip(self.contours, shifts)]
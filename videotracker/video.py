@@ -1,14 +1,19 @@
 """OpenCV video file abstractions.
 
-A Video object abstracts the videofile.
+A Video object abstracts the videofile. Both Video and VideoThread can read
+frames from a frame cache instead of decoding them (see framecache).
+ThumbnailThread builds the thumbnail strip of a video (see thumbnails).
 """
 
+import threading
+import time
 from typing import Tuple
 
 from PyQt5 import QtCore, QtWidgets
 
 import cv2
 
+from . import decoders, framecache, metrics, thumbnails
 from .functions import abc
 
 class Video:
@@ -25,26 +30,35 @@ class Video:
         It is possible to use this like any other object.  This is more useful
         for addressing individual frames instead of getting them in order.
         See methods `frame` and `grab` for more.
+
+    The position is kept track of here rather than asked of the capture, and
+    the capture only seeks when a frame other than the next one is read, so
+    that going through the frames in order decodes them without seeking.
+
+    With frame_cache (the arguments of framecache.get), frames are read from a
+    frame cache, which is built first if there is none.
     """
-    def __init__(self, file_name: str = None):
+    def __init__(self, file_name: str = None, frame_cache: dict = None):
         super().__init__()
         self.stopped = False
         self._frame = None
         self._new = True
+        self._position = 0 # Index of the current frame
+        self._next = 0 # Index of the frame the capture reads next
         self.file_name = file_name
         if self.file_name is not None:
-            self.capture = cv2.VideoCapture(self.file_name)
+            self.capture = framecache.capture(self.file_name, frame_cache)
 
     @property
     def position(self) -> int:
         """The position in the video"""
-        return int(self.capture.get(cv2.CAP_PROP_POS_FRAMES))
+        return self._position
     @position.setter
     def position(self, position: int):
         """Sets the new frame index"""
-        if self.position != position:
+        if self._position != position:
             self._new = True
-        self.capture.set(cv2.CAP_PROP_POS_FRAMES, position)
+        self._position = position
 
     @property
     def time(self) -> float:
@@ -54,6 +68,26 @@ class Video:
     def time(self, time: float):
         """Sets the new time index"""
         self.capture.set(cv2.CAP_PROP_POS_MSEC, time)
+        self._next = int(self.capture.get(cv2.CAP_PROP_POS_FRAMES))
+        self.position = self._next
+
+    def read(self, index: int):
+        """Reads frame index, seeking only if it is not the next frame
+
+        Returns (exists, frame), as captures do.
+        """
+        if index != self._next:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, index)
+        start = time.perf_counter()
+        exists, frame = self.capture.read()
+        if exists:
+            metrics.collector().observe('stage_seconds', time.perf_counter() - start,
+                                        stage='decode')
+            metrics.collector().inc('frames_read')
+            self._next = index + 1
+        else:
+            self._next = int(self.capture.get(cv2.CAP_PROP_POS_FRAMES))
+        return exists, frame
 
     @property
     def framerate(self) -> float:
@@ -90,9 +124,7 @@ class Video:
         """Current frame"""
         if self._new or self._frame is None:
             # Avoid unnecessary read operations.
-            # Possible issues: Doesn't read increment the position?
-            exists, frame = self.capture.read()
-            self.position -= 1
+            exists, frame = self.read(self._position)
             if exists:
                 self._frame = frame
                 self._new = False
@@ -109,7 +141,7 @@ class Video:
             > video.position = index
             > video.frame
         """
-        if not index:
+        if index is None:
             index = self.position + 1
         self.position = index
         return self.frame
@@ -131,28 +163,53 @@ class Video:
         return self
 
     def __next__(self):
-        exists, frame = self.capture.read()
-        if not exists:
-            self.stopped = True
         if self.stopped:
-            self.capture.release()
             raise StopIteration
+        try:
+            frame = self.frame
+        except IndexError:
+            self.stopped = True
+            self.capture.release()
+            raise StopIteration from None
+        self.position += 1
         return frame
 
     def __repr__(self):
         return '<Video at {}>'.format(self.file_name)
 
 class VideoThread(QtCore.QThread):
-    """Gets a frame in a thread"""
+    """Gets a frame in a thread
+
+    With frame_cache (the arguments of framecache.get), frames are read from a
+    frame cache. A missing cache is built in the background, while frames are
+    decoded from the video; cache_ready is emitted once frames come from the
+    cache.
+    """
     frame_loaded = QtCore.pyqtSignal(int)
+    exhausted = QtCore.pyqtSignal() # A frame past the end was requested
+    cache_ready = QtCore.pyqtSignal()
+    _cache_built = QtCore.pyqtSignal(object)
 
-    def __init__(self, file_name, *args, **kwargs):
+    def __init__(self, file_name, *args, frame_cache: dict = None, **kwargs):
         super().__init__(*args, **kwargs)
         self.setObjectName('VideoCaptureThread')
         self.file_name = file_name
-        self.capture = None
+        # Opened here rather than in run, so that fetch can be used right after
+        # start.
+        self.capture = decoders.open_capture(self.file_name)
+        self._next = 0 # Index of the frame the capture reads next
+        self.cached = False
+        if frame_cache is not None:
+            self._cache_built.connect(self.use_cache)
+            cache = framecache.find(self.file_name, **frame_cache)
+            if cache is None:
+                threading.Thread(target=self.build_cache, args=(frame_cache,),
+                                 name='FrameCacheThread', daemon=True).start()
+            else:
+                self.use_cache(cache)
         self.frame = None
         self.current_frame = 0
+        self.time = 0.0
         self.output = abc.Output()
         self.finished.connect(lambda: print('VideoThread finished'))
         self.started.connect(lambda: print('VideoThread started'))
@@ -160,16 +217,36 @@ class VideoThread(QtCore.QThread):
     @property
     def pos(self) -> int:
         """The current frame"""
-        return int(self.capture.get(cv2.CAP_PROP_POS_FRAMES))
+        return self._next
     @pos.setter
     def pos(self, value: int):
-        self.capture.set(cv2.CAP_PROP_POS_FRAMES, value)
+        # Seeking is slow, and not needed to read the next frame.
+        if value != self._next:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, value)
+            self._next = value
 
     def run(self):
         """Runs the event loopy loop"""
-        self.capture = cv2.VideoCapture(self.file_name)
         self.exec_()
 
+    def build_cache(self, frame_cache: dict):
+        """Builds the frame cache of the video, run in a thread of its own"""
+        try:
+            cache = framecache.get(self.file_name, **frame_cache)
+        except (OSError, ValueError) as error:
+            print(f'Frame cache not built: {error}')
+            return
+        self._cache_built.emit(cache)
+
+    def use_cache(self, cache: framecache.FrameCache):
+        """Reads frames from cache from now on, keeping the position"""
+        capture = framecache.CacheCapture(cache, self.file_name)
+        capture.set(cv2.CAP_PROP_POS_FRAMES, self._next)
+        self.capture.release()
+        self.capture = capture
+        self.cached = True
+        self.cache_ready.emit()
+
     def set_pos(self, frame: int):
         """Sets position to frame"""
         self.pos = frame
@@ -179,14 +256,72 @@ class VideoThread(QtCore.QThread):
 
         If frame is defined, first sets the position.
         """
-        if frame is not None:
-            self.pos = frame-1
         if self.current_frame != frame and frame is not None:
             # If none, just get the next one. If frame differs from current_frame differs
+            self.pos = frame-1
+            start = time.perf_counter()
             exists, self.frame = self.capture.read()
+            self._next = frame if exists else int(self.capture.get(cv2.CAP_PROP_POS_FRAMES))
             self.current_frame = self.pos
+            self.time = self.capture.get(cv2.CAP_PROP_POS_MSEC)
             if exists:
+                metrics.collector().observe('stage_seconds', time.perf_counter() - start,
+                                            stage='decode')
+                metrics.collector().inc('frames_read')
                 print(f'Loaded frame {self.pos}')
                 self.frame_loaded.emit(self.pos)
+            else:
+                self.exhausted.emit()
         else:
             print(f'Did not load {frame} as it is already loaded')
+
+class ThumbnailThread(QtCore.QThread):
+    """Builds the thumbnail strip of a video at idle priority
+
+    strip_changed is emitted with the strip as it grows, and with the
+    complete strip. A strip that was built before is loaded instead. While
+    paused (during runs), the strip is not built any further.
+    """
+    strip_changed = QtCore.pyqtSignal(object)
+
+    def __init__(self, file_name, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.setObjectName('ThumbnailThread')
+        self.file_name = file_name
+        self._resume = threading.Event()
+        self._resume.set()
+        self._stopped = False
+
+    @property
+    def paused(self) -> bool:
+        """Whether building is paused"""
+        return not self._resume.is_set()
+    @paused.setter
+    def paused(self, value: bool):
+        if value:
+            self._resume.clear()
+        else:
+            self._resume.set()
+
+    def proceed(self) -> bool:
+        """Waits while paused, and tells whether to go on building"""
+        self._resume.wait()
+        return not self._stopped
+
+    def stop(self):
+        """Abandons building and waits for the thread to finish"""
+        self._stopped = True
+        self._resume.set()
+        self.wait()
+
+    def run(self):
+        """Loads or builds the strip"""
+        thumbnails.idle()
+        try:
+            strip = thumbnails.get(self.file_name, progress=self.strip_changed.emit,
+                                   proceed=self.proceed)
+        except (OSError, ValueError) as error:
+            print(f'Thumbnails not built: {error}')
+            return
+        if strip is not None:
+            self.strip_changed.emit(strip)
@@ -8,13 +8,14 @@ from PyQt5.QtWidgets import (QWidget, QMainWindow, QAction, #QMessageBox,
                              QFileDialog, qApp, QCheckBox, QPushButton,
                              QGridLayout, QDockWidget, QVBoxLayout, QBoxLayout,
                              QLabel, QSizePolicy, QScrollArea, QSlider,
-                             QHBoxLayout, QSpinBox, QColorDialog)
+                             QSpinBox, QColorDialog)
 
-from PyQt5 import QtWidgets, QtCore, QtGui
+from PyQt5 import QtWidgets, QtCore, QtGui, sip
 
 import cv2
 
 from . import helpers
+from .functions.ops import to_8bit
 
 class BaseFileObject:
     """A base widget for videotracker objects
@@ -135,19 +136,198 @@ class FancyScrollArea(QScrollArea):
             self.verticalScrollBar().setValue(y-delta_y)
             self.horizontalScrollBar().setValue(x-delta_x)
 
+class Overlay(QWidget):
+    """Vector graphics drawn on top of an image
+
+    The overlay covers its parent and draws contours, their centroids and their
+    ids as vector graphics in frame coordinates. The image below it is never
+    touched, so changing the contours or their style only repaints the overlay.
+    Regions of interest (and the one being drawn) are drawn as dashed polygons.
+    Offset is the position of the displayed image in the frame.
+    """
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.setAttribute(QtCore.Qt.WA_TransparentForMouseEvents)
+        self.image_size = None
+        self.offset = QtCore.QPointF(0, 0)
+        self.polygons = []
+        self.centroids = []
+        self.rois = []
+        self.draft = []
+        self.style = {
+            'visible': True,
+            'color': '#ff0000',
+            'thickness': 1,
+            'centroids': True,
+            'ids': False,
+        }
+
+    @property
+    def contours(self) -> list:
+        """Contours drawn, as polygons"""
+        return self.polygons
+    @contours.setter
+    def contours(self, value: list):
+        self.polygons = []
+        self.centroids = []
+        for contour in value or []:
+            points = contour.reshape(-1, 2)
+            self.polygons.append(QtGui.QPolygonF([QtCore.QPointF(x, y) for x, y in points]))
+            self.centroids.append(QtCore.QPointF(*points.mean(axis=0)))
+        self.update()
+
+    def set_style(self, **style):
+        """Changes how the overlay is drawn
+
+        Accepted keywords are visible, color, thickness, centroids and ids.
+        """
+        self.style.update(style)
+        self.update()
+
+    def paintEvent(self, event):
+        """Draws the overlay scaled to the size of the image below"""
+        # pylint: disable=invalid-name,unused-argument
+        if not self.style['visible'] or self.image_size is None:
+            return
+        painter = QtGui.QPainter(self)
+        painter.setRenderHint(QtGui.QPainter.Antialiasing)
+        painter.scale(self.width() / self.image_size.width(),
+                      self.height() / self.image_size.height())
+        painter.translate(-self.offset)
+        pen = QtGui.QPen(QtCore.Qt.yellow, 1, QtCore.Qt.DashLine)
+        pen.setCosmetic(True)
+        painter.setPen(pen)
+        for polygon in self.rois:
+            painter.drawPolygon(QtGui.QPolygonF([QtCore.QPointF(x, y) for x, y in polygon]))
+        if self.draft:
+            painter.drawPolyline(QtGui.QPolygonF([QtCore.QPointF(x, y) for x, y in self.draft]))
+        color = QtGui.QColor(self.style['color'])
+        painter.setPen(QtGui.QPen(color, self.style['thickness']))
+        for polygon in self.polygons:
+            painter.drawPolygon(polygon)
+        if self.style['centroids']:
+            painter.setPen(QtGui.QPen(color, 1))
+            for centroid in self.centroids:
+                painter.drawLine(centroid - QtCore.QPointF(2, 0), centroid + QtCore.QPointF(2, 0))
+                painter.drawLine(centroid - QtCore.QPointF(0, 2), centroid + QtCore.QPointF(0, 2))
+        if self.style['ids']:
+            for index, centroid in enumerate(self.centroids):
+                painter.drawText(centroid + QtCore.QPointF(3, -3), str(index))
+        painter.end()
+
+FORMATS = {1: QtGui.QImage.Format_Grayscale8, 3: QtGui.QImage.Format_BGR888}
+
+def to_qimage(frame):
+    """A QImage sharing the memory of frame (grayscale or BGR, uint8)
+
+    Frames that are not laid out as the QImage needs (e.g. with a channel
+    stride) are copied first. The QImage must not outlive the returned array.
+    """
+    channels = 1 if frame.ndim == 2 else frame.shape[2]
+    if (frame.dtype != 'uint8' or channels not in FORMATS
+            or frame.strides[1] != channels or frame.strides[-1] != 1):
+        if channels == 4:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
+        frame = to_8bit(frame).copy()
+        channels = 1 if frame.ndim == 2 else frame.shape[2]
+    height, width = frame.shape[:2]
+    # Rows may be further apart than their width, as in crops.
+    return (QtGui.QImage(sip.voidptr(frame.ctypes.data), width, height, frame.strides[0],
+                         FORMATS[channels]), frame)
+
+class FrameLabel(QLabel):
+    """A label that paints a numpy frame, scaled to the label's size
+
+    The frame is painted straight from its own memory, without converting it
+    into a pixmap first.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.frame = None
+        self._image = None
+
+    def set_frame(self, frame):
+        """Displays frame"""
+        # The array is kept, as the image only borrows its memory.
+        self._image, self.frame = to_qimage(frame)
+        self.update()
+
+    def paintEvent(self, event):
+        """Paints the frame"""
+        # pylint: disable=invalid-name
+        if self._image is None:
+            super().paintEvent(event)
+            return
+        painter = QtGui.QPainter(self)
+        painter.drawImage(self.rect(), self._image)
+        painter.end()
+
+class Timeline(QWidget):
+    """Thumbnails of a video along the frame slider
+
+    The width of the timeline stands for the frames of the video, as the
+    slider's does, and every stretch of it shows the thumbnail (see
+    thumbnails.Strip) nearest to the frames it stands for. The current frame
+    is marked. The timeline is hidden until it has a strip.
+    """
+    HEIGHT = 40
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._strip = None
+        self.pos = 0
+        self.pos_max = 0
+        self.setFixedHeight(self.HEIGHT)
+        self.hide()
+
+    @property
+    def strip(self):
+        """The thumbnail strip shown"""
+        return self._strip
+    @strip.setter
+    def strip(self, value):
+        self._strip = value
+        self.setVisible(bool(value))
+        self.update()
+
+    def paintEvent(self, event):
+        """Paints the thumbnails and marks the current frame"""
+        # pylint: disable=invalid-name
+        if not self.strip:
+            return
+        painter = QtGui.QPainter(self)
+        height, width = self.strip.images[0].shape[:2]
+        tile = max(1, round(self.height() * width / height))
+        for left in range(0, self.width(), tile):
+            index = round((left + tile / 2) / self.width() * self.pos_max)
+            # The array is kept until drawn, as the image only borrows its memory.
+            image, _frame = to_qimage(self.strip.nearest(index))
+            painter.drawImage(QtCore.QRect(left, 0, tile, self.height()), image)
+        if self.pos_max:
+            x = round(self.pos / self.pos_max * (self.width() - 1))
+            painter.setPen(QtGui.QPen(self.palette().highlight().color(), 2))
+            painter.drawLine(x, 0, x, self.height())
+        painter.end()
+
 class ImageView(QWidget):
     """The view area.
 
-    The view area consists of a label with a pixmap in a scrollarea
+    The view area consists of a label with a frame in a scrollarea
     GUI consists of a QVBox with:
         - QScrollArea with QLabel
-        - QHBox:
+        - QGrid:
+            Timeline above the slider
             QLabel, QSlider, QSpinBox
 
     By setting image it is possible to display an image in the QScrollArea.
+    Contours are drawn on top of the image by the overlay (see Overlay).
     The scrollarea can be zoomed by setting the local property scale. The
     position of the slider, and maximum possible position of the slider can
-    be set with the pos and pos_max properties.
+    be set with the pos and pos_max properties. Once the thumbnail strip of
+    the video is set, the timeline shows it, and while the slider is dragged
+    the thumbnail nearest to each frame is displayed until the frame arrives.
     """
     # Pylint says there is too many instance attributes.
     # I disagree however. This is in part due to the usage of setters and
@@ -157,6 +337,60 @@ class ImageView(QWidget):
 
     pos_changed = QtCore.pyqtSignal(int)
     # Frame that we have changed to
+    rois_changed = QtCore.pyqtSignal(list)
+    # Regions of interest have been drawn or cleared
+
+    @property
+    def drawing(self) -> bool:
+        """Are regions of interest being drawn?
+
+        While drawing, left clicks on the image add points to a polygon and a
+        right click closes the polygon, adding it to the regions of interest.
+        """
+        return self._drawing
+    @drawing.setter
+    def drawing(self, value: bool):
+        # pylint: disable=attribute-defined-outside-init
+        self._drawing = value
+        self.overlay.draft = []
+        self.overlay.update()
+        if value:
+            self.image_lab.setCursor(QtCore.Qt.CrossCursor)
+        else:
+            self.image_lab.unsetCursor()
+
+    @property
+    def rois(self) -> list:
+        """Polygons of the regions of interest, as lists of [x, y] points"""
+        return self.overlay.rois
+    @rois.setter
+    def rois(self, value: list):
+        self.overlay.rois = [list(polygon) for polygon in value]
+        self.overlay.update()
+
+    def clear_rois(self):
+        """Removes all regions of interest"""
+        self.rois = []
+        self.rois_changed.emit(self.rois)
+
+    def eventFilter(self, obj, event):
+        """Adds points to regions of interest when drawing"""
+        # pylint: disable=invalid-name
+        if (obj is self.image_lab and self.drawing and self.overlay.image_size is not None
+                and event.type() == QtCore.QEvent.MouseButtonPress):
+            if event.button() == QtCore.Qt.LeftButton:
+                size = self.overlay.image_size
+                x = event.pos().x() * size.width() / self.image_lab.width() + self.overlay.offset.x()
+                y = event.pos().y() * size.height() / self.image_lab.height() + self.overlay.offset.y()
+                self.overlay.draft.append([int(x), int(y)])
+            elif event.button() == QtCore.Qt.RightButton:
+                if len(self.overlay.draft) >= 3:
+                    self.overlay.rois.append(self.overlay.draft)
+                    self.rois_changed.emit(self.rois)
+                self.overlay.draft = []
+            self.overlay.update()
+            return True
+        return super().eventFilter(obj, event)
 
     @property
     def scale(self):
@@ -170,8 +404,9 @@ class ImageView(QWidget):
     def scale(self, value):
         # pylint: disable=attribute-defined-outside-init
         self._scale = value
-        if self.image_lab.pixmap():
-            self.image_lab.resize(self.scale * self.image_lab.pixmap().size())
+        if self.overlay.image_size is not None:
+            self.image_lab.resize(self.scale * self.overlay.image_size)
+            self.overlay.resize(self.image_lab.size())
 
     @property
     def image(self):
@@ -188,18 +423,20 @@ class ImageView(QWidget):
         return self.frame
     @image.setter
     def image(self, frame):
+        self.display(frame)
+
+    def display(self, frame, size: QtCore.QSize = None):
+        """Displays frame at size (in image pixels), by default its own size
+
+        Downscaled previews are displayed at the size of the full image.
+        """
+        if frame is None:
+            return
         first = self.frame is None
-        try:
-            dim = frame.ndim
-        except AttributeError:
-            dim = None
-        if dim == 2:
-            frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+        self.image_lab.set_frame(frame)
         self.frame = frame
-        height, width, channels = frame.shape
-        bytes_per_line = channels*width
-        qimg = QtGui.QImage(frame.data, width, height, bytes_per_line, QtGui.QImage.Format_RGB888)
-        self.image_lab.setPixmap(QtGui.QPixmap.fromImage(qimg))
+        height, width = frame.shape[:2]
+        self.overlay.image_size = size or QtCore.QSize(width, height)
         if first:
             self.scale = 1.0
         else:
@@ -222,6 +459,8 @@ class ImageView(QWidget):
         self.slidelabel.setText(self.lab_text_template.format(self.pos, value))
         self.sbox.setMaximum(value)
         self.slider.setMaximum(value)
+        self.timeline.pos_max = value
+        self.timeline.update()
 
     @property
     def pos(self):
@@ -237,12 +476,33 @@ class ImageView(QWidget):
         self.slider.setValue(value)
         self.sbox.setValue(value)
         self.slidelabel.setText(self.lab_text_template.format(value, self.pos_max))
+        self.timeline.pos = value
+        self.timeline.update()
+        if self.slider.isSliderDown():
+            self.preview(value)
         self.pos_changed.emit(value)
 
     def set_pos(self, value: int):
         """Sets the position. Used as a slot for other widgets"""
         self.pos = value
 
+    @property
+    def strip(self):
+        """Thumbnail strip of the video (see thumbnails.Strip), or None"""
+        return self.timeline.strip
+    @strip.setter
+    def strip(self, value):
+        self.timeline.strip = value
+
+    def preview(self, index: int):
+        """Displays the thumbnail nearest to frame index, until a frame is displayed"""
+        image = self.strip.nearest(index) if self.strip else None
+        if image is None:
+            return
+        # Thumbnails show whole frames.
+        self.overlay.offset = QtCore.QPointF(0, 0)
+        self.display(image, QtCore.QSize(*self.strip.size))
+
     @property
     def enabled(self) -> bool:
         """State of the controls"""
@@ -276,6 +536,7 @@ class ImageView(QWidget):
     def __init__(self):
         super().__init__()
         self.lab_text_template = '{:}/{:}'
+        self._drawing = False
         self.create_gui()
         self.pos_max = 0
         self.frame = None
@@ -295,18 +556,20 @@ class ImageView(QWidget):
 
         GUI consists of a QVBox with:
             - QScrollArea with QLabel
-            - QHBox:
+            - QGrid:
+                Timeline above the slider
                 QLabel, QSlider, QSpinBox
 
-        The bottom QHBox is an indicator and control area for the frame to be
+        The bottom QGrid is an indicator and control area for the frame to be
         displayed. It could be any other value though. What it does depends on
         what signals are connected.
-        Internally all Widgets in the HBox are linked.
+        Internally all Widgets in the grid are linked.
         """
-        self.image_lab = QLabel()
+        self.image_lab = FrameLabel()
         self.image_lab.setBackgroundRole(QtGui.QPalette.Dark)
         self.image_lab.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Ignored)
-        self.image_lab.setScaledContents(True)
+        self.overlay = Overlay(self.image_lab)
+        self.image_lab.installEventFilter(self)
         self.scrollarea = FancyScrollArea()
         self.scrollarea.setBackgroundRole(QtGui.QPalette.Dark)
         self.scrollarea.setWidget(self.image_lab)
@@ -318,10 +581,12 @@ class ImageView(QWidget):
         self.sbox = QSpinBox(maximum=0, enabled=False,
                              valueChanged=lambda x: setattr(self, 'pos', x))
         # Missing: new value causing a signal to be sent.
-        slidebox = QHBoxLayout()
-        slidebox.addWidget(self.slidelabel)
-        slidebox.addWidget(self.slider)
-        slidebox.addWidget(self.sbox)
+        self.timeline = Timeline()
+        slidebox = QGridLayout()
+        slidebox.addWidget(self.timeline, 0, 1)
+        slidebox.addWidget(self.slidelabel, 1, 0)
+        slidebox.addWidget(self.slider, 1, 1)
+        slidebox.addWidget(self.sbox, 1, 2)
         self.layout = QVBoxLayout()
         self.layout.addWidget(self.scrollarea)
         self.layout.addLayout(slidebox)
@@ -485,6 +750,7 @@ class SideDock(QDockWidget, BaseFileObject):
     def module(self):
         self.custom_box.removeWidget(self._module)
         if self._module is not None:
+            self._module.release()
             self._module.deleteLater()
         #del self._module
 
@@ -1,22 +1,27 @@
 """Windows of the videotracker"""
 
 import os
-import inspect
 #import importlib
 
 from PyQt5 import QtWidgets, QtCore, QtGui
 
 #import cv2
 
-from . import helpers, segmentations, widgets
+from . import helpers, metrics, plugins, segmentations, sequences, video, widgets
 
 
 class ModuleDialog(QtWidgets.QDialog):
-    """A dialog for choosing a module"""
+    """A dialog for choosing a module
+
+    Modules are the stacks of the plugin registry (see plugins). Only the
+    chosen module is imported. Load... adds the stacks of another python
+    file.
+    """
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.setModal(True)
+        self.registry = plugins.registry()
         self.create_gui()
         self.populate_list()
         self._result = self.exec_() == self.Accepted
@@ -28,8 +33,7 @@ class ModuleDialog(QtWidgets.QDialog):
         okay = QtWidgets.QPushButton('OK', clicked=self.accept)
         cancel = QtWidgets.QPushButton('Cancel', clicked=self.reject)
         more = QtWidgets.QPushButton('Load...', clicked=self.load_file,
-                                     toolTip='Source another python module',
-                                     enabled=False)
+                                     toolTip='Source another python module')
         sub_layout = QtWidgets.QHBoxLayout()
         sub_layout.addWidget(more)
         sub_layout.addStretch(1)
@@ -43,34 +47,42 @@ class ModuleDialog(QtWidgets.QDialog):
         self.options = {}
 
     def load_file(self):
-        """Loads another file"""
-        file_name = QtWidgets.QFileDialog.getOpenFileName(self, 'Load module', None, '*.py')
-        return file_name
+        """Adds the stacks of another python file to the list"""
+        file_name, _ = QtWidgets.QFileDialog.getOpenFileName(self, 'Load module', None, '*.py')
+        if not file_name:
+            return
+        added = [plugin for plugin in self.registry.add_file(file_name) if plugin.kind == 'stack']
+        if not added:
+            error = self.registry.errors.get(os.path.abspath(file_name))
+            QtWidgets.QMessageBox.warning(
+                self, 'Load module',
+                'No modules found in `{}`{}'.format(file_name, f': {error}' if error else '')
+            )
+            return
+        self.populate_list()
+        self.widget.setCurrentRow(list(self.options).index(added[0].name))
 
-    def populate_list(self, module=segmentations):
+    def populate_list(self):
         """Populates the list with options"""
-        for name, obj in inspect.getmembers(module):
-            if (inspect.isclass(obj) # The item is a class
-                    and issubclass(obj, QtWidgets.QWidget) # The class inherits from QWidget
-                    and not name.startswith('Base')): # And isn't Abstract
-                self.options[name] = obj
-                short_name = name
-                full_description = obj.__doc__
-                #short_description = full_description.split('\n')[0]
-                item = QtWidgets.QListWidgetItem(short_name)
-                item.setToolTip(full_description)
-                self.widget.addItem(item)
+        self.widget.clear()
+        self.options = dict(self.registry.stacks())
+        for name, plugin in self.options.items():
+            item = QtWidgets.QListWidgetItem(plugin.name)
+            methods = ', '.join(f'{method} ({function})'
+                                for method, function in plugin.methods.items())
+            item.setToolTip('\n\n'.join(text for text in (plugin.description, methods) if text))
+            self.widget.addItem(item)
 
     @property
     def value(self):
         """Returns value of the module dialog"""
         name = self.widget.currentItem().text()
-        return self.options[name]
+        return self.options[name].load()
 
     @property
     def result(self):
         """Returns a result, True or False, indicating if okay or cancel was chosen"""
-        return self._result
+        return self._result and self.widget.currentItem() is not None
 
 class MainView(QtWidgets.QMainWindow, widgets.BaseFileObject):
     """A main view
@@ -86,8 +98,10 @@ class MainView(QtWidgets.QMainWindow, widgets.BaseFileObject):
     # pylint: disable=too-many-instance-attributes
 
     TITLE = 'pyqt-videotracker'
+    DISPLAY_RATE = 30 # Highest number of display updates per second
     actions = {}
-    def __init__(self, csv_file=None, vid_file=None, in_file=None, config=None, debug=True):
+    def __init__(self, csv_file=None, vid_file=None, in_file=None, config=None, debug=True,
+                 frame_cache=None, store_contours=False):
         super().__init__()
         self.state = {
             'running': False,
@@ -95,10 +109,21 @@ class MainView(QtWidgets.QMainWindow, widgets.BaseFileObject):
             'image_control': False
         }
         self.debug = debug
+        self.frame_cache = frame_cache # Arguments of framecache.get, if frames are cached
         self.create_gui()
         self.create_actions()
         self.setWindowTitle(self.TITLE)
         self.options = None
+        self.store_contours = store_contours
+        self.view = None
+        self._preview = None
+        self.thumbnails = None # Thread building the thumbnail strip of the input
+        # Results are displayed at most DISPLAY_RATE times per second, showing
+        # the latest result and dropping those in between.
+        self.display_timer = QtCore.QTimer(self, singleShot=True,
+                                           interval=1000 // self.DISPLAY_RATE)
+        self.display_timer.timeout.connect(self.display_refresh)
+        self._display_pending = {}
         self.module_load()
         # Todo: load module config
         self.in_file = in_file
@@ -122,9 +147,13 @@ class MainView(QtWidgets.QMainWindow, widgets.BaseFileObject):
         # set internal variable
         self.state['running'] = value
         # Disable framecontrol actions
-        for action in self.actions['&View'][5:9]:
+        for action in self.actions['&View'][5:9] + self.actions['&View'][10:12]:
             action.setEnabled(not value)
+        if value:
+            self.actions['&View'][10].setChecked(False)
+            self.image.drawing = False
         self.actions['&File'][0].setEnabled(not value)
+        self.actions['&File'][1].setEnabled(not value)
         start_action = self.actions['&View'][4]
         if value:
             start_action.setIcon(QtGui.QIcon.fromTheme('media-playback-stop'))
@@ -137,6 +166,9 @@ class MainView(QtWidgets.QMainWindow, widgets.BaseFileObject):
             self.widgets[widget].enabled = not value
         self.image_control = not value
         self.dock.running = value
+        # Thumbnails wait, so as not to slow down runs.
+        if self.thumbnails is not None:
+            self.thumbnails.paused = value
 
     @property
     def loaded(self) -> bool:
@@ -202,6 +234,29 @@ class MainView(QtWidgets.QMainWindow, widgets.BaseFileObject):
         self.dock.csv_file = value
         self.files['csv'] = value
 
+    @property
+    def store_file(self) -> str:
+        """Directory in which the contours of a run are stored (str)"""
+        return self.files.get('contours')
+    @store_file.setter
+    def store_file(self, value: str):
+        self.files['contours'] = value
+        self.store_load()
+
+    @property
+    def store_contours(self) -> bool:
+        """Whether runs store their contours in store_file (see store)"""
+        return self.store_action.isChecked()
+    @store_contours.setter
+    def store_contours(self, value: bool):
+        self.store_action.setChecked(value)
+        self.store_load()
+
+    def store_load(self):
+        """Hands the contour store to the stack, if contours are stored"""
+        if self.has_module:
+            self.options.store_file = self.store_file if self.store_contours else None
+
     def create_gui(self):
         """Creates the GUI"""
         # Bars
@@ -209,12 +264,15 @@ class MainView(QtWidgets.QMainWindow, widgets.BaseFileObject):
         self.menubar = self.menuBar()
         self.statusbar = self.statusBar()
         self.statusbar.showMessage('Ready')
+        self.memory_label = QtWidgets.QLabel(toolTip='Memory held by the stack')
+        self.statusbar.addPermanentWidget(self.memory_label)
         # Dock
         self.dock = widgets.SideDock()
         self.dock.started.connect(lambda x: setattr(self, 'running', x))
         self.addDockWidget(QtCore.Qt.LeftDockWidgetArea, self.dock)
         # Image
         self.image = widgets.ImageView()
+        self.image.rois_changed.connect(lambda rois: setattr(self.options, 'rois', rois))
         self.setCentralWidget(self.image)
         self.resize(800, 500)
         self.widgets = {
@@ -229,9 +287,17 @@ class MainView(QtWidgets.QMainWindow, widgets.BaseFileObject):
                 QtWidgets.QAction(QtGui.QIcon.fromTheme('document-open'), 'Open...',
                                   statusTip='Opens a new file',
                                   triggered=self.input_pick),
+                QtWidgets.QAction(QtGui.QIcon.fromTheme('folder-open'), 'Open sequence...',
+                                  statusTip='Opens a directory of images as a video',
+                                  triggered=self.sequence_pick),
                 QtWidgets.QAction(QtGui.QIcon.fromTheme('window-new'), 'Module...',
                                   statusTip='Loads a tracking module',
                                   triggered=self.module_pick),
+                QtWidgets.QAction('Store contours',
+                                  checkable=True,
+                                  statusTip='Stores the contours of runs next to the input, '
+                                  'to export them again with videotracker-batch --from-store',
+                                  triggered=lambda _: self.store_load()),
                 QtWidgets.QAction(QtGui.QIcon.fromTheme('process-stop'), 'Break...',
                                   statusTip='Inserts a breakpoint', shortcut='Del',
                                   triggered=self.breakpoint,
@@ -287,7 +353,17 @@ class MainView(QtWidgets.QMainWindow, widgets.BaseFileObject):
                                   checkable=True,
                                   checked=True,
                                   statusTip='Visibility of the toolbar',
-                                  triggered=self.toolbar.setVisible)
+                                  triggered=self.toolbar.setVisible),
+                QtWidgets.QAction(QtGui.QIcon.fromTheme('draw-polygon'), 'Draw regions',
+                                  checkable=True,
+                                  statusTip='Draws regions of interest: left click adds '
+                                  'a point, right click closes the region',
+                                  triggered=lambda x: setattr(self.image, 'drawing', x),
+                                  enabled=False),
+                QtWidgets.QAction(QtGui.QIcon.fromTheme('edit-clear'), 'Clear regions',
+                                  statusTip='Removes all regions of interest',
+                                  triggered=self.image.clear_rois,
+                                  enabled=False),
             ],
             '&Help': [
                 QtWidgets.QAction(QtGui.QIcon.fromTheme('help-about'), 'About Qt',
@@ -295,6 +371,7 @@ class MainView(QtWidgets.QMainWindow, widgets.BaseFileObject):
                                   triggered=QtWidgets.qApp.aboutQt),
             ]
         }
+        self.store_action = self.actions['&File'][3]
         for menu in self.actions:
             this_menu = self.menubar.addMenu(menu)
             for action in self.actions[menu]:
@@ -314,6 +391,12 @@ class MainView(QtWidgets.QMainWindow, widgets.BaseFileObject):
         if file_name[0]:
             self.input_load(file_name[0])
 
+    def sequence_pick(self):
+        """Spawn a directory picking dialog, for image sequences"""
+        directory = QtWidgets.QFileDialog.getExistingDirectory(self, 'Open image sequence')
+        if directory:
+            self.input_load(directory)
+
     def input_load(self, video_file=None):
         """Loads a video file"""
         self.image.pos = 0 # ImageViewer gets a new position
@@ -328,11 +411,138 @@ class MainView(QtWidgets.QMainWindow, widgets.BaseFileObject):
         # All of these propagate into the subwidgets.
         if video_file is not None:
             self.in_file = video_file
-        file_tokenised = os.path.splitext(self.in_file)
+        file_tokenised = os.path.splitext(os.path.normpath(self.in_file))
+        if sequences.is_sequence(self.in_file):
+            # Image sequences are written out as videos.
+            file_tokenised = (file_tokenised[0], '.avi')
         self.csv_file = f'{file_tokenised[0]}_output.csv'
         self.vid_file = f'{file_tokenised[0]}_output{file_tokenised[1]}'
+        self.store_file = f'{file_tokenised[0]}_contours'
         self.setWindowTitle(f'{self.TITLE} {self.in_file}')
         self.statusbar.showMessage(f'Loaded file {self.in_file}')
+        self.thumbnails_load()
+
+    def thumbnails_load(self):
+        """Loads the thumbnail strip of the input, building it in the background"""
+        self.thumbnails_stop()
+        self.image.strip = None
+        self.thumbnails = video.ThumbnailThread(self.in_file, self)
+        self.thumbnails.strip_changed.connect(self.thumbnails_changed)
+        self.thumbnails.paused = self.running
+        self.thumbnails.start(QtCore.QThread.IdlePriority)
+
+    def thumbnails_changed(self, strip):
+        """Shows a strip, unless it is that of an earlier input"""
+        if self.sender() is self.thumbnails:
+            self.image.strip = strip
+
+    def thumbnails_stop(self):
+        """Stops building the thumbnail strip"""
+        if self.thumbnails is not None:
+            self.thumbnails.stop()
+            self.thumbnails.deleteLater()
+            self.thumbnails = None
+
+    def closeEvent(self, event):
+        """Stops building thumbnails before closing"""
+        # pylint: disable=invalid-name
+        self.thumbnails_stop()
+        super().closeEvent(event)
+
+    def view_load(self):
+        """Displays the stack's chosen view and follows its changes
+
+        Only changes of the displayed image cause the image to be redrawn.
+        """
+        if self.view is not None:
+            helpers.disconnect(self.view.changed, self.view_changed)
+        self.view = self.options.view
+        if self.view is not None:
+            self.view.changed.connect(self.view_changed)
+        self.view_show()
+
+    def view_changed(self):
+        """Schedules displaying the chosen view"""
+        self.display_schedule(self.view_show)
+
+    def overlay_changed(self):
+        """Schedules displaying the stack's contours"""
+        self.display_schedule(self.overlay_load)
+
+    def display_schedule(self, update):
+        """Runs update with the next display refresh (see display_refresh)
+
+        Updates run in the order they were last scheduled.
+        """
+        if self._display_pending.pop(update, False) is None:
+            # The update it replaces is never shown.
+            metrics.collector().inc('dropped_frames', reason='display')
+        self._display_pending[update] = None
+        if not self.display_timer.isActive():
+            self.display_timer.start()
+
+    def display_refresh(self):
+        """Runs scheduled display updates, unless the window is not visible
+
+        Updates of a hidden or minimised window wait until it is shown again.
+        """
+        if not self.isVisible() or self.isMinimized():
+            return
+        pending, self._display_pending = self._display_pending, {}
+        for update in pending:
+            update()
+        self.memory_show()
+
+    def memory_show(self):
+        """Shows the memory held by the stack, per function in the tooltip"""
+        if not self.has_module:
+            return
+        usage = self.options.memory
+        self.memory_label.setText(f"{usage['total'] / 2**20:.1f} MB")
+        self.memory_label.setToolTip('\n'.join(f'{name}: {value / 2**20:.1f} MB'
+                                               for name, value in usage.items()))
+
+    def changeEvent(self, event):
+        """Catches up on display updates when the window is restored"""
+        # pylint: disable=invalid-name
+        super().changeEvent(event)
+        if event.type() == QtCore.QEvent.WindowStateChange and self._display_pending:
+            self.display_timer.start()
+
+    def showEvent(self, event):
+        """Catches up on display updates when the window is shown"""
+        # pylint: disable=invalid-name
+        super().showEvent(event)
+        if self._display_pending:
+            self.display_timer.start()
+
+    def view_show(self):
+        """Displays the current data of the chosen view"""
+        if self.view is not None:
+            self.image.overlay.offset = QtCore.QPointF(*self.options.view_offset)
+            self.image.image = self.view.data
+
+    def preview_changed(self, result: dict):
+        """Schedules displaying a preview of the stack"""
+        self._preview = result
+        self.display_schedule(self.preview_show)
+
+    def preview_show(self):
+        """Displays the latest preview (see segmentations.BaseStack.preview_changed)
+
+        A preview is an image, the size in frame pixels it stands for, its
+        offset in the frame (by default that of the chosen view) and contours.
+        """
+        result = self._preview
+        offset = result.get('offset', self.options.view_offset)
+        self.image.overlay.offset = QtCore.QPointF(*offset)
+        self.image.display(result['image'], QtCore.QSize(*result['size']))
+        if result['data'] is not None:
+            self.image.overlay.contours = result['data']
+
+    def overlay_load(self):
+        """Hands the stack's contours to the image overlay"""
+        self.image.overlay.contours = self.options.output_data.data
 
     def module_pick(self):
         """Spawns a picker dialog for modules"""
@@ -342,15 +552,48 @@ class MainView(QtWidgets.QMainWindow, widgets.BaseFileObject):
             print('User chose new module {}'.format(module))
             self.module_load(module)
 
+    def module_spec(self, description: dict):
+        """Loads the stack of a specification (see spec) and configures it"""
+        try:
+            method = plugins.registry().load('stack', description['stack'])
+        except (KeyError, ImportError) as error:
+            self.statusbar.showMessage(f'Could not load {description["stack"]}: {error}')
+            return
+        self.module_load(method)
+        self.options.spec_apply(description)
+
     def module_load(self, method=segmentations.ShortStack):
-        """Creates a dock with the given method"""
+        """Creates a dock with the given method
+
+        The new stack gets the input and the outputs of the window, if an
+        input is open.
+        """
         # Delete old options
         # Create new options
         self.options = method() # Method is constructed
+        self.options.frame_cache = self.frame_cache
+        self._display_pending.clear()
         self.dock.module = self.options
-        self.options.view_changed.connect(lambda: setattr(self.image, 'image', self.options.view.data))
-        self.options.output_changed.connect(lambda: setattr(self.image, 'image', self.options.view.data))
+        if self.in_file is not None:
+            self.options.in_file = self.in_file
+            self.options.csv_file = self.csv_file
+            self.options.vid_file = self.vid_file
+            # Frames are now fetched by the new stack's video.
+            self.image_control = self.image_control
+        self.store_load()
+        self.options.rois = self.image.rois
+        self.options.view_changed.connect(self.view_load)
+        self.options.preview_changed.connect(self.preview_changed)
+        self.options.stack_requested.connect(self.module_spec)
+        self.options.rois_changed.connect(lambda rois: setattr(self.image, 'rois', rois))
+        self.options.overlay_changed.connect(lambda style: self.image.overlay.set_style(**style))
+        if self.options.output_data is not None:
+            self.options.output_data.changed.connect(self.overlay_changed)
+        self.view_load()
+        self.image.overlay.contours = None
+        self.image.overlay.set_style(**self.options.overlay)
+        self.options.finished.connect(lambda: setattr(self, 'running', False))
+        self.options.message.connect(self.statusbar.showMessage)
         #self.image.source = self.options.view
-        #self.options.thread.finished.connect(lambda: setattr(self, 'running', False))
         #self.options.thread.loop_complete.connect(lambda: setattr(self, 'running', False))
         #self.options.thread.computing.connect(helpers.change_cursor)